@@ -0,0 +1,148 @@
+"""
+Compare reading the manually installed package list from the dpkg/apt state files against `apt-mark showmanual`.
+
+A synthetic dpkg status file and extended_states file are generated in a temporary directory and both code paths
+are pointed at them (apt-mark through Dir::State::status / Dir::State::extended_states), so the two results can be
+checked for equality before being timed.
+
+Usage:
+    python benchmarks/bench_apt_packages.py [--packages N] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import timeit
+
+from cc_builder.modules.apt import (
+    DPKG_STATUS_PATH,
+    get_apt_packages_from_apt_mark,
+    read_manually_installed_packages,
+)
+
+NATIVE_ARCH = "amd64"
+
+
+def write_synthetic_dpkg_state(directory: str, package_count: int, seed: int = 0):
+    """
+    Write a dpkg status file and an apt extended_states file describing `package_count` packages.
+
+    Roughly 80% of the packages are marked automatically installed, a few are foreign-architecture or
+    Architecture: all packages and a few are only left with their configuration files.
+    Returns the (status_path, extended_states_path) tuple.
+    """
+    rng = random.Random(seed)
+    status_path = os.path.join(directory, "status")
+    extended_states_path = os.path.join(directory, "extended_states")
+    with open(status_path, "w") as status_file, open(extended_states_path, "w") as extended_states_file:
+        for index in range(package_count):
+            name = "dpkg" if index == 0 else f"synthetic-package-{index:05d}"
+            arch = rng.choices([NATIVE_ARCH, "all", "i386"], weights=[85, 12, 3])[0] if index else NATIVE_ARCH
+            state = "config-files" if rng.random() < 0.02 else "installed"
+            status_file.write(
+                f"Package: {name}\n"
+                f"Status: install ok {state}\n"
+                "Priority: optional\n"
+                "Section: misc\n"
+                "Installed-Size: 1024\n"
+                "Maintainer: Synthetic Maintainer <synthetic@example.com>\n"
+                f"Architecture: {arch}\n"
+                f"Multi-Arch: {'foreign' if arch == 'all' else 'same'}\n"
+                f"Version: 1.{index}-0ubuntu1\n"
+                "Depends: libc6 (>= 2.34), libsynthetic (= 1.0)\n"
+                f"Description: synthetic package {index}\n"
+                " A synthetic package generated for benchmarking cc-builder.\n"
+                " .\n"
+                " It has a multi-line description like most real packages.\n"
+                "\n"
+            )
+            if index and rng.random() < 0.8:
+                extended_states_file.write(
+                    f"Package: {name}\n"
+                    f"Architecture: {NATIVE_ARCH if arch == 'all' else arch}\n"
+                    "Auto-Installed: 1\n"
+                    "\n"
+                )
+    return status_path, extended_states_path
+
+
+def apt_mark_showmanual(status_path: str, extended_states_path: str):
+    result = subprocess.run(
+        [
+            "apt-mark",
+            "-o",
+            f"Dir::State::status={status_path}",
+            "-o",
+            f"Dir::State::extended_states={extended_states_path}",
+            "-o",
+            f"APT::Architecture={NATIVE_ARCH}",
+            "-o",
+            "APT::Architectures::=i386",
+            "showmanual",
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    return result.stdout.split()
+
+
+def time_best(function, repeat: int) -> float:
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def compare_on_host(repeat: int):
+    """
+    Time both code paths against this machine's own dpkg/apt state, where apt-mark also has to load the
+    package lists in /var/lib/apt/lists.
+    """
+    if not os.path.exists(DPKG_STATUS_PATH) or shutil.which("apt-mark") is None:
+        print("No dpkg status file or apt-mark on this host, skipping the host comparison")
+        return
+    native = read_manually_installed_packages()
+    native_time = time_best(read_manually_installed_packages, repeat)
+    apt_mark = get_apt_packages_from_apt_mark()
+    apt_mark_time = time_best(get_apt_packages_from_apt_mark, repeat)
+    print(f"Host dpkg state reader: {native_time * 1000:8.1f} ms ({len(native)} manual packages)")
+    print(f"Host apt-mark showmanual: {apt_mark_time * 1000:6.1f} ms ({len(apt_mark)} manual packages)")
+    print(f"Results identical: {native == apt_mark}, speedup: {apt_mark_time / native_time:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packages", type=int, default=10000, help="Number of packages in the synthetic status file")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs per code path")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="cc-builder-bench-")
+    try:
+        status_path, extended_states_path = write_synthetic_dpkg_state(directory, args.packages)
+        print(f"Synthetic status file: {args.packages} packages, {os.path.getsize(status_path) / 1e6:.1f} MB")
+
+        native = read_manually_installed_packages(status_path=status_path, extended_states_path=extended_states_path)
+        native_time = time_best(
+            lambda: read_manually_installed_packages(
+                status_path=status_path, extended_states_path=extended_states_path
+            ),
+            args.repeat,
+        )
+        print(f"dpkg state reader: {native_time * 1000:8.1f} ms ({len(native)} manual packages)")
+
+        if shutil.which("apt-mark") is None:
+            print("apt-mark not found, skipping the subprocess comparison")
+            return
+        apt_mark = apt_mark_showmanual(status_path, extended_states_path)
+        apt_mark_time = time_best(lambda: apt_mark_showmanual(status_path, extended_states_path), args.repeat)
+        print(f"apt-mark showmanual: {apt_mark_time * 1000:6.1f} ms ({len(apt_mark)} manual packages)")
+        print(f"Results identical: {native == apt_mark}, speedup: {apt_mark_time / native_time:.1f}x")
+    finally:
+        shutil.rmtree(directory)
+
+    compare_on_host(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Time parsing one-line apt sources with AptRepository.parse_many against the previous parse_repository_line.
+
+A mirror list with --lines entries pinned to a mix of suites, with and without [options], is parsed by both
+implementations. The previous implementation is kept here verbatim as the reference.
+
+Usage:
+    python benchmarks/bench_apt_sources.py [--lines N] [--repeat N]
+"""
+
+import argparse
+import random
+import re
+import timeit
+from typing import List
+
+from cc_builder.modules.apt import AptRepository
+
+SUITES = ["jammy", "jammy-updates", "jammy-security", "jammy-backports", "noble", "noble-updates", "noble-security"]
+COMPONENTS = ["main", "restricted", "universe", "multiverse"]
+
+
+def legacy_parse_repository_line(line: str, file_path=None) -> AptRepository:
+    repo_info = {}
+    repo_info["original_repo_line"] = line.replace("  ", " ")
+    repo_info["archive_type"] = line.split()[0]
+    if re.findall(r"\[.*?\]", line):
+        repo_info["options"] = {}
+        options_str = re.findall(r"\[(.*?)\]", line)[0]
+        for option in options_str.strip().split():
+            key, value = option.split("=")
+            repo_info["options"][key] = value.split(",")
+        line = line.replace(f"[{options_str}] ", "")
+    else:
+        repo_info["options"] = None
+    line = line.replace("  ", " ")
+    repo_info["repo_line_without_options"] = line
+    repo_info["name"] = file_path.split("/")[-1] if file_path else "UNKNOWN"
+    repo_info["uri"] = line.split()[1]
+    repo_info["suite"] = " ".join(line.split()[2 : min(4, len(line.split()))])
+    if len(line.split()) > 4:
+        repo_info["components"] = line.split()[4:]
+    else:
+        repo_info["components"] = None
+    return AptRepository(**repo_info)
+
+
+def legacy_parse_many(lines: List[str], file_path: str) -> List[AptRepository]:
+    return [legacy_parse_repository_line(line.strip(), file_path=file_path) for line in lines if line.startswith("deb")]
+
+
+def synthetic_mirror_list(line_count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    lines = ["# synthetic mirror list\n"]
+    for index in range(line_count):
+        archive_type = "deb-src" if index % 5 == 0 else "deb"
+        options = f"[arch=amd64 signed-by=/etc/apt/keyrings/mirror-{index % 7}.gpg] " if index % 3 == 0 else ""
+        components = " ".join(rng.sample(COMPONENTS, rng.randint(1, len(COMPONENTS))))
+        lines.append(
+            f"{archive_type} {options}http://mirror-{index % 40}.example.com/ubuntu/ {rng.choice(SUITES)} {components}\n"
+        )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=5000, help="Number of entries in the synthetic mirror list")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs per implementation")
+    args = parser.parse_args()
+
+    lines = synthetic_mirror_list(args.lines)
+    file_path = "/etc/apt/sources.list.d/mirrors.list"
+    parsed = AptRepository.parse_many(lines, file_path=file_path)
+    legacy = legacy_parse_many(lines, file_path)
+    same_output = [repo.repo_line_without_options for repo in parsed] == [
+        repo.repo_line_without_options for repo in legacy
+    ]
+    print(f"{len(parsed)} entries parsed, same generated source lines as the previous parser: {same_output}")
+
+    for label, function in (
+        ("AptRepository.parse_many", lambda: AptRepository.parse_many(lines, file_path=file_path)),
+        ("previous parse_repository_line", lambda: legacy_parse_many(lines, file_path)),
+    ):
+        seconds = min(timeit.repeat(function, number=1, repeat=args.repeat))
+        print(f"{label:<32} {seconds * 1000:8.2f} ms, {seconds / len(parsed) * 1e6:6.2f} us per line")
+
+
+if __name__ == "__main__":
+    main()
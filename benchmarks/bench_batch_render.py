@@ -0,0 +1,145 @@
+"""
+Measure the throughput of `cc-builder batch-render` for different numbers of worker processes.
+
+A synthetic inventory is written the way --inventory-out writes it, with --packages apt packages, --snaps snaps and
+--sources apt repositories, and copied --files times into a temporary directory. Every worker count given with
+--workers then renders the whole directory with batch_render() (the code path of `cc-builder batch-render`) into a
+fresh output directory. The cloud-configs rendered by each worker count are checked to be identical to those of the
+first one.
+
+Usage:
+    python benchmarks/bench_batch_render.py [--files N] [--workers N,N,...] [--packages N] [--snaps N] [--sources N]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import List
+
+from cc_builder.batch import batch_render, find_captures
+from cc_builder.console_output import set_quiet_mode
+from cc_builder.inventory import InventoryWriter
+from cc_builder.modules.apt import AptConfig, AptRepository, PackageInventory
+from cc_builder.modules.snap import Snap, SnapConfig
+from cc_builder.modules.ssh import SSHConfig, SSHUserKeys
+from cc_builder.modules.user import UserAccount, UserConfig
+
+BENCH_USER = "bench"
+
+
+def write_synthetic_inventory(path: str, package_count: int, snap_count: int, source_count: int):
+    sources = AptRepository.parse_many(
+        [
+            f"deb [signed-by=/usr/share/keyrings/synthetic-{index}.gpg] "
+            f"https://ppa.launchpadcontent.net/synthetic/ppa-{index}/ubuntu jammy main"
+            for index in range(source_count)
+        ]
+    )
+    configs = [
+        (
+            "user",
+            UserConfig(
+                name=BENCH_USER,
+                accounts=[UserAccount(name=BENCH_USER, groups=["adm", "sudo", "lxd"])],
+            ),
+        ),
+        (
+            "ssh",
+            SSHConfig(
+                current_user=BENCH_USER,
+                user_keys=[
+                    SSHUserKeys(
+                        name=BENCH_USER,
+                        authorized_keys_lines=[f"ssh-ed25519 AAAAC3Nz{index:06d} key-{index}" for index in range(8)],
+                    )
+                ],
+                host_key_types=["ed25519", "rsa"],
+            ),
+        ),
+        (
+            "apt",
+            AptConfig(
+                packages=PackageInventory.from_names([f"synthetic-package-{index}" for index in range(package_count)]),
+                sources=sources,
+            ),
+        ),
+        (
+            "snap",
+            SnapConfig(
+                snaps=[
+                    Snap(
+                        name=f"synthetic-snap-{index}",
+                        version=f"1.{index}",
+                        rev=str(index),
+                        tracking="latest/stable",
+                        publisher="canonical",
+                        notes="-" if index % 10 else "classic",
+                        confinement="classic" if index % 10 == 0 else "strict",
+                    )
+                    for index in range(snap_count)
+                ]
+            ),
+        ),
+    ]
+    with InventoryWriter(path, host="bench-host", user=BENCH_USER) as inventory:
+        for name, config in configs:
+            inventory.write_module(name, config)
+
+
+def read_outputs(directory: str) -> List[str]:
+    outputs = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as output_file:
+            # the footer carries the time the file was written
+            outputs.append("".join(line for line in output_file if not line.startswith("# File created at")))
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2000, help="Number of inventories to render")
+    parser.add_argument(
+        "--workers",
+        default=f"1,{os.cpu_count() or 1}",
+        help="Comma-separated worker counts to render the inventories with",
+    )
+    parser.add_argument("--packages", type=int, default=500, help="Number of apt packages in each inventory")
+    parser.add_argument("--snaps", type=int, default=20, help="Number of snaps in each inventory")
+    parser.add_argument("--sources", type=int, default=10, help="Number of apt repositories in each inventory")
+    args = parser.parse_args()
+    set_quiet_mode(True)
+
+    directory = tempfile.mkdtemp(prefix="cc-builder-bench-")
+    try:
+        capture_dir = os.path.join(directory, "captures")
+        os.makedirs(capture_dir)
+        template = os.path.join(directory, "template.inventory.jsonl")
+        write_synthetic_inventory(template, args.packages, args.snaps, args.sources)
+        for index in range(args.files):
+            shutil.copyfile(template, os.path.join(capture_dir, f"host-{index:05d}.inventory.jsonl"))
+        sources = find_captures(capture_dir)
+
+        expected = None
+        print(f"{'workers':>8} {'time':>9} {'files/s':>10}")
+        for workers in [int(count) for count in args.workers.split(",")]:
+            output_dir = os.path.join(directory, f"out-{workers}")
+            start = time.perf_counter()
+            results = batch_render(sources, output_dir, workers=workers, quiet=True)
+            elapsed = time.perf_counter() - start
+            failures = [result for result in results if not result.succeeded]
+            if failures:
+                raise SystemExit(f"{len(failures)} renders failed, e.g. {failures[0].source}: {failures[0].error}")
+            outputs = read_outputs(output_dir)
+            if expected is None:
+                expected = outputs
+            elif outputs != expected:
+                raise SystemExit(f"Rendering with {workers} workers produced different cloud-configs")
+            print(f"{workers:>8} {elapsed:8.2f}s {len(sources) / elapsed:10.1f}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Time every module's gather() and generate_cloud_config() and the YAML emission against a large synthetic host.
+
+The synthetic host is a root filesystem generated in a temporary directory and captured with RootfsHostAccessor
+(the same code path as `cc-builder --root`), so no commands are run and every run reads exactly the same input:
+
+    - a dpkg status file with N packages (see bench_apt_packages.py)
+    - N files in /etc/apt/sources.list.d, alternating one-line .list and deb822 .sources files
+    - an authorized_keys file with N keys
+    - a snapd state file with N snaps
+
+Each phase is timed (best of --repeat runs) and then run once more under tracemalloc to record its peak Python
+memory allocation. --json writes the results to a file so they can be kept as a baseline and compared later.
+
+Usage:
+    python benchmarks/bench_gather_emit.py [--packages N] [--sources N] [--keys N] [--snaps N] [--repeat N]
+                                           [--json PATH]
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from bench_apt_packages import write_synthetic_dpkg_state
+
+from cc_builder.console_output import set_quiet_mode
+from cc_builder.emitter import write_cloud_config
+from cc_builder.generator import create_cloud_init_config, gather_cloud_config, get_module_info
+from cc_builder.host_accessor import RootfsHostAccessor
+from cc_builder.modules import load_module_class
+
+BENCH_USER = "bench"
+BENCH_HOME = f"/home/{BENCH_USER}"
+
+
+def write_file(root: str, path: str, content: str):
+    host_path = os.path.join(root, path.lstrip("/"))
+    os.makedirs(os.path.dirname(host_path), exist_ok=True)
+    with open(host_path, "w") as f:
+        f.write(content)
+
+
+def write_synthetic_sources(root: str, source_count: int):
+    write_file(
+        root,
+        "/etc/apt/sources.list",
+        "deb http://archive.ubuntu.com/ubuntu jammy main restricted universe multiverse\n"
+        "deb http://archive.ubuntu.com/ubuntu jammy-updates main restricted universe multiverse\n"
+        "deb http://security.ubuntu.com/ubuntu jammy-security main restricted universe multiverse\n",
+    )
+    for index in range(source_count):
+        uri = f"https://ppa.launchpadcontent.net/synthetic/ppa-{index:03d}/ubuntu/"
+        if index % 2:
+            write_file(
+                root,
+                f"/etc/apt/sources.list.d/synthetic-{index:03d}.sources",
+                f"Types: deb\nURIs: {uri}\nSuites: jammy\nComponents: main\n"
+                f"Signed-By: /etc/apt/keyrings/synthetic-{index:03d}.gpg\n",
+            )
+        else:
+            write_file(
+                root,
+                f"/etc/apt/sources.list.d/synthetic-{index:03d}.list",
+                f"# synthetic repository {index}\n"
+                f"deb [arch=amd64 signed-by=/etc/apt/keyrings/synthetic-{index:03d}.gpg] {uri} jammy main\n",
+            )
+
+
+def write_synthetic_ssh(root: str, key_count: int, rng: random.Random):
+    lines = ["# synthetic authorized_keys"]
+    for index in range(key_count):
+        if index % 50 == 0:
+            lines.append(f"ssh-rsa {rng.getrandbits(2048):x} # ssh-import-id gh:synthetic-{index}")
+        else:
+            lines.append(f"ssh-ed25519 AAAAC3NzaC1lZDI1NTE5{rng.getrandbits(256):x} user{index}@synthetic")
+    write_file(root, f"{BENCH_HOME}/.ssh/authorized_keys", "\n".join(lines) + "\n")
+    write_file(root, f"{BENCH_HOME}/.ssh/id_rsa.pub", f"ssh-rsa {rng.getrandbits(2048):x} {BENCH_USER}@synthetic\n")
+    write_file(root, "/etc/ssh/sshd_config", "Include /etc/ssh/sshd_config.d/*.conf\nPermitRootLogin no\n")
+    write_file(root, "/etc/ssh/sshd_config.d/50-cloud-init.conf", "PasswordAuthentication no\n")
+
+
+def write_synthetic_snaps(root: str, snap_count: int, rng: random.Random):
+    snaps = {}
+    for index in range(snap_count):
+        name = f"synthetic-snap-{index:03d}"
+        snaps[name] = {
+            "type": "app",
+            "active": True,
+            "current": str(rng.randint(1, 5000)),
+            "channel": rng.choice(["latest/stable", "latest/edge", "2.0/stable"]),
+            "classic": index % 10 == 0,
+        }
+    write_file(root, "/var/lib/snapd/state.json", json.dumps({"data": {"snaps": snaps}}))
+
+
+def write_synthetic_host(root: str, args: argparse.Namespace):
+    rng = random.Random(0)
+    dpkg_dir = os.path.join(root, "var/lib/dpkg")
+    os.makedirs(dpkg_dir)
+    status_path, extended_states_path = write_synthetic_dpkg_state(dpkg_dir, args.packages)
+    os.makedirs(os.path.join(root, "var/lib/apt"))
+    os.rename(extended_states_path, os.path.join(root, "var/lib/apt/extended_states"))
+    write_synthetic_sources(root, args.sources)
+    write_synthetic_ssh(root, args.keys, rng)
+    write_synthetic_snaps(root, args.snaps, rng)
+    write_file(
+        root, "/etc/passwd", f"root:x:0:0:root:/root:/bin/bash\n{BENCH_USER}:x:1000:1000::{BENCH_HOME}:/bin/bash\n"
+    )
+    write_file(root, "/etc/group", f"root:x:0:\nsudo:x:27:{BENCH_USER}\n")
+    write_file(root, "/etc/hostname", "synthetic\n")
+
+
+def measure(function: Callable[[], object], repeat: int) -> Tuple[float, int]:
+    """
+    Return the best wall time in seconds of `repeat` runs and the peak memory allocated by one more run.
+    """
+    seconds = min(timeit.repeat(function, number=1, repeat=repeat))
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def run_benchmarks(root: str, output_dir: str, repeat: int) -> List[Dict]:
+    accessor = RootfsHostAccessor(root)
+    current_user = accessor.get_user()
+    results = []
+
+    def record(phase: str, function: Callable[[], object]):
+        seconds, peak = measure(function, repeat)
+        results.append({"phase": phase, "seconds": seconds, "peak_bytes": peak})
+        print(f"{phase:<32} {seconds * 1000:10.1f} ms {peak / 1e6:10.2f} MB peak")
+
+    for module in get_module_info(disabled_configs=[]):
+        name, config_class = module["name"], load_module_class(module["name"])
+        if name == "ssh":
+            kwargs = {"current_user": current_user, "gather_public_keys": True}
+        elif name == "user":
+            kwargs = {"name": current_user}
+        else:
+            kwargs = {}
+        record(f"{name}.gather", lambda: config_class(**kwargs).gather(accessor))
+        config = config_class(**kwargs)
+        config.gather(accessor)
+        record(f"{name}.generate_cloud_config", config.generate_cloud_config)
+
+    cloud_config = gather_cloud_config(current_user, accessor=accessor, gather_public_keys=True)
+    output_path = os.path.join(output_dir, "cloud-config.yaml")
+    record("emit", lambda: write_cloud_config(cloud_config, output_path))
+    print(f"{'':<32} ({os.path.getsize(output_path) / 1e6:.2f} MB of YAML)")
+    record(
+        "create_cloud_init_config",
+        lambda: create_cloud_init_config(output_path, gather_public_keys=True, disabled_configs=[], accessor=accessor),
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packages", type=int, default=10000, help="Number of packages in the dpkg status file")
+    parser.add_argument("--sources", type=int, default=500, help="Number of files in sources.list.d")
+    parser.add_argument("--keys", type=int, default=2000, help="Number of authorized_keys lines")
+    parser.add_argument("--snaps", type=int, default=300, help="Number of installed snaps")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs per phase")
+    parser.add_argument("--json", dest="json_path", help="Write the results to this file as JSON")
+    args = parser.parse_args()
+
+    set_quiet_mode(True)
+    directory = tempfile.mkdtemp(prefix="cc-builder-bench-")
+    try:
+        root = os.path.join(directory, "rootfs")
+        write_synthetic_host(root, args)
+        print(
+            f"Synthetic host: {args.packages} packages, {args.sources} sources.list.d files, "
+            f"{args.keys} authorized keys, {args.snaps} snaps\n"
+        )
+        results = run_benchmarks(root, directory, args.repeat)
+    finally:
+        shutil.rmtree(directory)
+
+    # ru_maxrss is in kilobytes on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(f"\nMaximum resident set size of the benchmark process: {max_rss / 1e6:.1f} MB")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"parameters": vars(args), "results": results, "max_rss_bytes": max_rss}, f, indent=2)
+        print(f"Wrote results to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Measure the memory held by gathered package, snap and apt repository inventories, comparing the slotted and interned
+types cc-builder uses against equivalent dict-backed dataclasses holding a string object per value, as they were
+before.
+
+Every scenario builds the inventories twice from the same synthetic input and records with tracemalloc how much
+memory stays allocated once they are built:
+
+    - the manually installed packages of --hosts hosts, each read from its own copy of a dpkg status file with
+      --packages packages (see bench_apt_packages.py, about a fifth of them are manually installed), as a fleet
+      capture holds them
+    - --snaps snaps parsed from a snapd API response
+    - --sources apt repositories parsed from one-line sources.list entries
+
+Usage:
+    python benchmarks/bench_inventory_memory.py [--packages N] [--hosts N] [--snaps N] [--sources N]
+"""
+
+import argparse
+import dataclasses
+import gc
+import json
+import shutil
+import tempfile
+import tracemalloc
+from typing import Callable, List, Tuple
+
+from bench_apt_packages import write_synthetic_dpkg_state
+
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR
+from cc_builder.modules.apt import AptRepository, PackageInventory, read_manually_installed_packages
+from cc_builder.modules.snap import Snap, format_snap_notes
+
+
+def dict_backed(cls):
+    """
+    A plain dataclass with the fields of `cls`, keeping its attributes in a per-instance __dict__.
+    """
+    fields = [
+        (
+            (field.name, field.type, dataclasses.field(default=field.default))
+            if field.default is not dataclasses.MISSING
+            else (field.name, field.type)
+        )
+        for field in dataclasses.fields(cls)
+    ]
+    return dataclasses.make_dataclass(f"DictBacked{cls.__name__}", fields)
+
+
+@dataclasses.dataclass
+class DictBackedAptPackage:
+    name: str
+
+
+def fresh(value):
+    """
+    A copy of a string (or of the strings in a list) that is a new object, as reading it from a file yields.
+    """
+    if isinstance(value, str):
+        return value.encode().decode()
+    if isinstance(value, list):
+        return [fresh(item) for item in value]
+    return value
+
+
+def retained_memory(build: Callable[[], object]) -> int:
+    """
+    The bytes allocated by build() that are still allocated after it returned.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def snapd_response(snap_count: int) -> str:
+    return json.dumps(
+        [
+            {
+                "name": f"synthetic-snap-{index}",
+                "version": f"1.{index}",
+                "revision": index,
+                "tracking-channel": "latest/stable",
+                "publisher": {"username": "canonical"},
+                "type": "app",
+                "confinement": "classic" if index % 10 == 0 else "strict",
+                "status": "active",
+            }
+            for index in range(snap_count)
+        ]
+    )
+
+
+def build_snaps(response: str, snap_class) -> List:
+    return [
+        snap_class(
+            name=snap["name"],
+            version=snap["version"],
+            rev=str(snap["revision"]),
+            tracking=snap["tracking-channel"],
+            publisher=snap["publisher"]["username"],
+            notes=format_snap_notes(snap_type=snap["type"], classic=snap["confinement"] == "classic"),
+            confinement=snap["confinement"],
+        )
+        for snap in json.loads(response)
+    ]
+
+
+def sources_lines(source_count: int) -> List[str]:
+    return [
+        f"deb [arch=amd64 signed-by=/usr/share/keyrings/synthetic-{index}.gpg] "
+        f"http://ppa.launchpadcontent.net/synthetic/ppa-{index}/ubuntu noble main universe"
+        for index in range(source_count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packages", type=int, default=20000, help="Number of packages in each dpkg status file")
+    parser.add_argument("--hosts", type=int, default=5, help="Number of hosts whose package lists are held at once")
+    parser.add_argument("--snaps", type=int, default=2000, help="Number of snaps in the snapd response")
+    parser.add_argument("--sources", type=int, default=2000, help="Number of one-line apt sources")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="cc-builder-bench-")
+    try:
+        status_path, extended_states_path = write_synthetic_dpkg_state(directory, args.packages)
+
+        def read_package_names() -> List[str]:
+            return read_manually_installed_packages(LOCAL_HOST_ACCESSOR, status_path, extended_states_path)
+
+        package_count = len(read_package_names())
+        response = snapd_response(args.snaps)
+        lines = sources_lines(args.sources)
+        snap_class = dict_backed(Snap)
+        repository_class = dict_backed(AptRepository)
+
+        scenarios: List[Tuple[str, Callable[[], object], Callable[[], object]]] = [
+            (
+                f"packages ({args.hosts} x {package_count})",
+                lambda: [[DictBackedAptPackage(name=name) for name in read_package_names()] for _ in range(args.hosts)],
+                lambda: [PackageInventory.from_names(read_package_names()) for _ in range(args.hosts)],
+            ),
+            (
+                f"snaps ({args.snaps})",
+                lambda: build_snaps(response, snap_class),
+                lambda: build_snaps(response, Snap),
+            ),
+            (
+                f"apt repositories ({args.sources})",
+                lambda: [
+                    repository_class(
+                        **{
+                            field.name: fresh(getattr(repository, field.name))
+                            for field in dataclasses.fields(AptRepository)
+                        }
+                    )
+                    for repository in AptRepository.parse_many(lines)
+                ],
+                lambda: AptRepository.parse_many(lines),
+            ),
+        ]
+
+        print(f"{'inventory':<32} {'dict-backed':>12} {'slotted':>12} {'saved':>8}")
+        for label, build_before, build_after in scenarios:
+            before = retained_memory(build_before)
+            after = retained_memory(build_after)
+            print(f"{label:<32} {before / 1e6:10.2f} MB {after / 1e6:10.2f} MB {1 - after / before:7.0%}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
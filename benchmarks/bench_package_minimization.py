@@ -0,0 +1,96 @@
+"""
+Time leaving base image packages and packages pulled in by others out of the apt packages (--base-manifest and
+--drop-dependencies) against a large synthetic dpkg database.
+
+A dpkg status file with --packages installed packages is generated in a temporary directory. Each package depends
+on up to four packages after it, with the occasional group of alternatives, virtual package and dependency cycle;
+--manual of them are the manually installed packages and a --manifest share of all packages make up the base image
+manifest. Each step is timed (best of --repeat runs) and the number of packages left after it is printed.
+
+Usage:
+    python benchmarks/bench_package_minimization.py [--packages N] [--manual N] [--manifest FRACTION] [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import timeit
+
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR
+from cc_builder.modules.apt import (
+    drop_pulled_in_packages,
+    find_pulled_in_packages,
+    read_base_manifest,
+    read_dependency_graph,
+)
+
+
+def write_synthetic_status(path: str, package_count: int, rng: random.Random):
+    with open(path, "w") as status_file:
+        for index in range(package_count):
+            later = range(index + 1, package_count)
+            depends = [f"package-{other} (>= 1.0)" for other in rng.sample(later, min(len(later), rng.randrange(5)))]
+            if depends and index % 7 == 0:
+                depends[0] += f" | package-{rng.randrange(package_count)}"
+            if index % 11 == 0 and index:
+                # a dependency cycle with an earlier package
+                depends.append(f"package-{rng.randrange(index)}")
+            if index % 13 == 0:
+                depends.append(f"virtual-{index % 50}")
+            status_file.write(f"Package: package-{index}\nStatus: install ok installed\nArchitecture: amd64\n")
+            if index % 50 == 3:
+                status_file.write(f"Provides: virtual-{index % 50}\n")
+            if depends:
+                status_file.write(f"Depends: {', '.join(depends)}\n")
+            status_file.write("\n")
+
+
+def subtract_base_manifest(packages, manifest_path: str):
+    # read the manifest every time, read_base_manifest only reads it once per process
+    base_packages = read_base_manifest.__wrapped__(manifest_path)
+    return [name for name in packages if name not in base_packages]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packages", type=int, default=20000, help="Number of installed packages")
+    parser.add_argument("--manual", type=int, default=2000, help="Number of manually installed packages")
+    parser.add_argument("--manifest", type=float, default=0.3, help="Share of the packages in the base manifest")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs, the best one is reported")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    directory = tempfile.mkdtemp(prefix="cc-builder-bench-")
+    try:
+        status_path = os.path.join(directory, "status")
+        manifest_path = os.path.join(directory, "base.manifest")
+        write_synthetic_status(status_path, args.packages, rng)
+        with open(manifest_path, "w") as manifest_file:
+            for index in rng.sample(range(args.packages), int(args.packages * args.manifest)):
+                manifest_file.write(f"package-{index}:amd64\t1.0\n")
+        manual = sorted(f"package-{index}" for index in rng.sample(range(args.packages), args.manual))
+
+        graph = read_dependency_graph(LOCAL_HOST_ACCESSOR, status_path)
+        base_packages = read_base_manifest(manifest_path)
+        without_base = [name for name in manual if name not in base_packages]
+        pulled_in = find_pulled_in_packages(graph, manual)
+        kept = drop_pulled_in_packages(without_base, pulled_in)
+
+        steps = [
+            ("read dependency graph", lambda: read_dependency_graph(LOCAL_HOST_ACCESSOR, status_path), len(manual)),
+            ("subtract base manifest", lambda: subtract_base_manifest(manual, manifest_path), len(without_base)),
+            ("find pulled in packages", lambda: find_pulled_in_packages(graph, manual), len(without_base)),
+            ("drop pulled in packages", lambda: drop_pulled_in_packages(without_base, pulled_in), len(kept)),
+        ]
+        print(f"{'step':<28} {'time':>10} {'packages left':>14}")
+        for label, step, left in steps:
+            best = min(timeit.repeat(step, number=1, repeat=args.repeat))
+            print(f"{label:<28} {best * 1000:8.1f}ms {left:>14}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Check the import time of the cc-builder CLI against a startup budget, using python -X importtime.
+
+Every scenario starts a fresh interpreter running the CLI (--version, --help and a quiet non-interactive capture of
+this machine into a temporary file), sums the import time it reports and fails if the best of --repeat runs is
+over --budget-ms. It also fails if a module that should only be imported in interactive mode, such as rich's
+console or PyYAML, is imported by a run that neither prompts nor renders --help. The slowest imports of each
+scenario are listed so a regression can be traced back to the import that caused it.
+
+Usage:
+    python benchmarks/bench_startup.py [--budget-ms N] [--repeat N] [--top N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+# modules the non-interactive paths must not import (see generator.get_console)
+INTERACTIVE_ONLY_MODULES = ("rich.console", "rich.syntax", "pygments", "yaml")
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """
+    Map every module imported to its own import time in microseconds, from -X importtime output.
+    """
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        imports[name.strip()] = int(self_us)
+    return imports
+
+
+def run_scenario(args: List[str]) -> Dict[str, int]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "cc_builder.cli"] + args,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def check_scenario(
+    label: str, args: List[str], renders_help: bool, budget_ms: float, repeat: int, top: int
+) -> List[str]:
+    runs: List[Tuple[float, Dict[str, int]]] = []
+    for _ in range(repeat):
+        imports = run_scenario(args)
+        runs.append((sum(imports.values()) / 1000, imports))
+    total_ms, imports = min(runs, key=lambda run: run[0])
+    print(f"{label:<24} {total_ms:8.1f} ms of imports, {len(imports)} modules (budget {budget_ms:.0f} ms)")
+    for name, self_us in sorted(imports.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"    {self_us / 1000:7.1f} ms  {name}")
+
+    failures = []
+    if total_ms > budget_ms:
+        failures.append(f"{label}: {total_ms:.1f} ms of imports is over the {budget_ms:.0f} ms budget")
+    # --help is rendered by rich_click, which needs rich
+    unwanted = (
+        []
+        if renders_help
+        else sorted(
+            name
+            for name in imports
+            if any(name == module or name.startswith(module + ".") for module in INTERACTIVE_ONLY_MODULES)
+        )
+    )
+    if unwanted:
+        failures.append(f"{label}: imports interactive-only modules {', '.join(unwanted)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=120.0, help="Maximum total import time per scenario")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs per scenario, the fastest is checked")
+    parser.add_argument("--top", type=int, default=8, help="Number of slowest imports listed per scenario")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="cc-builder-bench-") as directory:
+        output_path = os.path.join(directory, "cloud-config.yaml")
+        scenarios = [
+            ("--version", ["--version"], False),
+            ("--help", ["--help"], True),
+            ("quiet capture", ["-q", "-f", "--no-cache", "-o", output_path], False),
+        ]
+        failures = []
+        for label, scenario_args, renders_help in scenarios:
+            failures += check_scenario(label, scenario_args, renders_help, args.budget_ms, args.repeat, args.top)
+
+    if failures:
+        print("\n" + "\n".join(failures))
+        sys.exit(1)
+    print("\nAll scenarios are within the startup budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import concurrent.futures
+import dataclasses
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from cc_builder.console_output import print_error, print_info, print_warning, set_quiet_mode
+from cc_builder.defaults import DEFAULT_BATCH_WORKERS
+from cc_builder.inventory import MSGPACK_EXTENSIONS, Inventory, load_inventory
+
+INVENTORY_EXTENSIONS = (".jsonl",) + MSGPACK_EXTENSIONS
+# host recordings saved with --record
+RECORDING_EXTENSIONS = (".json",)
+
+# the YAML instance of a worker process, created once by _init_worker and reused for every file it renders
+_worker_yaml = None
+
+
+@dataclasses.dataclass
+class BatchRenderResult:
+    source: str
+    duration: float
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    unchanged: bool = False  # the canonical cloud-config was identical to the existing one, which was kept
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+def find_captures(directory: str) -> List[str]:
+    """
+    The inventories (see --inventory-out) and host recordings (see --record) in `directory`, in name order.
+    """
+    return sorted(
+        entry.path
+        for entry in os.scandir(directory)
+        if entry.is_file()
+        and not entry.name.startswith(".")
+        and entry.name.endswith(INVENTORY_EXTENSIONS + RECORDING_EXTENSIONS)
+    )
+
+
+def output_name(source: str) -> str:
+    """
+    The name of the cloud-config rendered from a capture, e.g. "box1.yaml" for the "box1.inventory.jsonl" written
+    by `fleet --inventory-out` or for a "box1.json" recording.
+    """
+    name = os.path.basename(source)
+    for extension in INVENTORY_EXTENSIONS + RECORDING_EXTENSIONS:
+        if name.endswith(extension):
+            name = name[: -len(extension)]
+            break
+    if name.endswith(".inventory"):
+        name = name[: -len(".inventory")]
+    return f"{name}.yaml"
+
+
+def _init_worker(quiet: bool):
+    global _worker_yaml
+    from cc_builder.emitter import create_yaml
+
+    set_quiet_mode(quiet)
+    _worker_yaml = create_yaml()
+
+
+def load_capture(source: str, drop_dependencies: bool = False) -> Inventory:
+    """
+    Load the Inventory of a capture. Inventories are read as they are, recordings are replayed and every module
+    except the hostname is gathered from them in memory, as `cc-builder --replay` does. With `drop_dependencies`,
+    the dependencies of the apt packages are gathered from recordings as well.
+    """
+    from cc_builder.generator import gather_cloud_config, get_current_user
+    from cc_builder.host_accessor import ReplayHostAccessor
+
+    if not source.endswith(RECORDING_EXTENSIONS):
+        return load_inventory(source)
+    accessor = ReplayHostAccessor.load(source)
+    current_user = get_current_user(accessor)
+    inventory = Inventory(host=accessor.get_hostname(), user=current_user)
+    # the ssh module always gathers public keys, they are only rendered with {"gather_public_keys": True}
+    gather_cloud_config(
+        current_user,
+        accessor=accessor,
+        disabled_configs=["hostname"],
+        inventory=inventory,
+        drop_dependencies=drop_dependencies,
+    )
+    return inventory
+
+
+def render_capture(
+    source: str,
+    output_path: str,
+    disabled_configs: List[str] = [],
+    options: Optional[Dict[str, Any]] = None,
+    force: bool = False,
+    canonical: bool = False,
+) -> BatchRenderResult:
+    """
+    Render the cloud-config of a single capture to `output_path`, see render_cloud_config for `options`. With
+    `canonical`, it is written in canonical form, and only if it changed, which needs no `force`. Failures are
+    captured in the result instead of raised.
+    """
+    from cc_builder.emitter import write_cloud_config
+    from cc_builder.generator import render_cloud_config
+
+    start = time.monotonic()
+    try:
+        # a canonical cloud-config identical to the existing one needs no --force, which is only known once rendered
+        if not canonical and os.path.exists(output_path) and not force:
+            raise FileExistsError(f"{output_path} already exists, use --force to overwrite it")
+        inventory = load_capture(source, drop_dependencies=bool(options and options.get("drop_dependencies")))
+        cloud_config = render_cloud_config(inventory, disabled_configs=disabled_configs, options=options)
+        written = write_cloud_config(cloud_config, output_path, yaml=_worker_yaml, canonical=canonical, overwrite=force)
+    except Exception as e:  # pylint: disable=broad-except
+        return BatchRenderResult(source=source, duration=time.monotonic() - start, error=f"{type(e).__name__}: {e}")
+    return BatchRenderResult(
+        source=source, duration=time.monotonic() - start, output_path=output_path, unchanged=not written
+    )
+
+
+def _render_job(job: tuple) -> BatchRenderResult:
+    return render_capture(*job)
+
+
+def batch_render(
+    sources: List[str],
+    output_dir: str,
+    workers: int = DEFAULT_BATCH_WORKERS,
+    disabled_configs: List[str] = [],
+    options: Optional[Dict[str, Any]] = None,
+    force: bool = False,
+    quiet: bool = False,
+    canonical: bool = False,
+) -> List[BatchRenderResult]:
+    """
+    Render a cloud-config into `output_dir` for every capture in `sources`, across `workers` processes. Emitting
+    YAML with ruamel is CPU bound, so processes rather than threads are used; each one creates a single YAML
+    instance it renders all of its files with. Results are returned in the order of `sources`.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [
+        (source, os.path.join(output_dir, output_name(source)), disabled_configs, options, force, canonical)
+        for source in sources
+    ]
+    if workers == 1:
+        _init_worker(quiet)
+        return [_render_job(job) for job in jobs]
+    # hand out files in chunks, sending every file to a worker on its own costs more than rendering small ones
+    chunksize = max(1, min(64, len(jobs) // (workers * 4)))
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(quiet,)
+    ) as executor:
+        return list(executor.map(_render_job, jobs, chunksize=chunksize))
+
+
+def print_batch_summary(results: List[BatchRenderResult], wall_time: float):
+    """
+    Print the throughput of a batch render followed by the captures that failed.
+    """
+    failures = [result for result in results if not result.succeeded]
+    succeeded = len(results) - len(failures)
+    rate = succeeded / wall_time if wall_time > 0 else 0.0
+    unchanged = sum(result.unchanged for result in results)
+    print_info(
+        f"\nRendered {succeeded}/{len(results)} cloud-configs in {wall_time:.2f}s ({rate:.1f} files/s)"
+        + (f", {unchanged} unchanged" if unchanged else ""),
+        ignore_quiet=True,
+    )
+    if failures:
+        print_warning(f"{len(failures)} capture(s) failed:", ignore_quiet=True)
+        for result in failures:
+            print_error(f"  {result.source}: {result.error}")
@@ -1,19 +1,46 @@
+import contextlib
 import logging
 import os
 import sys
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 import rich_click as click
 
 from cc_builder.console_output import print_error, print_info, print_warning, set_quiet_mode
-from cc_builder.generator import create_cloud_init_config
+from cc_builder.defaults import (
+    DEFAULT_BATCH_OUTPUT_DIR,
+    DEFAULT_BATCH_WORKERS,
+    DEFAULT_FLEET_OUTPUT_DIR,
+    DEFAULT_FLEET_PARALLELISM,
+    DEFAULT_GATHER_TIMEOUT,
+    DEFAULT_JOBS,
+    INVENTORY_FORMATS,
+    PROFILE_FORMATS,
+)
 from cc_builder.logger import configure_logging
 
+# the commands import what they use when they run, so --help and --version only load click and the defaults
+if TYPE_CHECKING:
+    from cc_builder.user_database import UserSelection
+
 LOG = logging.getLogger()
 
 default_output_path = "cloud-config.yaml"
 
 
-@click.command(context_settings={"show_default": True})
+def parse_user_selection(ctx, param, value: Optional[str]) -> Optional["UserSelection"]:
+    from cc_builder.user_database import UserSelection
+
+    if value is None:
+        return None
+    try:
+        return UserSelection.parse(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e)) from e
+
+
+@click.group(invoke_without_command=True, context_settings={"show_default": True})
 @click.pass_context
 @click.option(
     "-i",
@@ -87,6 +114,130 @@ default_output_path = "cloud-config.yaml"
     help="Keep the current user config but rename it to the default 'ubuntu' user.",
     default=False,
 )
+@click.option(
+    "--pin-snap-channels",
+    is_flag=True,
+    default=False,
+    help="Install each snap from the channel it is currently tracking (snap install --channel=...) instead of its default channel.",
+)
+@click.option(
+    "--users",
+    "user_selection",
+    metavar="all|uid>=N|NAME,...",
+    callback=parse_user_selection,
+    help="Capture the accounts, groups and authorized keys of several users instead of only the current one: every account that can log in except root (all), those with a uid of at least N (uid>=N) or the listed accounts.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+    help="Number of modules to gather concurrently in non-interactive mode. The output is identical regardless of this value.",
+)
+@click.option(
+    "--gather-timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_GATHER_TIMEOUT,
+    help="Maximum number of seconds a single module may spend gathering when --jobs is greater than 1. Modules that take longer are skipped. With --jobs 1, modules are gathered one after another in the main thread and never time out.",
+)
+@click.option(
+    "--record",
+    "record_path",
+    type=click.Path(dir_okay=False),
+    help="Save every command result and file read while gathering to this file, so the capture can be replayed with --replay.",
+)
+@click.option(
+    "--replay",
+    "replay_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Generate the cloud-config from a recording made with --record instead of inspecting this machine.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Gather every module from scratch instead of reusing results cached by earlier runs whose input files have not changed since.",
+)
+@click.option(
+    "--cache-stats",
+    is_flag=True,
+    default=False,
+    help="Print gather cache hits, misses and size after generating the cloud-config.",
+)
+@click.option(
+    "--since",
+    "since_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Cloud-config written by an earlier run for this machine. Modules gathered with the same options whose input files have not changed since are taken over from it instead of being gathered again.",
+)
+@click.option(
+    "--provenance",
+    is_flag=True,
+    default=False,
+    help="Record in the footer of the cloud-config when it was gathered and with which options, so a later --since run can take sections over from it. Always done with --since.",
+)
+@click.option(
+    "--delta",
+    is_flag=True,
+    default=False,
+    help="With --since, write only the changes against the earlier cloud-config (e.g. packages added or removed) instead of the full cloud-config.",
+)
+@click.option(
+    "--root",
+    "root_path",
+    type=click.Path(exists=True, file_okay=False),
+    help="Generate the cloud-config from the root filesystem at this path (e.g. an unpacked or mounted image) instead of this machine. No commands are run, everything is read from files under the path.",
+)
+@click.option(
+    "--root-user",
+    help="User of the --root filesystem to capture. Defaults to the first regular user in its /etc/passwd.",
+)
+@click.option(
+    "--inventory-out",
+    "inventory_path",
+    type=click.Path(dir_okay=False),
+    help="Also write the data gathered by every module to this file, for other tools to read. Written as JSON Lines, or as msgpack (needs the msgpack package) for .msgpack and .mpk files.",
+)
+@click.option(
+    "--inventory-format",
+    type=click.Choice(INVENTORY_FORMATS),
+    help="Format of the --inventory-out file, instead of the one implied by its extension.",
+)
+@click.option(
+    "--base-manifest",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+    help="Leave the packages of this Ubuntu cloud image .manifest file out of the apt packages, as the image already has them installed.",
+)
+@click.option(
+    "--drop-dependencies",
+    is_flag=True,
+    default=False,
+    help="Also leave out apt packages that the Depends of other apt packages pull in, as read from the dpkg status database.",
+)
+@click.option(
+    "--canonical",
+    is_flag=True,
+    default=False,
+    help="Write the cloud-config in canonical form: keys and unordered lists such as packages sorted, and a hash of the content in the footer instead of the time it was written. An existing file with the same content is left untouched.",
+)
+@click.option(
+    "--timings",
+    is_flag=True,
+    default=False,
+    help="Print the wall time, CPU time, commands run and bytes read of every module's gather and generate phases and of writing the cloud-config.",
+)
+@click.option(
+    "--profile",
+    "profile_path",
+    type=click.Path(dir_okay=False),
+    help="Write the timings of the capture to this file, in the format given by --profile-format.",
+)
+@click.option(
+    "--profile-format",
+    type=click.Choice(PROFILE_FORMATS),
+    default="json",
+    help="Format of the --profile file: a JSON report, a Chrome trace (chrome://tracing, Perfetto) or a speedscope profile.",
+)
 # add -h as a shortcut for --help
 @click.help_option("-h", "--help")
 @click.version_option()
@@ -104,6 +255,27 @@ def cli(
     disable_user,
     enable_hostname,
     rename_to_ubuntu_user,
+    pin_snap_channels,
+    user_selection,
+    jobs,
+    gather_timeout,
+    record_path,
+    replay_path,
+    no_cache,
+    cache_stats,
+    since_path,
+    provenance,
+    delta,
+    root_path,
+    root_user,
+    inventory_path,
+    inventory_format,
+    base_manifest,
+    drop_dependencies,
+    canonical,
+    timings,
+    profile_path,
+    profile_format,
 ):
     """
     Generate a cloud-init configuration file for the current machine.
@@ -116,6 +288,23 @@ def cli(
     Only -f can be used with -i/--interactive
     """
 
+    # options given before a subcommand (e.g. "cc-builder fleet") only apply to the local capture
+    if ctx.invoked_subcommand is not None:
+        return
+
+    # the gathering code is only imported once a capture actually runs, keeping --help and --version fast
+    from cc_builder.gather_cache import GatherCache
+    from cc_builder.generator import create_cloud_init_config
+    from cc_builder.host_accessor import (
+        LOCAL_HOST_ACCESSOR,
+        RecordingHostAccessor,
+        ReplayHostAccessor,
+        RootfsHostAccessor,
+    )
+    from cc_builder.incremental import load_previous_cloud_config
+    from cc_builder.inventory import InventoryWriter
+    from cc_builder.profiling import Profiler, write_profile
+
     configure_logging()
 
     if quiet:
@@ -128,7 +317,8 @@ def cli(
 
     if interactive and not force:
         output_path = get_output_path(output_path)
-    elif os.path.exists(f"{output_path}") and not force:
+    # a canonical cloud-config identical to the existing one needs no --force, which is only known once gathered
+    elif os.path.exists(f"{output_path}") and not force and not canonical:
         print_error(f"Output file {output_path} already exists. Use --force or -f to allow writing over existing file")
         sys.exit(1)
     elif force:
@@ -146,15 +336,645 @@ def cli(
     if not enable_hostname:
         disabled_configs.append("hostname")
 
-    create_cloud_init_config(
-        output_path,
-        interactive=interactive,
+    if delta and not since_path:
+        print_error("--delta can only be used with --since.")
+        sys.exit(1)
+    if provenance and canonical:
+        print_error("Cannot use --provenance with --canonical, canonical cloud-configs carry no time or options.")
+        sys.exit(1)
+    if interactive and since_path:
+        print_error("Cannot use interactive mode with --since.")
+        sys.exit(1)
+    if interactive and user_selection is not None:
+        print_error("Cannot use interactive mode with --users.")
+        sys.exit(1)
+    if inventory_path and since_path:
+        # sections taken over from the earlier cloud-config are not gathered, so there is no data to write for them
+        print_error("Cannot use --inventory-out with --since.")
+        sys.exit(1)
+    # read the previous cloud-config before the output, which may be the same file, is written over
+    previous = load_previous_cloud_config(since_path) if since_path else None
+
+    if replay_path and root_path:
+        print_error("Cannot use --replay and --root together.")
+        sys.exit(1)
+    if root_user and not root_path:
+        print_error("--root-user can only be used with --root.")
+        sys.exit(1)
+
+    if replay_path:
+        accessor = ReplayHostAccessor.load(replay_path)
+    elif root_path:
+        accessor = RootfsHostAccessor(root_path, user=root_user)
+    else:
+        accessor = LOCAL_HOST_ACCESSOR
+    if record_path:
+        accessor = RecordingHostAccessor(accessor)
+    cache = None if no_cache else GatherCache()
+    profiler = Profiler(accessor.get_hostname()) if timings or profile_path else None
+    inventory = None
+    if inventory_path:
+        try:
+            inventory = InventoryWriter(
+                inventory_path, inventory_format, host=accessor.get_hostname(), user=accessor.get_user()
+            )
+        except ValueError as e:
+            print_error(str(e))
+            sys.exit(1)
+
+    # the inventory is moved into place once the capture succeeded, and dropped otherwise
+    try:
+        with inventory if inventory is not None else contextlib.nullcontext():
+            create_cloud_init_config(
+                output_path,
+                interactive=interactive,
+                gather_public_keys=gather_public_keys,
+                password=password,
+                disabled_configs=disabled_configs,
+                rename_to_ubuntu_user=rename_to_ubuntu_user,
+                quiet=quiet,
+                jobs=jobs,
+                gather_timeout=gather_timeout,
+                accessor=accessor,
+                cache=cache,
+                previous=previous,
+                provenance=provenance,
+                delta=delta,
+                pin_snap_channels=pin_snap_channels,
+                users=user_selection,
+                profiler=profiler,
+                inventory=inventory,
+                canonical=canonical,
+                base_manifest=base_manifest,
+                drop_dependencies=drop_dependencies,
+                overwrite=force or interactive,
+            )
+    except FileExistsError:
+        print_error(
+            f"Output file {output_path} already exists with other content. Use --force or -f to allow writing over "
+            "existing file"
+        )
+        sys.exit(1)
+    if inventory is not None:
+        print_info(f"Wrote inventory of {inventory.modules} modules to file: {inventory_path}", ignore_quiet=True)
+
+    if cache_stats and cache is not None:
+        cache.print_stats()
+    if timings:
+        profiler.print_timings()
+    if profile_path:
+        write_profile([profiler], profile_path, profile_format)
+        print_info(f"Wrote timings to file: {profile_path}", ignore_quiet=True)
+    if record_path:
+        accessor.save(record_path)
+        print_info(f"Saved host recording to file: {record_path}", ignore_quiet=True)
+
+
+@cli.command(context_settings={"show_default": True})
+@click.argument("inventory", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-d",
+    "--output-dir",
+    default=DEFAULT_FLEET_OUTPUT_DIR,
+    help="Directory to write one cloud-config per host into. Files are named after the host.",
+)
+@click.option(
+    "-p",
+    "--parallel",
+    type=click.IntRange(min=1),
+    default=DEFAULT_FLEET_PARALLELISM,
+    help="Maximum number of hosts captured, and SSH commands running, at the same time.",
+)
+@click.option(
+    "--ssh-option",
+    "ssh_options",
+    multiple=True,
+    help="Extra option passed to ssh as -o OPTION, e.g. --ssh-option User=ubuntu. Can be given multiple times.",
+)
+@click.option(
+    "--connect-timeout",
+    type=click.IntRange(min=1),
+    default=10,
+    help="SSH connection timeout in seconds.",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Write over existing cloud-configs in the output directory.",
+)
+@click.option(
+    "-q",
+    "--quiet",
+    is_flag=True,
+    help="Only show the per-host summary and errors.",
+)
+@click.option(
+    "--enable-hostname",
+    is_flag=True,
+    default=False,
+    help="Enable gathering the hostname of each host.",
+)
+@click.option(
+    "--gather-public-keys",
+    is_flag=True,
+    default=False,
+    help="Enable gathering of all public key files in the ~/.ssh directory of the remote user.",
+)
+@click.option(
+    "--disable-apt",
+    is_flag=True,
+    help="Disable the gathering and generation of apt config.",
+    default=False,
+)
+@click.option(
+    "--disable-snap",
+    is_flag=True,
+    help="Disable the gathering and generation of snap config.",
+    default=False,
+)
+@click.option(
+    "--disable-ssh",
+    is_flag=True,
+    help="Disable the gathering and generation of ssh config.",
+    default=False,
+)
+@click.option(
+    "--disable-user",
+    is_flag=True,
+    help="Disable the gathering and generation of user config.",
+    default=False,
+)
+@click.option(
+    "--pin-snap-channels",
+    is_flag=True,
+    default=False,
+    help="Install each snap from the channel it is currently tracking (snap install --channel=...) instead of its default channel.",
+)
+@click.option(
+    "--users",
+    "user_selection",
+    metavar="all|uid>=N|NAME,...",
+    callback=parse_user_selection,
+    help="Capture the accounts, groups and authorized keys of several users instead of only the current one: every account that can log in except root (all), those with a uid of at least N (uid>=N) or the listed accounts.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+    help="Number of modules to gather concurrently on each host.",
+)
+@click.option(
+    "--gather-timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_GATHER_TIMEOUT,
+    help="Maximum number of seconds a single module may spend gathering when --jobs is greater than 1. With --jobs 1, modules are gathered one after another and never time out.",
+)
+@click.option(
+    "--inventory-out",
+    "write_inventory",
+    is_flag=True,
+    default=False,
+    help="Also write the data gathered from each host to HOST.inventory.jsonl (or HOST.inventory.msgpack, see --inventory-format) in the output directory, for other tools to read.",
+)
+@click.option(
+    "--inventory-format",
+    type=click.Choice(INVENTORY_FORMATS),
+    default="jsonl",
+    help="Format of the --inventory-out files. msgpack needs the msgpack package.",
+)
+@click.option(
+    "--base-manifest",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+    help="Leave the packages of this Ubuntu cloud image .manifest file out of the apt packages, as the image already has them installed.",
+)
+@click.option(
+    "--drop-dependencies",
+    is_flag=True,
+    default=False,
+    help="Also leave out apt packages that the Depends of other apt packages pull in, as read from the dpkg status database.",
+)
+@click.option(
+    "--canonical",
+    is_flag=True,
+    default=False,
+    help="Write the cloud-configs in canonical form: keys and unordered lists such as packages sorted, and a hash of the content in the footer instead of the time it was written. Existing files with the same content are left untouched.",
+)
+@click.option(
+    "--timings",
+    is_flag=True,
+    default=False,
+    help="Print the wall time, CPU time, commands run and bytes read of every module's gather and generate phases and of writing the cloud-config, summed up across hosts together with the slowest host of each.",
+)
+@click.option(
+    "--profile",
+    "profile_path",
+    type=click.Path(dir_okay=False),
+    help="Write the timings of the capture of every host to this file, in the format given by --profile-format.",
+)
+@click.option(
+    "--profile-format",
+    type=click.Choice(PROFILE_FORMATS),
+    default="json",
+    help="Format of the --profile file: a JSON report, a Chrome trace (chrome://tracing, Perfetto) or a speedscope profile.",
+)
+@click.help_option("-h", "--help")
+def fleet(
+    inventory,
+    output_dir,
+    parallel,
+    ssh_options,
+    connect_timeout,
+    force,
+    quiet,
+    enable_hostname,
+    gather_public_keys,
+    disable_apt,
+    disable_snap,
+    disable_ssh,
+    disable_user,
+    pin_snap_channels,
+    user_selection,
+    jobs,
+    gather_timeout,
+    write_inventory,
+    inventory_format,
+    base_manifest,
+    drop_dependencies,
+    canonical,
+    timings,
+    profile_path,
+    profile_format,
+):
+    """
+    Generate a cloud-init configuration file for every host in an inventory file, over SSH.
+
+    INVENTORY lists one host per line as [user@]host[:port]. Blank lines and lines starting with # are ignored.
+    Hosts must be reachable with non-interactive (key based) SSH authentication.
+    """
+    from cc_builder.fleet import capture_fleet_over_ssh, check_unique_labels, print_fleet_summary, read_inventory
+    from cc_builder.inventory import check_inventory_format
+    from cc_builder.profiling import print_aggregate_timings, write_profile
+
+    configure_logging()
+
+    if quiet:
+        set_quiet_mode(True)
+
+    disabled_configs = [
+        name
+        for name, disabled in (
+            ("apt", disable_apt),
+            ("snap", disable_snap),
+            ("ssh", disable_ssh),
+            ("user", disable_user),
+            ("hostname", not enable_hostname),
+        )
+        if disabled
+    ]
+
+    if write_inventory:
+        try:
+            check_inventory_format(inventory_format)
+        except ValueError as e:
+            print_error(str(e))
+            sys.exit(1)
+
+    hosts = read_inventory(inventory)
+    if not hosts:
+        print_error(f"No hosts found in inventory file {inventory}")
+        sys.exit(1)
+    try:
+        check_unique_labels(hosts)
+    except ValueError as e:
+        print_error(str(e))
+        sys.exit(1)
+    print_info(f"Capturing {len(hosts)} hosts, {parallel} at a time", ignore_quiet=True)
+
+    results = capture_fleet_over_ssh(
+        hosts,
+        output_dir,
+        parallelism=parallel,
+        ssh_options=list(ssh_options),
+        connect_timeout=connect_timeout,
         gather_public_keys=gather_public_keys,
-        password=password,
         disabled_configs=disabled_configs,
-        rename_to_ubuntu_user=rename_to_ubuntu_user,
+        jobs=jobs,
+        gather_timeout=gather_timeout,
+        force=force,
+        pin_snap_channels=pin_snap_channels,
+        users=user_selection,
+        profile=bool(timings or profile_path),
+        write_inventory=write_inventory,
+        inventory_format=inventory_format,
+        canonical=canonical,
+        base_manifest=base_manifest,
+        drop_dependencies=drop_dependencies,
+    )
+    print_fleet_summary(results)
+    profilers = [result.profiler for result in results if result.profiler is not None]
+    if timings:
+        print_aggregate_timings(profilers)
+    if profile_path:
+        write_profile(profilers, profile_path, profile_format)
+        print_info(f"Wrote timings of {len(profilers)} hosts to file: {profile_path}", ignore_quiet=True)
+    if not all(result.succeeded for result in results):
+        sys.exit(1)
+
+
+def render_options(command):
+    """
+    The options `render` and `batch-render` change the captured modules with, see parse_render_options.
+    """
+    options = [
+        click.option(
+            "--rename-to-ubuntu-user",
+            is_flag=True,
+            default=False,
+            help="Rename the captured user to the default 'ubuntu' user.",
+        ),
+        click.option(
+            "--rename-user",
+            metavar="NAME",
+            help="Rename the captured user to NAME.",
+        ),
+        click.option(
+            "--password",
+            help="Set the password for the user. WARNING: This is incredibly insecure and is stored in plaintext in the cloud-init config.",
+        ),
+        click.option(
+            "--gather-public-keys/--no-gather-public-keys",
+            default=None,
+            show_default=False,
+            help="Write (or leave out) the public key files captured from ~/.ssh. Defaults to what the capture was run with.",
+        ),
+        click.option(
+            "--pin-snap-channels/--no-pin-snap-channels",
+            default=None,
+            show_default=False,
+            help="Install each snap from the channel it was tracking (or from its default channel). Defaults to what the capture was run with.",
+        ),
+        click.option(
+            "--base-manifest",
+            type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+            help="Leave the packages of this Ubuntu cloud image .manifest file out of the apt packages, as the image already has them installed.",
+        ),
+        click.option(
+            "--drop-dependencies/--keep-dependencies",
+            default=None,
+            show_default=False,
+            help="Leave out (or keep) apt packages that the Depends of other apt packages pull in. Leaving them out needs a capture run with --drop-dependencies. Defaults to what the capture was run with.",
+        ),
+        click.option(
+            "--disable-apt",
+            is_flag=True,
+            help="Leave out the apt config.",
+            default=False,
+        ),
+        click.option(
+            "--disable-snap",
+            is_flag=True,
+            help="Leave out the snap config.",
+            default=False,
+        ),
+        click.option(
+            "--disable-ssh",
+            is_flag=True,
+            help="Leave out the ssh config.",
+            default=False,
+        ),
+        click.option(
+            "--disable-user",
+            is_flag=True,
+            help="Leave out the user config.",
+            default=False,
+        ),
+        click.option(
+            "--disable-hostname",
+            is_flag=True,
+            help="Leave out the hostname, if it was captured.",
+            default=False,
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def parse_render_options(
+    rename_to_ubuntu_user,
+    rename_user,
+    password,
+    gather_public_keys,
+    pin_snap_channels,
+    base_manifest,
+    drop_dependencies,
+    disable_apt,
+    disable_snap,
+    disable_ssh,
+    disable_user,
+    disable_hostname,
+) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    The modules to leave out and the ModuleOptions to render with, as passed to render_cloud_config, from the
+    options added by render_options. Options that are not given keep the values of the capture.
+    """
+    if rename_to_ubuntu_user and rename_user:
+        print_error("Cannot use --rename-to-ubuntu-user and --rename-user together.")
+        sys.exit(1)
+    disabled_configs = [
+        name
+        for name, disabled in (
+            ("apt", disable_apt),
+            ("snap", disable_snap),
+            ("ssh", disable_ssh),
+            ("user", disable_user),
+            ("hostname", disable_hostname),
+        )
+        if disabled
+    ]
+    options: Dict[str, Any] = {}
+    if rename_to_ubuntu_user or rename_user:
+        options["current_user"] = rename_user or "ubuntu"
+    if password is not None:
+        options["password"] = password
+    if gather_public_keys is not None:
+        options["gather_public_keys"] = gather_public_keys
+    if pin_snap_channels is not None:
+        options["pin_snap_channels"] = pin_snap_channels
+    if base_manifest is not None:
+        options["base_manifest"] = base_manifest
+    if drop_dependencies is not None:
+        options["drop_dependencies"] = drop_dependencies
+    return disabled_configs, options
+
+
+@cli.command(context_settings={"show_default": True})
+@click.option(
+    "--from",
+    "inventory_path",
+    required=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="Inventory written by --inventory-out to render the cloud-config from.",
+)
+@click.option(
+    "--inventory-format",
+    type=click.Choice(INVENTORY_FORMATS),
+    help="Format of the inventory. Defaults to msgpack for .msgpack and .mpk files and to JSON Lines otherwise.",
+)
+@click.option(
+    "-o",
+    "--output-path",
+    default=default_output_path,
+    help="Path to output file.",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Write over output file if it already exists.",
+)
+@click.option(
+    "-q",
+    "--quiet",
+    is_flag=True,
+    help="Enable quiet output. Only critical errors and essential information will be displayed.",
+)
+@click.option(
+    "--canonical",
+    is_flag=True,
+    default=False,
+    help="Write the cloud-config in canonical form: keys and unordered lists such as packages sorted, and a hash of the content in the footer instead of the time it was written. An existing file with the same content is left untouched.",
+)
+@render_options
+@click.help_option("-h", "--help")
+def render(inventory_path, inventory_format, output_path, force, quiet, canonical, **render_option_values):
+    """
+    Generate a cloud-init configuration file from an inventory written by --inventory-out, without gathering anything.
+
+    Options not given keep the values the capture was run with, so one capture can be rendered with e.g. another user
+    name or password in a fraction of the time capturing takes.
+    """
+    from cc_builder.emitter import write_cloud_config
+    from cc_builder.generator import render_cloud_config
+    from cc_builder.inventory import load_inventory
+
+    configure_logging()
+
+    if quiet:
+        set_quiet_mode(True)
+
+    disabled_configs, options = parse_render_options(**render_option_values)
+    # a canonical cloud-config identical to the existing one needs no --force, which is only known once rendered
+    if os.path.exists(output_path) and not force and not canonical:
+        print_error(f"Output file {output_path} already exists. Use --force or -f to allow writing over existing file")
+        sys.exit(1)
+
+    try:
+        inventory = load_inventory(inventory_path, inventory_format)
+    except ValueError as e:
+        print_error(str(e))
+        sys.exit(1)
+    cloud_config = render_cloud_config(inventory, disabled_configs=disabled_configs, options=options)
+    try:
+        written = write_cloud_config(cloud_config, output_path, canonical=canonical, overwrite=force)
+    except FileExistsError:
+        print_error(
+            f"Output file {output_path} already exists with other content. Use --force or -f to allow writing over "
+            "existing file"
+        )
+        sys.exit(1)
+    if written:
+        print_info(
+            f"Wrote cloud-init config rendered from {inventory_path} ({inventory.host}) to file: {output_path}",
+            ignore_quiet=True,
+        )
+    else:
+        print_info(f"Cloud-init config is unchanged, left {output_path} as it is", ignore_quiet=True)
+
+
+@cli.command("batch-render", context_settings={"show_default": True})
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "-d",
+    "--output-dir",
+    default=DEFAULT_BATCH_OUTPUT_DIR,
+    help="Directory to write the cloud-configs into, named after the capture they are rendered from.",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_BATCH_WORKERS,
+    help="Number of processes rendering cloud-configs at the same time.",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Write over existing cloud-configs in the output directory.",
+)
+@click.option(
+    "-q",
+    "--quiet",
+    is_flag=True,
+    help="Only show the summary and errors.",
+)
+@click.option(
+    "--canonical",
+    is_flag=True,
+    default=False,
+    help="Write the cloud-configs in canonical form: keys and unordered lists such as packages sorted, and a hash of the content in the footer instead of the time it was written. Existing files with the same content are left untouched.",
+)
+@render_options
+@click.help_option("-h", "--help")
+def batch_render_command(directory, output_dir, workers, force, quiet, canonical, **render_option_values):
+    """
+    Generate a cloud-init configuration file for every capture in a directory, across several processes.
+
+    DIRECTORY holds inventories written by --inventory-out (.jsonl, .msgpack) and host recordings saved with
+    --record (.json). Each is rendered to a cloud-config of the same name in the output directory, e.g. the
+    box1.inventory.jsonl written by `fleet --inventory-out` to box1.yaml.
+    """
+    from cc_builder.batch import batch_render, find_captures, output_name, print_batch_summary
+
+    configure_logging()
+
+    if quiet:
+        set_quiet_mode(True)
+
+    disabled_configs, options = parse_render_options(**render_option_values)
+    sources = find_captures(directory)
+    if not sources:
+        print_error(f"No inventories or recordings found in {directory}")
+        sys.exit(1)
+    names: Dict[str, str] = {}
+    for source in sources:
+        name = output_name(source)
+        if name in names:
+            print_error(f"{names[name]} and {source} would both be rendered to {name}")
+            sys.exit(1)
+        names[name] = source
+    print_info(f"Rendering {len(sources)} captures with {workers} workers", ignore_quiet=True)
+
+    start = time.monotonic()
+    results = batch_render(
+        sources,
+        output_dir,
+        workers=workers,
+        disabled_configs=disabled_configs,
+        options=options,
+        force=force,
         quiet=quiet,
+        canonical=canonical,
     )
+    print_batch_summary(results, time.monotonic() - start)
+    if not all(result.succeeded for result in results):
+        sys.exit(1)
 
 
 # ask for path to save cloud-init config and provide default
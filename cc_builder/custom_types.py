@@ -1,11 +1,100 @@
 import dataclasses
-from typing import Optional
+from typing import Any, ClassVar, Dict, List, Optional, Tuple
+
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, HostAccessor
+
+
+def slotted(cls):
+    """
+    Recreate a dataclass with __slots__, like dataclass(slots=True) does on Python 3.10 and later, so its instances
+    carry no per-instance __dict__. Use for the types gathered by the thousand, e.g. packages or snaps.
+    """
+    field_names = tuple(field.name for field in dataclasses.fields(cls))
+    # the defaults live on in the generated __init__, as class attributes they would clash with the slots
+    namespace = {
+        key: value
+        for key, value in cls.__dict__.items()
+        if key not in field_names and key not in ("__dict__", "__weakref__")
+    }
+    namespace["__slots__"] = field_names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@dataclasses.dataclass
+class ModuleOptions:
+    """
+    The options of a run that modules are created from, see BaseConfig.option_fields.
+    """
+
+    current_user: str
+    gather_public_keys: bool = False
+    password: Optional[str] = None
+    pin_snap_channels: bool = False
+    # the accounts selected with --users, None to capture current_user only
+    selected_users: Optional[List[str]] = None
+    rename_to_ubuntu_user: bool = False
+    # the account captured as current_user when it was renamed in interactive mode
+    account: Optional[str] = None
+    # a cloud image .manifest whose packages are left out of the apt packages
+    base_manifest: Optional[str] = None
+    # leave out apt packages that the Depends of other apt packages pull in
+    drop_dependencies: bool = False
 
 
 @dataclasses.dataclass
 class BaseConfig:
+    # Name of the module, e.g. "apt", as used by disabled_configs, the gather cache and depends_on
+    module_name: ClassVar[str] = ""
+    # ModuleOptions attributes the module is created with, mapped to the dataclass fields they are passed as
+    option_fields: ClassVar[Dict[str, str]] = {}
+    # Modules whose gather() has to finish before this one's starts (see use_dependencies)
+    depends_on: ClassVar[Tuple[str, ...]] = ()
+    # Commands and files gather() always needs from the host. They are fetched together up front on hosts where
+    # every request is a round-trip (see MemoizingHostAccessor.prefetch). "~" is expanded on the host.
+    host_commands: ClassVar[Tuple[str, ...]] = ()
+    host_files: ClassVar[Tuple[str, ...]] = ()
+    # Files the gathered result is derived from. Modules that declare them are kept in the gather cache until one of
+    # the files changes (see GatherCache); paths ending in "/" are directories whose entries are checked too. Inputs
+    # that depend on the host, such as the files sshd_config includes, are added by resolve_cache_inputs.
+    cache_inputs: ClassVar[Tuple[str, ...]] = ()
+    # Top-level cloud-config keys generate_cloud_config() can write
+    cloud_config_keys: ClassVar[Tuple[str, ...]] = ()
+
+    @classmethod
+    def from_options(cls, options: ModuleOptions) -> "BaseConfig":
+        return cls(**{field: getattr(options, option) for option, field in cls.option_fields.items()})
+
+    @classmethod
+    def prompt_options(cls, options: ModuleOptions):
+        """
+        Ask for the module's options in interactive mode, updating `options` before the module is created.
+        """
+
+    def apply_options(self, options: Dict[str, Any]):
+        """
+        Change options of an already gathered module, given as ModuleOptions attribute names mapped to their new
+        values, e.g. to render a saved inventory with other options. Values shared with other copies of the module,
+        such as gathered lists, are replaced rather than changed in place.
+        """
+        for option, value in options.items():
+            if option in self.option_fields:
+                setattr(self, self.option_fields[option], value)
+
+    def resolve_cache_inputs(self, accessor: HostAccessor) -> Tuple[str, ...]:
+        """
+        The files the gathered result is derived from on the host behind `accessor`, looked up before gathering. By
+        default the module's cache_inputs.
+        """
+        return self.cache_inputs
+
+    def use_dependencies(self, dependencies: Dict[str, "BaseConfig"]):
+        """
+        Receive the gathered configs of the modules in depends_on before gather() runs. Dependencies that are
+        disabled or were not gathered in this run are missing.
+        """
+
     def generate_cloud_config(self):
         raise NotImplementedError()
 
-    def gather(self):
+    def gather(self, accessor: HostAccessor = LOCAL_HOST_ACCESSOR):
         raise NotImplementedError()
@@ -0,0 +1,15 @@
+import os
+
+# Defaults of the command line options. They are kept apart from the modules using them so that cc_builder.cli can
+# show them in --help without importing those modules, see the startup budget in tests/unit_tests/test_startup.py.
+
+DEFAULT_JOBS = 1
+DEFAULT_GATHER_TIMEOUT = 300.0
+DEFAULT_FLEET_PARALLELISM = 10
+DEFAULT_FLEET_OUTPUT_DIR = "fleet-cloud-configs"
+DEFAULT_BATCH_WORKERS = os.cpu_count() or 1
+DEFAULT_BATCH_OUTPUT_DIR = "rendered-cloud-configs"
+INVENTORY_FORMATS = ("jsonl", "msgpack")
+# json is cc-builder's own report, chrome is the Trace Event Format read by chrome://tracing and Perfetto, speedscope
+# is read by https://www.speedscope.app
+PROFILE_FORMATS = ("json", "chrome", "speedscope")
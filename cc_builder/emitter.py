@@ -0,0 +1,215 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, TextIO
+
+from ruamel.yaml import YAML
+
+CLOUD_CONFIG_HEADER = "#cloud-config\n\n"
+FOOTER_RULE = "#" * 80 + "\n"
+CONTENT_HASH_PREFIX = "# Content hash: sha256:"
+# Lists whose order means nothing to cloud-init, sorted in canonical output. Lists of mappings are sorted by the
+# value of the given key, lists of scalars by the scalars themselves.
+UNORDERED_LISTS: Dict[str, Optional[str]] = {
+    "packages": None,
+    "groups": None,
+    "ssh_authorized_keys": None,
+    "ssh_import_id": None,
+    "ssh_genkeytypes": None,
+    "write_files": "path",
+}
+
+
+def create_yaml() -> YAML:
+    """
+    Create a ruamel YAML instance configured the way cc-builder emits cloud-configs.
+    """
+    yaml = YAML()
+    yaml.width = 9999
+    return yaml
+
+
+custom_yaml = create_yaml()
+# ruamel YAML instances are not thread-safe, so threads other than the main one each get their own
+_thread_local = threading.local()
+
+
+def get_yaml() -> YAML:
+    """
+    Return the YAML instance to use in the calling thread.
+    """
+    if threading.current_thread() is threading.main_thread():
+        return custom_yaml
+    if not hasattr(_thread_local, "yaml"):
+        _thread_local.yaml = create_yaml()
+    return _thread_local.yaml
+
+
+def format_footer(footer_lines: Sequence[str] = ()) -> str:
+    return (
+        "\n"
+        + FOOTER_RULE
+        # Add timestamp to end of file
+        + f"# File created at: {time.ctime()}\n"
+        + "".join(footer_lines)
+        + "# Cloud config created by cc-builder tool (github.com/canonical/cc-builder).\n"
+        + FOOTER_RULE
+    )
+
+
+def format_canonical_footer(content_hash: str) -> str:
+    """
+    The footer of canonical cloud-configs, which carries the hash of everything above it instead of the time the
+    file was written, so the same content always produces the same file.
+    """
+    return (
+        "\n"
+        + FOOTER_RULE
+        + f"{CONTENT_HASH_PREFIX}{content_hash}\n"
+        + "# Cloud config created by cc-builder tool (github.com/canonical/cc-builder).\n"
+        + FOOTER_RULE
+    )
+
+
+def _canonical_sort_key(item: Any, key: Optional[str]):
+    if key is not None and isinstance(item, dict):
+        item = item.get(key)
+    # str() keeps lists mixing scalars of several types, or holding [name, version] pairs, sortable
+    return str(item)
+
+
+def canonicalize(value: Any, key: Optional[str] = None) -> Any:
+    """
+    A copy of a cloud-config (or part of it, found under `key`) with every mapping's keys and the UNORDERED_LISTS
+    sorted, so cloud-configs with the same content are emitted identically however they were gathered.
+    """
+    if isinstance(value, dict):
+        return {item_key: canonicalize(value[item_key], item_key) for item_key in sorted(value, key=str)}
+    if isinstance(value, list):
+        items = [canonicalize(item) for item in value]
+        if key in UNORDERED_LISTS:
+            items.sort(key=lambda item: _canonical_sort_key(item, UNORDERED_LISTS[key]))
+        return items
+    return value
+
+
+def _emit_sections(cloud_config: Dict, stream: TextIO, yaml: YAML, header: str):
+    stream.write(header)
+    for key, value in cloud_config.items():
+        yaml.dump({key: value}, stream)
+        stream.write("\n")
+
+
+def emit_cloud_config(
+    cloud_config: Dict,
+    stream: TextIO,
+    yaml: Optional[YAML] = None,
+    header: str = CLOUD_CONFIG_HEADER,
+    canonical: bool = False,
+    footer_lines: Sequence[str] = (),
+):
+    """
+    Write a cloud-config to an open text stream, one top-level key at a time.
+
+    Every top-level key is dumped as its own YAML document body followed by a blank line, so the sections
+    of the generated file are visually separated. Each section is streamed straight into `stream`. The
+    `footer_lines`, comments such as the provenance of a capture, are added to the footer.
+
+    With `canonical`, the cloud-config is emitted in canonical order (see canonicalize) and the footer carries
+    the SHA-256 of the content above it instead of the time it was written, and no `footer_lines`.
+    """
+    yaml = yaml or get_yaml()
+    if not canonical:
+        _emit_sections(cloud_config, stream, yaml, header)
+        stream.write(format_footer(footer_lines))
+        return
+    # the hash covers the whole content, so it has to be emitted before any of it is written
+    body = io.StringIO()
+    _emit_sections(canonicalize(cloud_config), body, yaml, header)
+    content = body.getvalue()
+    stream.write(content)
+    stream.write(format_canonical_footer(hashlib.sha256(content.encode("utf-8")).hexdigest()))
+
+
+def default_file_mode(path: str) -> int:
+    """
+    The permissions a file written over `path` should get: those of the existing file, or what open() would create.
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        # mirror the permissions open() would have created the file with
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_cloud_config(
+    cloud_config: Dict,
+    output_path: str,
+    atomic: bool = True,
+    yaml: Optional[YAML] = None,
+    header: str = CLOUD_CONFIG_HEADER,
+    canonical: bool = False,
+    footer_lines: Sequence[str] = (),
+    overwrite: bool = True,
+) -> bool:
+    """
+    Write a cloud-config to `output_path` through a single file handle.
+
+    When atomic is True the file is written to a temporary file in the same directory which is then renamed
+    over `output_path`, so readers never observe a partially written cloud-config. See emit_cloud_config for
+    `footer_lines`.
+
+    Canonical cloud-configs (see emit_cloud_config) are the same file every time their content is the same, so
+    one identical to the existing `output_path` is not written at all, leaving the file and its modification time
+    untouched. Returns whether the file was written.
+
+    Unless `overwrite`, an existing `output_path` raises FileExistsError, except for a canonical cloud-config
+    identical to it, which is left untouched as above.
+    """
+    if canonical:
+        stream = io.StringIO()
+        emit_cloud_config(cloud_config, stream, yaml=yaml, header=header, canonical=True)
+        content = stream.getvalue()
+        if _read_existing(output_path) == content:
+            return False
+    if not overwrite and os.path.exists(output_path):
+        raise FileExistsError(f"{output_path} already exists with other content, use --force to overwrite it")
+
+    def emit(f: TextIO):
+        if canonical:
+            f.write(content)
+        else:
+            emit_cloud_config(cloud_config, f, yaml=yaml, header=header, footer_lines=footer_lines)
+
+    if not atomic:
+        with open(output_path, "w") as f:
+            emit(f)
+        return True
+
+    directory = os.path.dirname(os.path.abspath(output_path))
+    mode = default_file_mode(output_path)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(output_path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            emit(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return True
+
+
+def _read_existing(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except (FileNotFoundError, IsADirectoryError, UnicodeDecodeError):
+        return None
@@ -0,0 +1,68 @@
+import concurrent.futures
+import contextvars
+from typing import Dict, List, Optional, Sequence
+
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, HostAccessor, HostDirEntry
+
+DEFAULT_READ_WORKERS = 8
+
+
+def scan_files(directory: str, accessor: HostAccessor = LOCAL_HOST_ACCESSOR) -> List[HostDirEntry]:
+    """
+    List the regular files (or symlinks to them) in a directory on the host with a single directory scan.
+    A missing directory has no files.
+    """
+    try:
+        return [entry for entry in accessor.scan_dir(directory) if entry.is_file]
+    except FileNotFoundError:
+        return []
+
+
+def _read(path: str, accessor: HostAccessor, head_size: Optional[int]) -> Optional[str]:
+    try:
+        with accessor.open_file(path) as f:
+            return f.read(head_size) if head_size is not None else f.read()
+    except (OSError, UnicodeDecodeError):
+        # unreadable or not a text file
+        return None
+
+
+def read_files_concurrently(
+    paths: Sequence[str],
+    accessor: HostAccessor = LOCAL_HOST_ACCESSOR,
+    head_size: Optional[int] = None,
+    max_workers: int = DEFAULT_READ_WORKERS,
+) -> Dict[str, Optional[str]]:
+    """
+    Read several files from the host, or only their first head_size characters, mapping each path to its content.
+    Files that are missing, unreadable or not text map to None.
+
+    Reads run concurrently on a thread pool, which hides the latency of slow filesystems such as NFS-mounted home
+    directories. Hosts that batch requests read all files in one request instead (and always read whole files).
+    """
+    if not paths:
+        return {}
+    if accessor.batch_requests:
+        try:
+            contents = accessor.read_files(paths)
+        except OSError:
+            # one of the files cannot be read, read them one by one to find out which
+            return {path: _read(path, accessor, head_size) for path in paths}
+        if head_size is not None:
+            contents = {
+                path: content[:head_size] if content is not None else None for path, content in contents.items()
+            }
+        return contents
+    if len(paths) == 1:
+        return {paths[0]: _read(paths[0], accessor, head_size)}
+    # each read runs in a copy of the caller's context, so profiling counts it against the caller's phase
+    contexts = [contextvars.copy_context() for _ in paths]
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(max_workers, len(paths)), thread_name_prefix="cc-builder-read"
+    ) as executor:
+        return dict(
+            zip(
+                paths,
+                executor.map(lambda path, context: context.run(_read, path, accessor, head_size), paths, contexts),
+            )
+        )
@@ -0,0 +1,231 @@
+import concurrent.futures
+import dataclasses
+import os
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+from cc_builder.console_output import print_error, print_info, print_warning
+from cc_builder.defaults import DEFAULT_FLEET_PARALLELISM, DEFAULT_GATHER_TIMEOUT, DEFAULT_JOBS
+from cc_builder.host_accessor import HostAccessor, SSHConnectionPool
+from cc_builder.profiling import Profiler, measure
+from cc_builder.user_database import UserSelection
+
+
+@dataclasses.dataclass
+class FleetHost:
+    target: str  # what ssh connects to, e.g. "ubuntu@10.0.0.5"
+    port: Optional[int] = None
+
+    @property
+    def label(self) -> str:
+        """
+        A filesystem friendly name for the host, used to name its cloud-config, e.g. "ubuntu@10.0.0.5_2222". The
+        user is kept so the same machine captured as different users gets a cloud-config per user.
+        """
+        label = self.target
+        if self.port is not None:
+            label += f"_{self.port}"
+        return re.sub(r"[^A-Za-z0-9@._-]", "_", label)
+
+
+@dataclasses.dataclass
+class FleetHostResult:
+    host: FleetHost
+    duration: float
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    inventory_path: Optional[str] = None
+    profiler: Optional[Profiler] = None  # the host's timings, when profiling
+    unchanged: bool = False  # the canonical cloud-config was identical to the existing one, which was kept
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+def parse_inventory_line(line: str) -> Optional[FleetHost]:
+    """
+    Parse a single inventory line of the form [user@]host[:port]. Blank lines and #-comments yield None.
+    """
+    line = line.split("#", 1)[0].strip()
+    if not line:
+        return None
+    target, port = line, None
+    # only treat a trailing :NUMBER as a port so bare IPv6 addresses are left alone
+    match = re.fullmatch(r"(.+?):(\d+)", line)
+    if match and match.group(1).count(":") == 0:
+        target, port = match.group(1), int(match.group(2))
+    return FleetHost(target=target, port=port)
+
+
+def read_inventory(inventory_path: str) -> List[FleetHost]:
+    """
+    Read an inventory file listing one host per line as [user@]host[:port].
+    """
+    with open(inventory_path, "r") as inventory_file:
+        hosts = [parse_inventory_line(line) for line in inventory_file]
+    return [host for host in hosts if host is not None]
+
+
+def check_unique_labels(hosts: List[FleetHost]):
+    """
+    Raise ValueError if several hosts would write to the same files, e.g. a host listed twice.
+    """
+    targets: Dict[str, List[str]] = {}
+    for host in hosts:
+        targets.setdefault(host.label, []).append(host.target if host.port is None else f"{host.target}:{host.port}")
+    duplicates = [f"{label} ({', '.join(listed)})" for label, listed in targets.items() if len(listed) > 1]
+    if duplicates:
+        raise ValueError(f"Several inventory entries share the output name {'; '.join(duplicates)}")
+
+
+def capture_host(
+    host: FleetHost,
+    accessor: HostAccessor,
+    output_dir: str,
+    gather_public_keys: bool = False,
+    password: Optional[str] = None,
+    disabled_configs: List[str] = [],
+    jobs: int = DEFAULT_JOBS,
+    gather_timeout: float = DEFAULT_GATHER_TIMEOUT,
+    force: bool = False,
+    pin_snap_channels: bool = False,
+    users: Optional[UserSelection] = None,
+    profile: bool = False,
+    write_inventory: bool = False,
+    inventory_format: str = "jsonl",
+    canonical: bool = False,
+    base_manifest: Optional[str] = None,
+    drop_dependencies: bool = False,
+) -> FleetHostResult:
+    """
+    Gather and write the cloud-config of a single host. Failures are captured in the result instead of raised.
+    With `profile`, the result carries the timings of the capture's phases. With `write_inventory`, the gathered
+    data is also written to an inventory file next to the cloud-config. With `canonical`, the cloud-config is
+    written in canonical form, and only if it changed, which needs no `force`.
+    """
+    # imported on first capture so `cc-builder --help` does not load the gathering and emitting code
+    from cc_builder.emitter import write_cloud_config
+    from cc_builder.generator import gather_cloud_config, get_current_user
+    from cc_builder.inventory import InventoryWriter
+
+    start = time.monotonic()
+    output_path = os.path.join(output_dir, f"{host.label}.yaml")
+    profiler = Profiler(host.target) if profile else None
+    inventory_path = os.path.join(output_dir, f"{host.label}.inventory.{inventory_format}") if write_inventory else None
+    inventory = None
+    try:
+        # a canonical cloud-config identical to the existing one needs no --force, which is only known once gathered
+        for path in (None if canonical else output_path, inventory_path):
+            if path is not None and os.path.exists(path) and not force:
+                raise FileExistsError(f"{path} already exists, use --force to overwrite it")
+        check_connection = getattr(accessor, "check_connection", None)
+        if check_connection is not None:
+            check_connection()
+        current_user = get_current_user(accessor)
+        if inventory_path is not None:
+            inventory = InventoryWriter(inventory_path, inventory_format, host=host.target, user=current_user)
+        cloud_config = gather_cloud_config(
+            current_user,
+            accessor=accessor,
+            gather_public_keys=gather_public_keys,
+            password=password,
+            disabled_configs=disabled_configs,
+            jobs=jobs,
+            gather_timeout=gather_timeout,
+            pin_snap_channels=pin_snap_channels,
+            users=users,
+            profiler=profiler,
+            inventory=inventory,
+            base_manifest=base_manifest,
+            drop_dependencies=drop_dependencies,
+        )
+        with measure(profiler, "", "emit"):
+            written = write_cloud_config(cloud_config, output_path, canonical=canonical, overwrite=force)
+        if inventory is not None:
+            inventory.close()
+    except Exception as e:  # pylint: disable=broad-except
+        if inventory is not None:
+            inventory.discard()
+        return FleetHostResult(
+            host=host, duration=time.monotonic() - start, error=f"{type(e).__name__}: {e}", profiler=profiler
+        )
+    return FleetHostResult(
+        host=host,
+        duration=time.monotonic() - start,
+        output_path=output_path,
+        inventory_path=inventory_path,
+        profiler=profiler,
+        unchanged=not written,
+    )
+
+
+def capture_fleet(
+    hosts: List[FleetHost],
+    output_dir: str,
+    accessor_factory: Callable[[FleetHost], HostAccessor],
+    parallelism: int = DEFAULT_FLEET_PARALLELISM,
+    **capture_kwargs,
+) -> List[FleetHostResult]:
+    """
+    Capture a cloud-config for every host, `parallelism` hosts at a time.
+
+    `accessor_factory` creates the HostAccessor used to reach each host, e.g. SSHConnectionPool.accessor for
+    real hosts or a CannedHostAccessor for a local stand-in. Results are returned in inventory order. Raises
+    ValueError if two hosts would share a cloud-config, see check_unique_labels.
+    """
+    check_unique_labels(hosts)
+    os.makedirs(output_dir, exist_ok=True)
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=parallelism, thread_name_prefix="cc-builder-fleet"
+    ) as executor:
+        futures = [
+            executor.submit(capture_host, host, accessor_factory(host), output_dir, **capture_kwargs) for host in hosts
+        ]
+        return [future.result() for future in futures]
+
+
+def capture_fleet_over_ssh(
+    hosts: List[FleetHost],
+    output_dir: str,
+    parallelism: int = DEFAULT_FLEET_PARALLELISM,
+    ssh_options: List[str] = [],
+    connect_timeout: int = 10,
+    **capture_kwargs,
+) -> List[FleetHostResult]:
+    with SSHConnectionPool(
+        max_connections=parallelism, ssh_options=ssh_options, connect_timeout=connect_timeout
+    ) as pool:
+        return capture_fleet(
+            hosts,
+            output_dir,
+            accessor_factory=lambda host: pool.accessor(host.target, host.port),
+            parallelism=parallelism,
+            **capture_kwargs,
+        )
+
+
+def print_fleet_summary(results: List[FleetHostResult]):
+    """
+    Print per-host timings followed by a summary of the failed hosts.
+    """
+    print_info("\nPer-host capture times:", ignore_quiet=True)
+    width = max((len(result.host.target) for result in results), default=0)
+    for result in sorted(results, key=lambda result: result.duration, reverse=True):
+        status = ("unchanged" if result.unchanged else "ok") if result.succeeded else "FAILED"
+        print_info(f"  {result.host.target:<{width}}  {result.duration:8.2f}s  {status}", ignore_quiet=True)
+
+    failures = [result for result in results if not result.succeeded]
+    succeeded = len(results) - len(failures)
+    total = sum(result.duration for result in results)
+    unchanged = sum(result.unchanged for result in results)
+    print_info(
+        f"\nCaptured {succeeded}/{len(results)} hosts ({total:.2f}s of host time in total)"
+        + (f", {unchanged} cloud-configs unchanged" if unchanged else ""),
+        ignore_quiet=True,
+    )
+    if failures:
+        print_warning(f"{len(failures)} host(s) failed:", ignore_quiet=True)
+        for result in failures:
+            print_error(f"  {result.host.target}: {result.error}")
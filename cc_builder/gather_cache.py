@@ -0,0 +1,183 @@
+import dataclasses
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, List, Optional, Tuple
+
+from cc_builder.console_output import print_debug, print_info
+from cc_builder.custom_types import BaseConfig
+from cc_builder.host_accessor import HostAccessor
+from cc_builder.inventory import from_plain, to_plain
+
+# Bump whenever the gathered dataclasses change shape so entries written by older versions are never loaded
+CACHE_FORMAT_VERSION = 4
+DEFAULT_CACHE_SIZE_LIMIT = 32 * 1024 * 1024
+CACHE_ENTRY_SUFFIX = ".json"
+# entries of older versions of cc-builder, which are never read and only removed
+LEGACY_ENTRY_SUFFIXES = (".pickle",)
+
+
+def default_cache_dir() -> str:
+    # only needed when the cache is actually used
+    import platformdirs
+
+    return os.path.join(platformdirs.user_cache_dir("cc-builder"), "gather")
+
+
+@dataclasses.dataclass
+class GatherCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stale: int = 0  # misses caused by an entry whose input files have changed since it was stored
+    stores: int = 0
+    evictions: int = 0
+
+
+@dataclasses.dataclass
+class GatherCacheLookup:
+    key: str
+    fingerprints: Any
+    config: Optional[BaseConfig] = None  # the cached gathered config on a hit
+
+    @property
+    def hit(self) -> bool:
+        return self.config is not None
+
+
+class GatherCache:
+    """
+    On-disk cache of gathered module configs, so reruns on an unchanged host skip the gathering.
+
+    An entry holds a module's config after gather() together with fingerprints (mtime, inode and size) of the
+    module's cache inputs (see BaseConfig.resolve_cache_inputs) taken before gathering, and is only used while every
+    fingerprint still matches. Entries are evicted least recently used first once the cache grows past size_limit
+    bytes.
+
+    Entries are JSON, written as in inventories (see inventory.to_plain), so a planted entry can at most feed
+    wrong data into a cloud-config rather than run code. Entries owned by another user are never used.
+    """
+
+    def __init__(self, directory: Optional[str] = None, size_limit: int = DEFAULT_CACHE_SIZE_LIMIT):
+        self.directory = directory or default_cache_dir()
+        self.size_limit = size_limit
+        self.stats = GatherCacheStats()
+
+    def _fingerprint_inputs(self, config: BaseConfig, accessor: HostAccessor) -> List:
+        fingerprints: List[List[Any]] = []
+        for path in config.resolve_cache_inputs(accessor):
+            path = accessor.expanduser(path)
+            if not path.endswith("/"):
+                fingerprints.append([path, accessor.fingerprint(path)])
+                continue
+            # a directory's own mtime only changes when entries are added or removed, so check every entry too
+            directory_fingerprint = accessor.fingerprint(path)
+            entries = []
+            if directory_fingerprint is not None:
+                entries = [[name, accessor.fingerprint(path + name)] for name in sorted(accessor.list_dir(path))]
+            fingerprints.append([path, directory_fingerprint, entries])
+        # round-trip through JSON so fingerprints compare equal to the ones loaded back from an entry
+        return json.loads(json.dumps(fingerprints))
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_ENTRY_SUFFIX)
+
+    def lookup(self, name: str, config: BaseConfig, accessor: HostAccessor) -> Optional[GatherCacheLookup]:
+        """
+        Look up the gathered version of a not yet gathered `config`. Returns None if the module or host cannot be
+        cached at all, otherwise a lookup to pass to store() after gathering on a miss.
+        """
+        identity = accessor.cache_identity()
+        if identity is None or not config.cache_inputs:
+            return None
+        # the config's fields before gathering are the options it was created with, e.g. the user for ssh
+        key_source = [CACHE_FORMAT_VERSION, identity, name, type(config).__qualname__, repr(config)]
+        key = hashlib.sha256(json.dumps(key_source).encode()).hexdigest()
+        lookup = GatherCacheLookup(key=key, fingerprints=self._fingerprint_inputs(config, accessor))
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r") as entry_file:
+                if os.fstat(entry_file.fileno()).st_uid != os.getuid():
+                    print_debug(f"Ignoring gather cache entry {entry_path}, it is owned by another user")
+                    self.stats.misses += 1
+                    return lookup
+                entry = json.load(entry_file)
+            # only rebuild the config of an entry that is still current
+            current = entry["fingerprints"] == lookup.fingerprints
+            cached_config = from_plain(type(config), entry["config"]) if current else None
+        except FileNotFoundError:
+            self.stats.misses += 1
+            return lookup
+        except Exception as e:  # pylint: disable=broad-except
+            # written by an incompatible version of cc-builder or truncated, drop it
+            print_debug(f"Discarding unreadable gather cache entry {entry_path}: {e}")
+            self._remove(entry_path)
+            self.stats.misses += 1
+            return lookup
+
+        if cached_config is None:
+            self.stats.misses += 1
+            self.stats.stale += 1
+            return lookup
+        # mark the entry as recently used for eviction
+        os.utime(entry_path)
+        self.stats.hits += 1
+        lookup.config = cached_config
+        return lookup
+
+    def store(self, lookup: GatherCacheLookup, config: BaseConfig):
+        """
+        Store a config gathered after a missed lookup.
+        """
+        # only readable by the user, entries hold e.g. the authorized keys
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=f".{lookup.key}.", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w") as entry_file:
+                json.dump({"fingerprints": lookup.fingerprints, "config": to_plain(config)}, entry_file)
+            os.replace(temp_path, self._entry_path(lookup.key))
+        except BaseException:
+            self._remove(temp_path)
+            raise
+        self.stats.stores += 1
+        self.evict()
+
+    def _entries(self, suffixes: Tuple[str, ...] = (CACHE_ENTRY_SUFFIX,)) -> List[os.DirEntry]:
+        try:
+            with os.scandir(self.directory) as entries:
+                return [entry for entry in entries if entry.name.endswith(suffixes)]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in size_limit.
+        """
+        for entry in self._entries(LEGACY_ENTRY_SUFFIXES):
+            self._remove(entry.path)
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime_ns)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.size_limit:
+                break
+            total -= entry.stat().st_size
+            self._remove(entry.path)
+            self.stats.evictions += 1
+
+    def print_stats(self):
+        entries = self._entries()
+        size = sum(entry.stat().st_size for entry in entries)
+        print_info(
+            f"Gather cache: {self.stats.hits} hits, {self.stats.misses} misses ({self.stats.stale} stale), "
+            f"{self.stats.stores} stored, {self.stats.evictions} evicted. "
+            f"{len(entries)} entries using {size} of {self.size_limit} bytes in {self.directory}",
+            ignore_quiet=True,
+        )
@@ -1,29 +1,44 @@
+import copy
 import logging
 import os
-import subprocess
-import time
 from io import StringIO
-from typing import Dict, List
-
-import click
-import yaml
-from rich.console import Console
-from rich.syntax import Syntax
-from ruamel.yaml import YAML
+from typing import Any, Dict, List, Optional
 
 from cc_builder.console_output import print_debug, print_error, print_info, print_module_header, print_warning
-from cc_builder.custom_types import BaseConfig
-from cc_builder.modules.apt import AptConfig
-from cc_builder.modules.hostname import HostnameConfig
-from cc_builder.modules.snap import SnapConfig
-from cc_builder.modules.ssh import SSHConfig
-from cc_builder.modules.user import UserConfig
-
-console = Console(color_system="auto")
+from cc_builder.custom_types import BaseConfig, ModuleOptions
+from cc_builder.defaults import DEFAULT_GATHER_TIMEOUT, DEFAULT_JOBS
+from cc_builder.emitter import custom_yaml, write_cloud_config
+from cc_builder.gather_cache import GatherCache, GatherCacheLookup
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, HostAccessor, MemoizingHostAccessor
+from cc_builder.incremental import (
+    DELTA_HEADER,
+    PreviousCloudConfig,
+    Provenance,
+    diff_cloud_configs,
+    select_reusable_sections,
+)
+from cc_builder.inventory import Inventory, ModuleWriter
+from cc_builder.modules import get_module_names, load_module_class
+from cc_builder.profiling import Profiler, measure
+from cc_builder.scheduler import gather_configs
+from cc_builder.user_database import UserSelection, load_user_database
+
 LOG = logging.getLogger()
+_console = None
+
+
+def get_console():
+    """
+    The rich Console interactive mode prints to. rich is only imported when it is first needed, so
+    non-interactive runs never pay for importing it.
+    """
+    global _console
+    if _console is None:
+        from rich.console import Console
+
+        _console = Console(color_system="auto")
+    return _console
 
-custom_yaml = YAML()
-custom_yaml.width = 9999
 
 def merge_new_config_into_existing_config(existing_config: Dict, new_config: Dict) -> Dict:
     """
@@ -42,10 +57,40 @@ def merge_new_config_into_existing_config(existing_config: Dict, new_config: Dic
     return existing_config
 
 
+def merge_users(existing_users: List[Dict], new_users: List[Dict]) -> List[Dict]:
+    """
+    Merge the users entries generated by a module into those of earlier modules, matching them by name. Users
+    that are new are appended.
+    """
+    entries = {user["name"]: user for user in existing_users}
+    for user in new_users:
+        if user["name"] in entries:
+            entries[user["name"]].update(user)
+        else:
+            existing_users.append(user)
+            entries[user["name"]] = user
+    return existing_users
+
+
+def merge_module_cloud_config(cloud_config: Dict, cc_dict: Dict) -> Dict:
+    """
+    Merge the cloud-config portion generated by a module into those of the modules before it. The users entries of
+    the user and ssh modules are merged by name, every other key is taken over as is.
+    """
+    if "users" in cc_dict and "users" in cloud_config:
+        merge_users(cloud_config["users"], cc_dict.pop("users"))
+    cloud_config.update(cc_dict)
+    return cloud_config
+
+
 def print_yaml_dict(yaml_dict: Dict, header: str):
     """
     Print a dictionary as YAML.
     """
+    import yaml
+    from rich.syntax import Syntax
+
+    console = get_console()
     yaml_str = yaml.dump(yaml_dict, default_flow_style=False, width=200)
     syntax = Syntax(yaml_str, "yaml", theme="monokai", line_numbers=True)
     # print header detailing what the yaml is for (i.e. "YAML generated for user module")
@@ -60,36 +105,214 @@ def print_yaml_dict(yaml_dict: Dict, header: str):
     )
 
 
+def get_current_user(accessor: HostAccessor = LOCAL_HOST_ACCESSOR) -> str:
+    return accessor.get_user()
+
+
+def get_module_info(disabled_configs: List[str]) -> List[Dict]:
+    """
+    The modules in output order and whether each is disabled. Their config classes are loaded with
+    load_module_class once they are actually gathered.
+    """
+    return [{"name": name, "disabled": (name in disabled_configs)} for name in get_module_names()]
+
+
+def gather_cloud_config(
+    current_user: str,
+    accessor: HostAccessor = LOCAL_HOST_ACCESSOR,
+    gather_public_keys: bool = False,
+    password: Optional[str] = None,
+    disabled_configs: List[str] = [],
+    jobs: int = DEFAULT_JOBS,
+    gather_timeout: float = DEFAULT_GATHER_TIMEOUT,
+    cache: Optional[GatherCache] = None,
+    previous: Optional[PreviousCloudConfig] = None,
+    pin_snap_channels: bool = False,
+    users: Optional[UserSelection] = None,
+    profiler: Optional[Profiler] = None,
+    inventory: Optional[ModuleWriter] = None,
+    base_manifest: Optional[str] = None,
+    drop_dependencies: bool = False,
+    provenance: Optional[Provenance] = None,
+) -> Dict:
+    """
+    Gather every enabled module from the host behind `accessor` without prompting and merge the
+    generated cloud-config portions into a single dict. Modules found in `cache`, or whose sections can be
+    taken over from a `previous` cloud-config, are not gathered again. The user and ssh modules capture the
+    `users` selected instead of only current_user. The prefetch and each module's gather() and
+    generate_cloud_config() are measured with `profiler`, if given. Every gathered (or cached) module is also
+    written to `inventory`, if given, in output order. `provenance`, if given, gets the options of every module
+    in the cloud-config, see select_reusable_sections.
+    """
+    host_accessor = accessor
+    # Requests made by several modules only reach the host once per run
+    accessor = MemoizingHostAccessor(accessor)
+    selected_users = None
+    if users is not None:
+        selected_users = users.select(load_user_database(accessor))
+        print_debug(f"Capturing {len(selected_users)} users: {', '.join(selected_users)}")
+    options = ModuleOptions(
+        current_user=current_user,
+        gather_public_keys=gather_public_keys,
+        password=password,
+        pin_snap_channels=pin_snap_channels,
+        selected_users=selected_users,
+        base_manifest=base_manifest,
+        drop_dependencies=drop_dependencies,
+    )
+    cloud_config: Dict = {}
+    configs = []
+    for module in get_module_info(disabled_configs):
+        if module["disabled"]:
+            print_debug(f"{module['name'].capitalize()} config disabled")
+        else:
+            configs.append((module["name"], load_module_class(module["name"]).from_options(options)))
+
+    reused_sections = {}
+    if previous is not None:
+        reused_sections = select_reusable_sections(configs, host_accessor, previous)
+
+    cache_lookups: Dict[str, GatherCacheLookup] = {}
+    if cache is not None:
+        for name, config in configs:
+            if name in reused_sections:
+                continue
+            # fingerprint the files before gathering, so files changing while gathering invalidate the entry
+            lookup = cache.lookup(name, config, host_accessor)
+            if lookup is not None:
+                cache_lookups[name] = lookup
+    # the configs of the cache hits
+    cached_configs = {name: lookup.config for name, lookup in cache_lookups.items() if lookup.config is not None}
+    for name in cached_configs:
+        print_debug(f"Using cached {name} config")
+    configs_to_gather = [
+        (name, config) for name, config in configs if name not in cached_configs and name not in reused_sections
+    ]
+
+    with measure(profiler, "", "prefetch"):
+        accessor.prefetch(
+            commands=[command for _, config in configs_to_gather for command in config.host_commands],
+            files=[accessor.expanduser(path) for _, config in configs_to_gather for path in config.host_files],
+        )
+
+    # Gather configs (concurrently if jobs > 1), then merge them in module order so the output is
+    # identical to gathering them one after another
+    gathered_configs = dict(
+        gather_configs(
+            configs_to_gather,
+            jobs=jobs,
+            timeout=gather_timeout,
+            accessor=accessor,
+            available=cached_configs,
+            profiler=profiler,
+        )
+    )
+    if cache is not None:
+        for name, config in gathered_configs.items():
+            if name in cache_lookups:
+                cache.store(cache_lookups[name], config)
+    gathered_configs.update(cached_configs)
+    for name, config in configs:
+        if name in reused_sections:
+            # no other module writes to these keys, see select_reusable_sections
+            merge_new_config_into_existing_config(cloud_config, reused_sections[name])
+            if provenance is not None:
+                provenance.add_module(name, config)
+            continue
+        if name not in gathered_configs:  # timed out, or depends on a module that did
+            continue
+        if provenance is not None:
+            provenance.add_module(name, gathered_configs[name])
+        if inventory is not None:
+            inventory.write_module(name, gathered_configs[name])
+        with measure(profiler, name, "generate"):
+            cc_dict = gathered_configs[name].generate_cloud_config()
+        merge_module_cloud_config(cloud_config, cc_dict)
+    return cloud_config
+
+
+def render_cloud_config(
+    inventory: Inventory,
+    disabled_configs: List[str] = [],
+    options: Optional[Dict[str, Any]] = None,
+    profiler: Optional[Profiler] = None,
+) -> Dict:
+    """
+    Generate the cloud-config of a capture loaded from its inventory without gathering anything, leaving out the
+    `disabled_configs`. `options` maps ModuleOptions attributes to the values to render with instead of those of
+    the capture, e.g. {"current_user": "ubuntu"}. The inventory's configs are not changed, so it can be rendered
+    again with other options.
+    """
+    cloud_config: Dict = {}
+    for name, config in inventory.configs:
+        if name in disabled_configs:
+            print_debug(f"{name.capitalize()} config disabled")
+            continue
+        if options:
+            config = copy.copy(config)
+            config.apply_options(options)
+        with measure(profiler, name, "generate"):
+            cc_dict = config.generate_cloud_config()
+        merge_module_cloud_config(cloud_config, cc_dict)
+    return cloud_config
+
+
 def create_cloud_init_config(
     output_path: str,
     interactive: bool = False,
     # hostname_enabled: bool = False,
     gather_public_keys: bool = False,
-    password: str = None,
+    password: Optional[str] = None,
     disabled_configs: List[str] = [],
     rename_to_ubuntu_user: bool = False,
+    jobs: int = DEFAULT_JOBS,
+    gather_timeout: float = DEFAULT_GATHER_TIMEOUT,
+    accessor: HostAccessor = LOCAL_HOST_ACCESSOR,
+    cache: Optional[GatherCache] = None,
+    previous: Optional[PreviousCloudConfig] = None,
+    provenance: bool = False,
+    delta: bool = False,
+    pin_snap_channels: bool = False,
+    users: Optional[UserSelection] = None,
+    profiler: Optional[Profiler] = None,
+    inventory: Optional[ModuleWriter] = None,
+    canonical: bool = False,
+    base_manifest: Optional[str] = None,
+    drop_dependencies: bool = False,
+    overwrite: bool = True,
     **kwargs,
 ):
+    # the time and options of the gathering only go into the footer when asked for, or when the output may be the
+    # --since of a later run. Canonical cloud-configs are the same file for the same content, so they never carry them
+    module_provenance = Provenance() if (provenance or previous is not None) and not canonical else None
+
     # Get current user
-    result = subprocess.run("whoami", shell=True, stdout=subprocess.PIPE, text=True)
-    current_user = result.stdout.strip()
-    original_current_user = current_user  # Keep track of original user
+    current_user = get_current_user(accessor)
 
     # print_debug("Initializing all cc-builder modules")
 
     # Initialize module information
-    module_info = [
-        {"name": "user", "class": UserConfig, "disabled": ("user" in disabled_configs)},
-        {"name": "ssh", "class": SSHConfig, "disabled": ("ssh" in disabled_configs)},
-        {"name": "apt", "class": AptConfig, "disabled": ("apt" in disabled_configs)},
-        {"name": "snap", "class": SnapConfig, "disabled": ("snap" in disabled_configs)},
-        {"name": "hostname", "class": HostnameConfig, "disabled": ("hostname" in disabled_configs)},
-    ]
+    module_info = get_module_info(disabled_configs)
 
     # Prepare to collect configurations
     cloud_config: Dict = {}
 
     if interactive:
+        # only interactive mode prompts and renders YAML, keep these imports off the non-interactive path
+        import click
+        from rich.syntax import Syntax
+
+        console = get_console()
+        options = ModuleOptions(
+            current_user=current_user,
+            gather_public_keys=gather_public_keys,
+            password=password,
+            pin_snap_channels=pin_snap_channels,
+            rename_to_ubuntu_user=rename_to_ubuntu_user,
+            base_manifest=base_manifest,
+            drop_dependencies=drop_dependencies,
+        )
+        gathered_configs: Dict[str, BaseConfig] = {}
 
         # Interactive mode: prompt the user for each module
         print_info("Interactive mode enabled.", ignore_quiet=True)
@@ -105,42 +328,26 @@ def create_cloud_init_config(
             )
             if gather_module:
                 module["disabled"] = False
+                config_class = load_module_class(module["name"])
 
-                # Gather config immediately
-                if module["name"] == "ssh":
-                    # For SSH module, ask about gathering public keys
-                    default_public_keys = gather_public_keys
-                    gather_public_keys = click.confirm(
-                        "Would you like to gather public SSH keys?", default=default_public_keys
-                    )
-                    config = module["class"](current_user=current_user, gather_public_keys=gather_public_keys)
-                elif module["name"] == "user":
-                    # For User module, ask about renaming to 'ubuntu' user
-                    default_rename = rename_to_ubuntu_user
-                    rename_to_ubuntu_user = click.confirm(
-                        "Would you like to rename the user to the default 'ubuntu' username?", default=default_rename
-                    )
-                    if rename_to_ubuntu_user:
-                        current_user = "ubuntu"
-                    else:
-                        current_user = original_current_user
-                    # Ask about password
-                    set_password = click.confirm(
-                        "Would you like to set a password for the user? WARNING: This is insecure and stored in plaintext in the cloud-init config.",
-                        default=bool(password),
-                    )
-                    if set_password:
-                        password = click.prompt("Please enter the password", hide_input=True, confirmation_prompt=True)
-                    else:
-                        password = None
-                    config = module["class"](name=current_user, plaintext_password=password)
-                else:
-                    config = module["class"]()
-
-                # Gather data for the config
-                config.gather()
+                # Ask for the module's options, they are shared with the modules prompted after it
+                config_class.prompt_options(options)
+                config = config_class.from_options(options)
+                # Gather data for the config, modules are prompted in order so only dependencies written before it
+                # are available
+                config.use_dependencies(
+                    {name: gathered_configs[name] for name in config.depends_on if name in gathered_configs}
+                )
+                with measure(profiler, module["name"], "gather"):
+                    config.gather(accessor)
+                gathered_configs[module["name"]] = config
+                if module_provenance is not None:
+                    module_provenance.add_module(module["name"], config)
+                if inventory is not None:
+                    inventory.write_module(module["name"], config)
                 # Generate dict representing cloud config yaml for the config
-                cc_dict = config.generate_cloud_config()
+                with measure(profiler, module["name"], "generate"):
+                    cc_dict = config.generate_cloud_config()
 
                 # Output the YAML portion generated by this module
                 yaml_buffer = StringIO()
@@ -159,12 +366,8 @@ def create_cloud_init_config(
                 )
                 console.print(syntax)
 
-                # If the user config already exists, merge it with the new user config
-                if "users" in cc_dict and "users" in cloud_config:
-                    cloud_config["users"][0] = {**cloud_config["users"][0], **cc_dict["users"][0]}
-                    del cc_dict["users"]
-                # Merge cc_dict into cloud_config
-                cloud_config.update(cc_dict)
+                # Merge cc_dict into cloud_config, merging the users of the user and ssh configs
+                merge_module_cloud_config(cloud_config, cc_dict)
 
             else:
                 module["disabled"] = True
@@ -172,55 +375,54 @@ def create_cloud_init_config(
 
     else:
         # Non-interactive mode: use disabled_configs as given
-        for module in module_info:
-            if module["disabled"]:
-                print_debug(f"{module['name'].capitalize()} config disabled")
-            else:
-                # Gather config
-                if module["name"] == "ssh":
-                    config = module["class"](current_user=current_user, gather_public_keys=gather_public_keys)
-                elif module["name"] == "user":
-                    config = module["class"](name=current_user, plaintext_password=password)
-                else:
-                    config = module["class"]()
-
-                config.gather()
-                cc_dict = config.generate_cloud_config()
-                if "users" in cc_dict and "users" in cloud_config:
-                    cloud_config["users"][0] = {**cloud_config["users"][0], **cc_dict["users"][0]}
-                    del cc_dict["users"]
-                cloud_config.update(cc_dict)
+        cloud_config = gather_cloud_config(
+            current_user,
+            accessor=accessor,
+            gather_public_keys=gather_public_keys,
+            password=password,
+            disabled_configs=disabled_configs,
+            jobs=jobs,
+            gather_timeout=gather_timeout,
+            cache=cache,
+            previous=previous,
+            pin_snap_channels=pin_snap_channels,
+            users=users,
+            profiler=profiler,
+            inventory=inventory,
+            base_manifest=base_manifest,
+            drop_dependencies=drop_dependencies,
+            provenance=module_provenance,
+        )
 
     print_info("\nDone gathering configurations for all modules", ignore_quiet=True)
 
-    with open(f"{output_path}", "w") as f:
-        f.write("#cloud-config\n\n")
-
-    with open(f"{output_path}", "a") as f:
-        individual_configs = []
-        for key in cloud_config:
-            individual_configs.append({key: cloud_config[key]})
-        for config in individual_configs:
-            yaml_buffer = StringIO()
-            custom_yaml.dump(
-                data=config,
-                stream=yaml_buffer,
-            )
-            yaml_str = yaml_buffer.getvalue()
-            # yaml_str = yaml_str.replace("$USER", current_user)
-            f.write(yaml_str)
-            f.write("\n")
-
-    # Leave footer at the end of the file
-    with open(f"{output_path}", "a") as f:
-        f.write("\n")
-        f.write("#" * 80 + "\n")
-        # Add timestamp to end of file
-        f.write(f"# File created at: {time.ctime()}\n")
-        f.write("# Cloud config created by cc-builder tool (github.com/canonical/cc-builder).\n")
-        f.write("#" * 80 + "\n")
-
     # if path already exists, print a warning
-    if os.path.exists(f"{output_path}"):
+    if overwrite and os.path.exists(f"{output_path}"):
         print_warning(f"Overwriting existing file: {output_path}", ignore_quiet=True)
-    print_info(f"Wrote cloud-init config to file: {output_path}", ignore_quiet=True)
+    if delta and previous is not None:
+        with measure(profiler, "", "emit"):
+            changes = diff_cloud_configs(previous.cloud_config, cloud_config)
+            written = write_cloud_config(
+                {"since": previous.path, "changes": changes},
+                output_path,
+                header=DELTA_HEADER,
+                canonical=canonical,
+                overwrite=overwrite,
+            )
+        if written:
+            print_info(f"Wrote {len(changes)} changes since {previous.path} to file: {output_path}", ignore_quiet=True)
+        else:
+            print_info(f"Changes since {previous.path} are unchanged, left {output_path} as it is", ignore_quiet=True)
+        return
+    with measure(profiler, "", "emit"):
+        written = write_cloud_config(
+            cloud_config,
+            output_path,
+            canonical=canonical,
+            footer_lines=module_provenance.footer_lines() if module_provenance is not None else (),
+            overwrite=overwrite,
+        )
+    if written:
+        print_info(f"Wrote cloud-init config to file: {output_path}", ignore_quiet=True)
+    else:
+        print_info(f"Cloud-init config is unchanged, left {output_path} as it is", ignore_quiet=True)
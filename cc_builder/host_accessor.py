@@ -0,0 +1,1045 @@
+import dataclasses
+import errno
+import grp
+import io
+import json
+import os
+import posixpath
+import pwd
+import shlex
+import shutil
+import socket
+import stat as stat_module
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Sequence, TextIO, Tuple, Union, cast
+
+from cc_builder.profiling import count_reads, record_subprocess
+
+
+@dataclasses.dataclass
+class CommandResult:
+    returncode: int
+    stdout: str
+    stderr: str = ""
+
+
+# (mtime in ns, inode, size) of a file, see HostAccessor.fingerprint
+FileFingerprint = Tuple[int, int, int]
+
+
+def stat_fingerprint(path: str) -> Optional[FileFingerprint]:
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+
+@dataclasses.dataclass
+class HostDirEntry:
+    name: str
+    path: str
+    is_file: bool
+    fingerprint: Optional[FileFingerprint] = None  # only known on hosts that support HostAccessor.fingerprint
+
+
+def scan_local_dir(directory: str, path: str) -> List[HostDirEntry]:
+    """
+    Scan the local directory `directory` with a single os.scandir, reporting the entries under the host path `path`.
+    """
+    entries = []
+    with os.scandir(directory) as scanned:
+        for entry in scanned:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # dangling symlink
+                entries.append(HostDirEntry(name=entry.name, path=posixpath.join(path, entry.name), is_file=False))
+                continue
+            entries.append(
+                HostDirEntry(
+                    name=entry.name,
+                    path=posixpath.join(path, entry.name),
+                    is_file=stat_module.S_ISREG(stat.st_mode),
+                    fingerprint=(stat.st_mtime_ns, stat.st_ino, stat.st_size),
+                )
+            )
+    return entries
+
+
+# how the passwd and group databases are read from a host, see HostAccessor.read_user_database
+USER_DATABASE_COMMANDS = ("getent passwd", "getent group")
+USER_DATABASE_FILES = ("/etc/passwd", "/etc/group")
+
+
+class HostConnectionError(Exception):
+    """
+    Raised when a remote host cannot be reached.
+    """
+
+
+class HostAccessor:
+    """
+    Everything the gatherers need from the host being captured: running commands and reading files.
+
+    Gatherers never touch subprocess or the local filesystem directly, so the same gather code can inspect
+    the local machine, a remote host over SSH or a canned stand-in.
+    """
+
+    def run(self, command: str) -> CommandResult:
+        """
+        Run a shell command on the host.
+        """
+        raise NotImplementedError()
+
+    def open_file(self, path: str) -> TextIO:
+        """
+        Open a text file on the host for reading. Raises FileNotFoundError if it does not exist.
+        """
+        raise NotImplementedError()
+
+    def read_file(self, path: str) -> str:
+        with self.open_file(path) as f:
+            return f.read()
+
+    def list_dir(self, path: str) -> List[str]:
+        """
+        List the names of the entries in a directory on the host. Raises FileNotFoundError if it does not exist.
+        """
+        raise NotImplementedError()
+
+    def is_file(self, path: str) -> bool:
+        raise NotImplementedError()
+
+    def scan_dir(self, path: str) -> List[HostDirEntry]:
+        """
+        List the entries in a directory on the host together with whether each is a (symlink to a) regular file.
+        Raises FileNotFoundError if it does not exist.
+        """
+        return [
+            HostDirEntry(name=name, path=posixpath.join(path, name), is_file=self.is_file(posixpath.join(path, name)))
+            for name in self.list_dir(path)
+        ]
+
+    def expanduser(self, path: str) -> str:
+        raise NotImplementedError()
+
+    def get_hostname(self) -> str:
+        raise NotImplementedError()
+
+    def get_user(self) -> str:
+        """
+        The user whose configuration is being captured.
+        """
+        return self.run("whoami").stdout.strip()
+
+    def read_user_database(self) -> Tuple[str, str]:
+        """
+        The host's passwd and group databases, in the format of /etc/passwd and /etc/group.
+
+        Hosts that can run commands are asked through getent, which also covers accounts from NSS sources such as
+        LDAP. Other hosts only have their /etc/passwd and /etc/group files.
+        """
+        if self.can_run_commands:
+            passwd, group = self.run_many(USER_DATABASE_COMMANDS)
+            if passwd.returncode == 0 and group.returncode == 0:
+                return passwd.stdout, group.stdout
+        contents = self.read_files(USER_DATABASE_FILES)
+        passwd_content, group_content = (contents[path] or "" for path in USER_DATABASE_FILES)
+        return passwd_content, group_content
+
+    def connect_unix_socket(self, path: str) -> socket.socket:
+        """
+        Connect to a Unix domain socket on the host, e.g. a daemon's API socket. Raises OSError if it cannot be
+        connected to and NotImplementedError for hosts whose sockets cannot be reached.
+        """
+        raise NotImplementedError()
+
+    def cache_identity(self) -> Optional[str]:
+        """
+        A string identifying the host across runs for the gather cache, or None if gathered results from this host
+        must not be cached. Accessors returning one must implement fingerprint().
+        """
+        return None
+
+    def fingerprint(self, path: str) -> Optional[FileFingerprint]:
+        """
+        The (mtime in ns, inode, size) of a file or directory on the host, or None if it does not exist.
+        """
+        raise NotImplementedError()
+
+    # Whether commands can be run on the host at all. When they cannot, gatherers read files instead.
+    can_run_commands = True
+
+    # Whether each request to the host is expensive enough (e.g. a network round-trip) that requests should be
+    # batched together and their results kept for the rest of the run
+    batch_requests = False
+
+    def run_many(self, commands: Sequence[str]) -> List[CommandResult]:
+        """
+        Run several commands on the host, returning their results in the same order.
+        """
+        return [self.run(command) for command in commands]
+
+    def read_files(self, paths: Sequence[str]) -> Dict[str, Optional[str]]:
+        """
+        Read several files from the host. Files that do not exist map to None.
+        """
+        contents: Dict[str, Optional[str]] = {}
+        for path in paths:
+            try:
+                contents[path] = self.read_file(path)
+            except FileNotFoundError:
+                contents[path] = None
+        return contents
+
+
+class LocalHostAccessor(HostAccessor):
+    """
+    Access the machine cc-builder is running on.
+    """
+
+    def run(self, command: str) -> CommandResult:
+        start = time.perf_counter()
+        result = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        record_subprocess(time.perf_counter() - start, result.stdout, result.stderr)
+        return CommandResult(returncode=result.returncode, stdout=result.stdout, stderr=result.stderr)
+
+    def open_file(self, path: str) -> TextIO:
+        return count_reads(open(path, "r"))
+
+    def list_dir(self, path: str) -> List[str]:
+        return os.listdir(path)
+
+    def is_file(self, path: str) -> bool:
+        return os.path.isfile(path)
+
+    def scan_dir(self, path: str) -> List[HostDirEntry]:
+        return scan_local_dir(path, path)
+
+    def expanduser(self, path: str) -> str:
+        return os.path.expanduser(path)
+
+    def get_hostname(self) -> str:
+        return socket.gethostname()
+
+    def get_user(self) -> str:
+        try:
+            return pwd.getpwuid(os.geteuid()).pw_name
+        except KeyError:
+            # the effective uid has no passwd entry, e.g. in a container started with an arbitrary uid
+            return super().get_user()
+
+    def read_user_database(self) -> Tuple[str, str]:
+        passwd = "".join(
+            f"{entry.pw_name}:{entry.pw_passwd}:{entry.pw_uid}:{entry.pw_gid}:{entry.pw_gecos}:{entry.pw_dir}:"
+            f"{entry.pw_shell}\n"
+            for entry in pwd.getpwall()
+        )
+        group = "".join(
+            f"{entry.gr_name}:{entry.gr_passwd}:{entry.gr_gid}:{','.join(entry.gr_mem)}\n" for entry in grp.getgrall()
+        )
+        return passwd, group
+
+    def connect_unix_socket(self, path: str) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def cache_identity(self) -> Optional[str]:
+        return "local"
+
+    def fingerprint(self, path: str) -> Optional[FileFingerprint]:
+        return stat_fingerprint(path)
+
+
+LOCAL_HOST_ACCESSOR = LocalHostAccessor()
+
+
+class _RemoteHostAccessor(HostAccessor):
+    """
+    Implement file access on top of run() for hosts that can only be reached by running commands.
+    """
+
+    _home: Optional[str] = None
+    batch_requests = True
+
+    @staticmethod
+    def _cat_command(path: str) -> str:
+        return f"cat -- {shlex.quote(path)}"
+
+    @staticmethod
+    def _cat_output(path: str, result: CommandResult) -> str:
+        if result.returncode != 0:
+            if "No such file" in result.stderr:
+                raise FileNotFoundError(path)
+            raise OSError(f"Could not read {path}: {result.stderr.strip()}")
+        return result.stdout
+
+    def open_file(self, path: str) -> TextIO:
+        return io.StringIO(self._cat_output(path, self.run(self._cat_command(path))))
+
+    def run_many(self, commands: Sequence[str]) -> List[CommandResult]:
+        """
+        Run all commands in a single shell invocation on the host, so they cost one round-trip in total.
+
+        Each command's stdout, exit status and stderr are framed by a marker unique to this batch.
+        """
+        if len(commands) <= 1:
+            return [self.run(command) for command in commands]
+        marker = f"__cc_builder_{uuid.uuid4().hex}__"
+        script = ["__ccb_err=$(mktemp) || exit 1"]
+        for command in commands:
+            script.append(
+                f'( {command}\n) 2>"$__ccb_err"; __ccb_rc=$?; '
+                f"printf '\\n{marker} %s\\n' \"$__ccb_rc\"; "
+                f"cat \"$__ccb_err\"; printf '\\n{marker}\\n'"
+            )
+        script.append('rm -f "$__ccb_err"')
+        batch = self.run("\n".join(script))
+
+        output = batch.stdout
+        results: List[CommandResult] = []
+        position = 0
+        for command in commands:
+            status_start = output.find(f"\n{marker} ", position)
+            if status_start < 0:
+                # the batch itself failed (e.g. the connection dropped), run the rest one by one
+                results += [self.run(command) for command in commands[len(results) :]]
+                break
+            status_end = output.index("\n", status_start + 1)
+            stderr_end = output.index(f"\n{marker}\n", status_end)
+            results.append(
+                CommandResult(
+                    returncode=int(output[status_start + len(marker) + 2 : status_end]),
+                    stdout=output[position:status_start],
+                    stderr=output[status_end + 1 : stderr_end],
+                )
+            )
+            position = stderr_end + len(marker) + 2
+        return results
+
+    def read_files(self, paths: Sequence[str]) -> Dict[str, Optional[str]]:
+        contents: Dict[str, Optional[str]] = {}
+        for path, result in zip(paths, self.run_many([self._cat_command(path) for path in paths])):
+            try:
+                contents[path] = self._cat_output(path, result)
+            except FileNotFoundError:
+                contents[path] = None
+        return contents
+
+    def list_dir(self, path: str) -> List[str]:
+        result = self.run(f"ls -A1 -- {shlex.quote(path)}")
+        if result.returncode != 0:
+            if "No such file" in result.stderr:
+                raise FileNotFoundError(path)
+            raise OSError(f"Could not list {path}: {result.stderr.strip()}")
+        return [name for name in result.stdout.split("\n") if name]
+
+    def is_file(self, path: str) -> bool:
+        return self.run(f"test -f {shlex.quote(path)}").returncode == 0
+
+    def scan_dir(self, path: str) -> List[HostDirEntry]:
+        # list the entries and test which are files in one command, "f NAME" for files and "- NAME" for the rest
+        directory = shlex.quote(path.rstrip("/") or "/")
+        result = self.run(
+            f"cd -- {directory} || exit 2; "
+            'for f in * .[!.]* ..?*; do [ -e "$f" ] || [ -L "$f" ] || continue; '
+            'if [ -f "$f" ]; then echo "f $f"; else echo "- $f"; fi; done'
+        )
+        if result.returncode != 0:
+            if "No such file" in result.stderr or "can't cd" in result.stderr:
+                raise FileNotFoundError(path)
+            raise OSError(f"Could not list {path}: {result.stderr.strip()}")
+        return [
+            HostDirEntry(name=line[2:], path=posixpath.join(path, line[2:]), is_file=line[0] == "f")
+            for line in result.stdout.split("\n")
+            if len(line) > 2
+        ]
+
+    def expanduser(self, path: str) -> str:
+        if not path.startswith("~/") and path != "~":
+            return path
+        if self._home is None:
+            self._home = self.run('printf %s "$HOME"').stdout.strip()
+        return self._home + path[1:]
+
+    def get_hostname(self) -> str:
+        return self.run("hostname").stdout.strip()
+
+
+class SSHConnectionPool:
+    """
+    Run commands on remote hosts over SSH with a bounded number of concurrent ssh processes.
+
+    Every host gets a single multiplexed master connection (ControlMaster) which all of its commands reuse, so
+    only the first command per host pays for the SSH handshake. Call close() to tear down the master connections.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 10,
+        ssh_options: Sequence[str] = (),
+        connect_timeout: int = 10,
+        control_persist: int = 60,
+    ):
+        self.ssh_options = list(ssh_options)
+        self.connect_timeout = connect_timeout
+        self.control_persist = control_persist
+        self._semaphore = threading.BoundedSemaphore(max_connections)
+        self._control_dir = tempfile.mkdtemp(prefix="cc-builder-ssh-")
+        self._targets: Dict[str, Optional[int]] = {}
+        self._lock = threading.Lock()
+
+    def _base_command(self, target: str, port: Optional[int]) -> List[str]:
+        command = [
+            "ssh",
+            "-o",
+            "BatchMode=yes",
+            "-o",
+            f"ConnectTimeout={self.connect_timeout}",
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            f"ControlPath={self._control_dir}/%C",
+            "-o",
+            f"ControlPersist={self.control_persist}",
+        ]
+        for option in self.ssh_options:
+            command += ["-o", option]
+        if port is not None:
+            command += ["-p", str(port)]
+        return command + [target]
+
+    def run(self, target: str, port: Optional[int], command: str) -> CommandResult:
+        with self._lock:
+            self._targets[target] = port
+        with self._semaphore:
+            start = time.perf_counter()
+            result = subprocess.run(
+                self._base_command(target, port) + ["--", command],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            record_subprocess(time.perf_counter() - start, result.stdout, result.stderr)
+        return CommandResult(returncode=result.returncode, stdout=result.stdout, stderr=result.stderr)
+
+    def accessor(self, target: str, port: Optional[int] = None) -> "SSHHostAccessor":
+        return SSHHostAccessor(self, target, port)
+
+    def close(self):
+        for target, port in self._targets.items():
+            subprocess.run(
+                self._base_command(target, port)[:-1] + ["-O", "exit", target],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        self._targets = {}
+        shutil.rmtree(self._control_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SSHHostAccessor(_RemoteHostAccessor):
+    """
+    Access a remote host through an SSHConnectionPool.
+    """
+
+    # ssh exits with 255 when the connection itself failed
+    SSH_CONNECTION_ERROR_RETURNCODE = 255
+
+    def __init__(self, pool: SSHConnectionPool, target: str, port: Optional[int] = None):
+        self.pool = pool
+        self.target = target
+        self.port = port
+
+    def run(self, command: str) -> CommandResult:
+        return self.pool.run(self.target, self.port, command)
+
+    def check_connection(self):
+        """
+        Raise HostConnectionError if the host cannot be reached.
+        """
+        result = self.run("true")
+        if result.returncode == self.SSH_CONNECTION_ERROR_RETURNCODE:
+            raise HostConnectionError(result.stderr.strip() or f"Could not connect to {self.target}")
+
+
+class CannedHostAccessor(HostAccessor):
+    """
+    A stand-in host that serves canned command outputs and file contents, for exercising gatherers and fleet
+    captures without a real machine.
+
+    `commands` maps the exact command string to either its stdout or a full CommandResult. Unknown commands
+    fail like a missing executable would. `files` maps absolute paths to their contents. Directory listings
+    are implied by the paths of the files in them unless given explicitly in `directories`. Hosts created with
+    `can_run_commands=False` stand in for e.g. a root filesystem, whose modules read files instead.
+    """
+
+    def __init__(
+        self,
+        commands: Optional[Dict[str, Union[str, CommandResult]]] = None,
+        files: Optional[Dict[str, str]] = None,
+        home: str = "/home/ubuntu",
+        hostname: str = "localhost",
+        directories: Optional[Dict[str, List[str]]] = None,
+        can_run_commands: bool = True,
+    ):
+        self.commands = commands or {}
+        self.files = files or {}
+        self.home = home
+        self.hostname = hostname
+        self.directories = {posixpath.normpath(path): names for path, names in (directories or {}).items()}
+        self.can_run_commands = can_run_commands
+
+    def run(self, command: str) -> CommandResult:
+        if command not in self.commands:
+            return CommandResult(returncode=127, stdout="", stderr=f"{command}: command not found")
+        result = self.commands[command]
+        if isinstance(result, CommandResult):
+            return result
+        return CommandResult(returncode=0, stdout=result)
+
+    def open_file(self, path: str) -> TextIO:
+        if path not in self.files:
+            raise FileNotFoundError(path)
+        return count_reads(io.StringIO(self.files[path]))
+
+    def list_dir(self, path: str) -> List[str]:
+        if posixpath.normpath(path) in self.directories:
+            return list(self.directories[posixpath.normpath(path)])
+        prefix = path.rstrip("/") + "/"
+        names = {file_path[len(prefix) :].split("/")[0] for file_path in self.files if file_path.startswith(prefix)}
+        if not names:
+            raise FileNotFoundError(path)
+        return sorted(names)
+
+    def is_file(self, path: str) -> bool:
+        return posixpath.normpath(path) in self.files
+
+    def expanduser(self, path: str) -> str:
+        if path.startswith("~/") or path == "~":
+            return self.home + path[1:]
+        return path
+
+    def get_hostname(self) -> str:
+        return self.hostname
+
+
+RECORDING_FORMAT_VERSION = 2
+
+
+def _encode_bytes(data: bytes) -> str:
+    # socket traffic is kept readable in the JSON recording, bytes that are not UTF-8 survive as escaped surrogates
+    return data.decode("utf-8", "surrogateescape")
+
+
+def _decode_bytes(text: str) -> bytes:
+    return text.encode("utf-8", "surrogateescape")
+
+
+def _request_line(sent: bytes) -> str:
+    return _encode_bytes(sent.split(b"\r\n", 1)[0])
+
+
+class _ReplaySocket:
+    """
+    A connected Unix socket that answers each HTTP request with the response recorded for its request line.
+    """
+
+    def __init__(self, path: str, responses: Dict[str, str]):
+        self.path = path
+        self.responses = responses
+        self.sent = b""
+
+    def settimeout(self, timeout: Optional[float]):
+        pass
+
+    def sendall(self, data: bytes):
+        self.sent += data
+
+    def makefile(self, mode: str = "r", *args, **kwargs) -> io.BufferedIOBase:
+        request_line = _request_line(self.sent)
+        if request_line not in self.responses:
+            raise ConnectionResetError(errno.ECONNRESET, f"No response to {request_line} recorded", self.path)
+        return io.BytesIO(_decode_bytes(self.responses[request_line]))
+
+    def close(self):
+        pass
+
+
+class ReplayHostAccessor(CannedHostAccessor):
+    """
+    Replay a host from a recording saved by RecordingHostAccessor, without running anything.
+    """
+
+    def __init__(
+        self,
+        *args,
+        file_checks: Optional[Dict[str, bool]] = None,
+        sockets: Optional[Dict[str, dict]] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.file_checks = file_checks or {}
+        self.sockets = sockets or {}
+
+    @classmethod
+    def load(cls, recording_path: str) -> "ReplayHostAccessor":
+        with open(recording_path, "r") as recording_file:
+            recording = json.load(recording_file)
+        if recording.get("version") != RECORDING_FORMAT_VERSION:
+            raise ValueError(f"Unsupported host recording version in {recording_path}: {recording.get('version')}")
+        return cls(
+            commands={command: CommandResult(**result) for command, result in recording["commands"].items()},
+            files=recording["files"],
+            home=recording["home"],
+            hostname=recording["hostname"],
+            directories=recording["directories"],
+            can_run_commands=recording["can_run_commands"],
+            file_checks=recording["file_checks"],
+            sockets=recording["sockets"],
+        )
+
+    def is_file(self, path: str) -> bool:
+        if path in self.file_checks:
+            return self.file_checks[path]
+        return super().is_file(path)
+
+    def connect_unix_socket(self, path: str) -> socket.socket:
+        if path not in self.sockets:
+            raise NotImplementedError()
+        recorded = self.sockets[path]
+        if "errno" in recorded:
+            raise OSError(recorded["errno"], recorded["error"], path)
+        # stands in for the socket, answering the requests that were recorded
+        return cast(socket.socket, _ReplaySocket(path, recorded["responses"]))
+
+
+class _RecordingSocketReader:
+    """
+    The read side of a socket passed through by RecordingHostAccessor, handing everything read to `record`.
+    """
+
+    def __init__(self, inner: io.BufferedIOBase, record: Callable[[bytes], None]):
+        self.inner = inner
+        self.record = record
+
+    def read(self, *args) -> bytes:
+        data = self.inner.read(*args)
+        self.record(data)
+        return data
+
+    def readline(self, *args) -> bytes:
+        data = self.inner.readline(*args)
+        self.record(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        count = self.inner.readinto(buffer)
+        self.record(bytes(memoryview(buffer)[:count]))
+        return count
+
+    def __getattr__(self, name: str):
+        return getattr(self.inner, name)
+
+
+class _RecordingSocket:
+    """
+    A socket passed through by RecordingHostAccessor. The response to each request is recorded under the
+    request's first line, e.g. "GET /v2/snaps HTTP/1.1".
+    """
+
+    def __init__(self, inner: socket.socket, responses: Dict[str, str], lock: threading.Lock):
+        self.inner = inner
+        self.responses = responses
+        self.lock = lock
+        self.sent = b""
+        self.received = b""
+
+    def sendall(self, data: bytes):
+        self.sent += data
+        self.inner.sendall(data)
+
+    def makefile(self, *args, **kwargs) -> _RecordingSocketReader:
+        return _RecordingSocketReader(self.inner.makefile(*args, **kwargs), self._record)
+
+    def _record(self, data: bytes):
+        self.received += data
+        with self.lock:
+            self.responses[_request_line(self.sent)] = _encode_bytes(self.received)
+
+    def __getattr__(self, name: str):
+        return getattr(self.inner, name)
+
+
+class RecordingHostAccessor(HostAccessor):
+    """
+    Pass every request through to another accessor and record the answers, so the capture can later be
+    replayed deterministically with ReplayHostAccessor.
+    """
+
+    def __init__(self, inner: HostAccessor):
+        self.inner = inner
+        self.batch_requests = inner.batch_requests
+        self.can_run_commands = inner.can_run_commands
+        self._lock = threading.Lock()
+        self._commands: Dict[str, CommandResult] = {}
+        self._files: Dict[str, str] = {}
+        self._directories: Dict[str, List[str]] = {}
+        self._file_checks: Dict[str, bool] = {}
+        self._sockets: Dict[str, dict] = {}
+        self._home: Optional[str] = None
+        self._hostname: Optional[str] = None
+
+    def run(self, command: str) -> CommandResult:
+        result = self.inner.run(command)
+        with self._lock:
+            self._commands[command] = result
+        return result
+
+    def run_many(self, commands: Sequence[str]) -> List[CommandResult]:
+        results = self.inner.run_many(commands)
+        with self._lock:
+            self._commands.update(zip(commands, results))
+        return results
+
+    def open_file(self, path: str) -> TextIO:
+        content = self.inner.read_file(path)
+        with self._lock:
+            self._files[path] = content
+        return io.StringIO(content)
+
+    def read_files(self, paths: Sequence[str]) -> Dict[str, Optional[str]]:
+        contents = self.inner.read_files(paths)
+        with self._lock:
+            self._files.update({path: content for path, content in contents.items() if content is not None})
+        return contents
+
+    def list_dir(self, path: str) -> List[str]:
+        names = self.inner.list_dir(path)
+        with self._lock:
+            self._directories[path] = list(names)
+        return names
+
+    def is_file(self, path: str) -> bool:
+        is_file = self.inner.is_file(path)
+        with self._lock:
+            self._file_checks[path] = is_file
+        return is_file
+
+    def connect_unix_socket(self, path: str) -> socket.socket:
+        try:
+            sock = self.inner.connect_unix_socket(path)
+        except OSError as e:
+            with self._lock:
+                self._sockets[path] = {"errno": e.errno, "error": e.strerror}
+            raise
+        # sockets the host cannot reach at all (NotImplementedError) are left out, as replay treats them alike
+        with self._lock:
+            responses = self._sockets.setdefault(path, {"responses": {}})["responses"]
+        # stands in for the socket, forwarding everything to it
+        return cast(socket.socket, _RecordingSocket(sock, responses, self._lock))
+
+    def expanduser(self, path: str) -> str:
+        if self._home is None:
+            self._home = self.inner.expanduser("~")
+        return self.inner.expanduser(path)
+
+    def get_hostname(self) -> str:
+        self._hostname = self.inner.get_hostname()
+        return self._hostname
+
+    def get_user(self) -> str:
+        user = self.inner.get_user()
+        # replayed hosts answer get_user() through whoami
+        with self._lock:
+            self._commands["whoami"] = CommandResult(returncode=0, stdout=f"{user}\n")
+        return user
+
+    def read_user_database(self) -> Tuple[str, str]:
+        tables = self.inner.read_user_database()
+        # replayed hosts answer read_user_database() through getent, or from the files if they cannot run commands
+        with self._lock:
+            if self.can_run_commands:
+                for command, table in zip(USER_DATABASE_COMMANDS, tables):
+                    self._commands[command] = CommandResult(returncode=0, stdout=table)
+            else:
+                self._files.update(zip(USER_DATABASE_FILES, tables))
+        return tables
+
+    def save(self, recording_path: str):
+        with self._lock:
+            recording = {
+                "version": RECORDING_FORMAT_VERSION,
+                "home": self._home if self._home is not None else self.inner.expanduser("~"),
+                "hostname": self._hostname if self._hostname is not None else self.inner.get_hostname(),
+                "commands": {command: dataclasses.asdict(result) for command, result in self._commands.items()},
+                "files": self._files,
+                "directories": self._directories,
+                "can_run_commands": self.can_run_commands,
+                "file_checks": self._file_checks,
+                "sockets": self._sockets,
+            }
+        with open(recording_path, "w") as recording_file:
+            json.dump(recording, recording_file, indent=1, sort_keys=True)
+
+
+class MemoizingHostAccessor(HostAccessor):
+    """
+    Wrap another accessor for the duration of a single capture so every distinct request reaches the host
+    only once.
+
+    Command results, directory listings and file checks are always memoized. File contents are memoized for
+    hosts with expensive requests (batch_requests), local files are streamed every time they are opened.
+    Identical requests made concurrently from several threads wait for the first one instead of repeating it.
+    """
+
+    def __init__(self, inner: HostAccessor):
+        self.inner = inner
+        self.batch_requests = inner.batch_requests
+        self.can_run_commands = inner.can_run_commands
+        self._lock = threading.Lock()
+        self._cache: Dict[Tuple[str, str], Tuple[object, Optional[Exception]]] = {}
+        self._inflight: Dict[Tuple[str, str], threading.Event] = {}
+
+    def _memoize(self, key: Tuple[str, str], compute: Callable[[], object]):
+        while True:
+            with self._lock:
+                if key in self._cache:
+                    value, error = self._cache[key]
+                    if error is not None:
+                        raise error
+                    return value
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    break
+            # another thread is already making this request, wait for its result
+            event.wait()
+
+        try:
+            try:
+                outcome: Tuple[object, Optional[Exception]] = (compute(), None)
+            except FileNotFoundError as e:
+                outcome = (None, e)
+            with self._lock:
+                self._cache[key] = outcome
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+        if outcome[1] is not None:
+            raise outcome[1]
+        return outcome[0]
+
+    def prefetch(self, commands: Sequence[str] = (), files: Sequence[str] = ()):
+        """
+        Fetch the results of commands and the contents of files that will be needed later in one batch.
+        Does nothing for hosts where requests are cheap.
+        """
+        if not self.batch_requests:
+            return
+        with self._lock:
+            commands = [command for command in dict.fromkeys(commands) if ("run", command) not in self._cache]
+            files = [path for path in dict.fromkeys(files) if ("file", path) not in self._cache]
+        results = self.inner.run_many(commands) if commands else []
+        contents = self.inner.read_files(files) if files else {}
+        with self._lock:
+            for command, result in zip(commands, results):
+                self._cache[("run", command)] = (result, None)
+            for path, content in contents.items():
+                self._cache[("file", path)] = (
+                    (content, None) if content is not None else (None, FileNotFoundError(path))
+                )
+
+    def run(self, command: str) -> CommandResult:
+        return self._memoize(("run", command), lambda: self.inner.run(command))
+
+    def run_many(self, commands: Sequence[str]) -> List[CommandResult]:
+        self.prefetch(commands=commands)
+        return [self.run(command) for command in commands]
+
+    def read_files(self, paths: Sequence[str]) -> Dict[str, Optional[str]]:
+        self.prefetch(files=paths)
+        return super().read_files(paths)
+
+    def open_file(self, path: str) -> TextIO:
+        if not self.batch_requests:
+            return self.inner.open_file(path)
+        return io.StringIO(self._memoize(("file", path), lambda: self.inner.read_file(path)))
+
+    def list_dir(self, path: str) -> List[str]:
+        return list(self._memoize(("list_dir", path), lambda: self.inner.list_dir(path)))
+
+    def is_file(self, path: str) -> bool:
+        return self._memoize(("is_file", path), lambda: self.inner.is_file(path))
+
+    def scan_dir(self, path: str) -> List[HostDirEntry]:
+        return list(self._memoize(("scan_dir", path), lambda: self.inner.scan_dir(path)))
+
+    def expanduser(self, path: str) -> str:
+        return self._memoize(("expanduser", path), lambda: self.inner.expanduser(path))
+
+    def get_hostname(self) -> str:
+        return self._memoize(("hostname", ""), self.inner.get_hostname)
+
+    def get_user(self) -> str:
+        return self._memoize(("user", ""), self.inner.get_user)
+
+    def read_user_database(self) -> Tuple[str, str]:
+        if self.batch_requests:
+            # answered from the getent commands prefetched with the rest of the batch
+            return self._memoize(("user_database", ""), super().read_user_database)
+        return self._memoize(("user_database", ""), self.inner.read_user_database)
+
+    def cache_identity(self) -> Optional[str]:
+        return self.inner.cache_identity()
+
+    def fingerprint(self, path: str) -> Optional[FileFingerprint]:
+        return self.inner.fingerprint(path)
+
+    def connect_unix_socket(self, path: str) -> socket.socket:
+        return self.inner.connect_unix_socket(path)
+
+
+class RootfsHostAccessor(HostAccessor):
+    """
+    Access a root filesystem that is not running, e.g. an unpacked golden image or a mounted disk image.
+
+    Paths are resolved inside `root`, including absolute symlinks, so nothing outside of it is read. Commands
+    can only be run when use_chroot is set, in which case they run through chroot(8) and need root privileges.
+
+    The captured user is `user` if given, otherwise the first regular account in the image's /etc/passwd,
+    falling back to root for images without one.
+    """
+
+    # symlinks followed before giving up, matching the kernel's limit
+    MAX_SYMLINKS = 40
+    # the range of uids Ubuntu hands out to regular accounts (UID_MIN and UID_MAX in /etc/login.defs)
+    REGULAR_UID_RANGE = range(1000, 60001)
+
+    def __init__(self, root: str, use_chroot: bool = False, user: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.use_chroot = use_chroot
+        self.can_run_commands = use_chroot
+        self._user = user
+        self._home: Optional[str] = None
+
+    def host_path(self, path: str) -> str:
+        """
+        Translate a path on the captured system into the matching path under root.
+        """
+        remaining = [part for part in path.split("/") if part]
+        resolved: List[str] = []
+        symlinks = 0
+        while remaining:
+            part = remaining.pop(0)
+            if part == ".":
+                continue
+            if part == "..":
+                if resolved:
+                    resolved.pop()
+                continue
+            candidate = os.path.join(self.root, *resolved, part)
+            if os.path.islink(candidate):
+                symlinks += 1
+                if symlinks > self.MAX_SYMLINKS:
+                    raise OSError(errno.ELOOP, "Too many levels of symbolic links", path)
+                target = os.readlink(candidate)
+                if target.startswith("/"):
+                    resolved = []
+                remaining = [part for part in target.split("/") if part] + remaining
+                continue
+            resolved.append(part)
+        return os.path.join(self.root, *resolved)
+
+    def run(self, command: str) -> CommandResult:
+        if not self.use_chroot:
+            return CommandResult(
+                returncode=127, stdout="", stderr=f"Cannot run commands in root filesystem {self.root}"
+            )
+        start = time.perf_counter()
+        result = subprocess.run(
+            ["chroot", self.root, "/bin/sh", "-c", command],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        record_subprocess(time.perf_counter() - start, result.stdout, result.stderr)
+        return CommandResult(returncode=result.returncode, stdout=result.stdout, stderr=result.stderr)
+
+    def open_file(self, path: str) -> TextIO:
+        return count_reads(open(self.host_path(path), "r"))
+
+    def list_dir(self, path: str) -> List[str]:
+        return os.listdir(self.host_path(path))
+
+    def is_file(self, path: str) -> bool:
+        return os.path.isfile(self.host_path(path))
+
+    def scan_dir(self, path: str) -> List[HostDirEntry]:
+        entries = scan_local_dir(self.host_path(path), path)
+        for entry in entries:
+            # symlinks have to be resolved inside the root rather than by the kernel
+            if os.path.islink(os.path.join(self.host_path(path), entry.name)):
+                entry.is_file = self.is_file(entry.path)
+                entry.fingerprint = self.fingerprint(entry.path)
+        return entries
+
+    def cache_identity(self) -> Optional[str]:
+        return f"rootfs:{self.root}"
+
+    def fingerprint(self, path: str) -> Optional[FileFingerprint]:
+        return stat_fingerprint(self.host_path(path))
+
+    def _passwd_entries(self) -> List[List[str]]:
+        try:
+            with self.open_file("/etc/passwd") as passwd_file:
+                return [line.rstrip("\n").split(":") for line in passwd_file if line.count(":") == 6]
+        except FileNotFoundError:
+            return []
+
+    def _resolve_user(self) -> Tuple[str, str]:
+        """
+        The user captured from the image and their home directory, read from its /etc/passwd the first time.
+        """
+        if self._user is not None and self._home is not None:
+            return self._user, self._home
+        entries = self._passwd_entries()
+        user = self._user
+        if user is None:
+            regular = [entry for entry in entries if entry[2].isdigit() and int(entry[2]) in self.REGULAR_UID_RANGE]
+            user = regular[0][0] if regular else "root"
+        home = {entry[0]: entry[5] for entry in entries}.get(user, "/root" if user == "root" else f"/home/{user}")
+        self._user, self._home = user, home
+        return user, home
+
+    def get_user(self) -> str:
+        return self._resolve_user()[0]
+
+    def expanduser(self, path: str) -> str:
+        if path.startswith("~/") or path == "~":
+            return self._resolve_user()[1] + path[1:]
+        return path
+
+    def get_hostname(self) -> str:
+        try:
+            with self.open_file("/etc/hostname") as hostname_file:
+                return hostname_file.read().strip()
+        except FileNotFoundError:
+            return ""
@@ -0,0 +1,221 @@
+import dataclasses
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from ruamel.yaml import YAML
+
+from cc_builder.console_output import print_debug
+from cc_builder.custom_types import BaseConfig
+from cc_builder.host_accessor import HostAccessor
+
+DELTA_HEADER = "# cc-builder delta: changes since a previous cloud-config\n\n"
+GATHERED_AT_PREFIX = "# Gathered at (ns since the epoch): "
+GATHERED_WITH_PREFIX = "# Gathered with: "
+# options whose values are not written to the footer, modules created with one of them set are always gathered again
+SECRET_OPTIONS = ("password",)
+# file modification times come from a coarser clock than time.time_ns(), so files modified up to this long before
+# gathering started count as modified after it
+CLOCK_SLACK_NS = 1_000_000_000
+
+
+def module_options(config: BaseConfig) -> Dict[str, Any]:
+    """
+    The ModuleOptions attributes a module was created with, in the form they are written to the footer.
+    """
+    options = {}
+    for option, field in sorted(config.option_fields.items()):
+        value = getattr(config, field)
+        options[option] = value is not None if option in SECRET_OPTIONS else value
+    # e.g. tuples come back from the footer as lists
+    return json.loads(json.dumps(options))
+
+
+@dataclasses.dataclass
+class Provenance:
+    """
+    When gathering a cloud-config started and the options of each module whose sections it holds. With --provenance
+    or --since it is written to the footer of the cloud-config, so a later --since run can tell which sections are
+    still current without relying on the file's modification time, which copying the file changes.
+    """
+
+    gathered_at_ns: int = dataclasses.field(default_factory=time.time_ns)
+    modules: Dict[str, Dict[str, Any]] = dataclasses.field(default_factory=dict)
+
+    def add_module(self, name: str, config: BaseConfig):
+        self.modules[name] = module_options(config)
+
+    def footer_lines(self) -> List[str]:
+        return [
+            f"{GATHERED_AT_PREFIX}{self.gathered_at_ns}\n",
+            f"{GATHERED_WITH_PREFIX}{json.dumps(self.modules, sort_keys=True, separators=(',', ':'))}\n",
+        ]
+
+    @classmethod
+    def from_footer(cls, lines: Iterable[str]) -> Optional["Provenance"]:
+        """
+        Read the provenance from the lines of a cloud-config, None if its footer has none (e.g. canonical
+        cloud-configs, or ones written by older versions of cc-builder).
+        """
+        gathered_at_ns, modules = None, None
+        for line in lines:
+            if line.startswith(GATHERED_AT_PREFIX):
+                gathered_at_ns = int(line[len(GATHERED_AT_PREFIX) :])
+            elif line.startswith(GATHERED_WITH_PREFIX):
+                modules = json.loads(line[len(GATHERED_WITH_PREFIX) :])
+        if gathered_at_ns is None or not isinstance(modules, dict):
+            return None
+        return cls(gathered_at_ns=gathered_at_ns, modules=modules)
+
+
+@dataclasses.dataclass
+class PreviousCloudConfig:
+    path: str
+    cloud_config: Dict
+    provenance: Optional[Provenance] = None
+
+
+def _plain(value: Any) -> Any:
+    # drop ruamel's round-trip containers, which carry comments such as the footer along, but keep its scalar types
+    # (e.g. literal block strings) so reused sections are emitted exactly as they were read
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+def load_previous_cloud_config(path: str) -> PreviousCloudConfig:
+    """
+    Load a cloud-config written by an earlier run of cc-builder, along with the provenance in its footer.
+    """
+    with open(path, "r") as f:
+        content = f.read()
+    cloud_config = YAML().load(content) or {}
+    if not isinstance(cloud_config, dict):
+        raise ValueError(f"{path} is not a cloud-config")
+    try:
+        provenance = Provenance.from_footer(content.splitlines())
+    except ValueError as e:
+        raise ValueError(f"{path} has an invalid footer: {e}") from e
+    return PreviousCloudConfig(path=path, cloud_config=_plain(cloud_config), provenance=provenance)
+
+
+def inputs_modified_since(config: BaseConfig, accessor: HostAccessor, timestamp_ns: int) -> bool:
+    """
+    Whether any of the module's cache inputs (see BaseConfig.resolve_cache_inputs) was modified after timestamp_ns.
+    Inputs that do not exist count as modified, since their removal cannot be dated.
+    """
+    for path in config.resolve_cache_inputs(accessor):
+        path = accessor.expanduser(path)
+        paths = [path]
+        if path.endswith("/") and accessor.fingerprint(path) is not None:
+            paths += [path + name for name in accessor.list_dir(path)]
+        for input_path in paths:
+            fingerprint = accessor.fingerprint(input_path)
+            if fingerprint is None or fingerprint[0] > timestamp_ns:
+                return True
+    return False
+
+
+def select_reusable_sections(
+    configs: Sequence[Tuple[str, BaseConfig]], accessor: HostAccessor, previous: PreviousCloudConfig
+) -> Dict[str, Dict]:
+    """
+    Find the modules whose sections can be taken from the previous cloud-config instead of gathering them again,
+    mapped to those sections.
+
+    A module is reused when the previous cloud-config has its sections, gathered with the same options, none of
+    its input files changed since that gathering started, and no module that is gathered again writes to the same
+    keys (e.g. the "users" entry shared by the user and ssh modules).
+    """
+    if accessor.cache_identity() is None:
+        # the host's files cannot be dated
+        return {}
+    provenance = previous.provenance
+    if provenance is None:
+        print_debug(f"{previous.path} does not record when and how it was gathered, gathering every module again")
+        return {}
+    reusable: Set[str] = set()
+    for name, config in configs:
+        if not config.cache_inputs or not any(key in previous.cloud_config for key in config.cloud_config_keys):
+            continue
+        options = module_options(config)
+        if name not in provenance.modules:
+            print_debug(f"Gathering {name} config again, it was not gathered for {previous.path}")
+        elif provenance.modules[name] != options or any(options.get(option) for option in SECRET_OPTIONS):
+            print_debug(f"Gathering {name} config again, {previous.path} was gathered with other options")
+        elif not inputs_modified_since(config, accessor, provenance.gathered_at_ns - CLOCK_SLACK_NS):
+            reusable.add(name)
+    while True:
+        regathered_keys = {key for name, config in configs if name not in reusable for key in config.cloud_config_keys}
+        shared = {
+            name for name, config in configs if name in reusable and regathered_keys & set(config.cloud_config_keys)
+        }
+        if not shared:
+            break
+        reusable -= shared
+    sections = {}
+    for name, config in configs:
+        if name in reusable:
+            print_debug(f"Reusing {name} config from {previous.path}, its inputs have not changed")
+            sections[name] = {
+                key: previous.cloud_config[key] for key in config.cloud_config_keys if key in previous.cloud_config
+            }
+    return sections
+
+
+def _missing_from(items: List, other: List) -> List:
+    # the items of `items` that `other` does not hold, in a set when they are hashable (e.g. the package names of a
+    # large packages list) since a membership test on the list makes this quadratic
+    try:
+        lookup: Any = set(other)
+    except TypeError:
+        lookup = other
+    try:
+        return [item for item in items if item not in lookup]
+    except TypeError:
+        return [item for item in items if item not in other]
+
+
+def _diff(path: str, old: Any, new: Any, changes: List[Dict]):
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in list(new) + [key for key in old if key not in new]:
+            key_path = f"{path}.{key}" if path else str(key)
+            if key not in old:
+                changes.append({"path": key_path, "added": new[key]})
+            elif key not in new:
+                changes.append({"path": key_path, "removed": old[key]})
+            else:
+                _diff(key_path, old[key], new[key], changes)
+    elif isinstance(old, list) and isinstance(new, list):
+        if len(old) == len(new) and all(isinstance(item, dict) for item in old + new):
+            # e.g. the users list, compare the entries field by field
+            for index, (old_item, new_item) in enumerate(zip(old, new)):
+                _diff(f"{path}.{index}", old_item, new_item, changes)
+            return
+        change: Dict[str, Any] = {"path": path}
+        added = _missing_from(new, old)
+        removed = _missing_from(old, new)
+        if added:
+            change["added"] = added
+        if removed:
+            change["removed"] = removed
+        if not added and not removed:
+            # same items in another order
+            change.update(old=old, new=new)
+        changes.append(change)
+    else:
+        changes.append({"path": path, "old": old, "new": new})
+
+
+def diff_cloud_configs(old: Dict, new: Dict) -> List[Dict]:
+    """
+    List the changes from one cloud-config to another. Each change has the dotted `path` of the changed value and
+    either `added` and/or `removed` items of a list or keys of a mapping, or the `old` and `new` value.
+    """
+    changes: List[Dict] = []
+    _diff("", old, new, changes)
+    return changes
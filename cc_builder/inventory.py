@@ -0,0 +1,239 @@
+import dataclasses
+import json
+import os
+import tempfile
+import typing
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Protocol, Tuple
+
+from cc_builder.console_output import print_warning
+from cc_builder.custom_types import BaseConfig
+from cc_builder.defaults import INVENTORY_FORMATS
+from cc_builder.modules import load_module_class
+
+# Bump whenever the records change in a way readers have to know about, e.g. a field of a gathered dataclass is
+# renamed or changes type. Adding a field keeps the version.
+INVENTORY_SCHEMA_VERSION = 1
+MSGPACK_EXTENSIONS = (".msgpack", ".mpk")
+
+
+def inventory_format_for_path(path: str) -> str:
+    """
+    The inventory format implied by a file name: msgpack for .msgpack and .mpk files, JSON Lines otherwise.
+    """
+    return "msgpack" if path.endswith(MSGPACK_EXTENSIONS) else "jsonl"
+
+
+def check_inventory_format(inventory_format: str):
+    """
+    Raise ValueError if inventories cannot be written or read in `inventory_format`, e.g. msgpack without the
+    msgpack package.
+    """
+    if inventory_format not in INVENTORY_FORMATS:
+        raise ValueError(
+            f"Unknown inventory format '{inventory_format}', expected one of {', '.join(INVENTORY_FORMATS)}"
+        )
+    if inventory_format == "msgpack":
+        try:
+            import msgpack  # noqa: F401
+        except ImportError as e:
+            raise ValueError("msgpack inventories need the msgpack package") from e
+
+
+def to_plain(value: Any) -> Any:
+    """
+    Convert a gathered dataclass, and everything it holds, into dicts, lists and scalars. Unlike
+    dataclasses.asdict, nothing is deep-copied, so large package lists are only walked once.
+    """
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {field.name: to_plain(getattr(value, field.name)) for field in dataclasses.fields(value)}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    return value
+
+
+_SCALAR_TYPES = (str, int, float, bool)
+_type_hints: Dict[type, Dict[str, Any]] = {}
+
+
+def from_plain(annotation: Any, value: Any) -> Any:
+    """
+    Rebuild a value of the type `annotation` from what to_plain() made of it, following the type hints of
+    dataclasses down to their lists, dicts and Optional fields. Keys a dataclass does not have are ignored and
+    fields missing from `value` keep their defaults, so inventories written by other versions of a module load.
+    """
+    if value is None:
+        return None
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union:
+        types = [arg for arg in args if arg is not type(None)]
+        return from_plain(types[0], value) if len(types) == 1 else value
+    if origin in (list, tuple):
+        item_type = args[0] if args else Any
+        # large package and group lists hold plain strings, don't walk them item by item
+        items = list(value) if item_type in _SCALAR_TYPES else [from_plain(item_type, item) for item in value]
+        return items if origin is list else tuple(items)
+    if origin is dict:
+        item_type = args[1] if args else Any
+        return {key: from_plain(item_type, item) for key, item in value.items()}
+    if dataclasses.is_dataclass(annotation):
+        if annotation not in _type_hints:
+            _type_hints[annotation] = typing.get_type_hints(annotation)
+        hints = _type_hints[annotation]
+        return annotation(
+            **{
+                field.name: from_plain(hints[field.name], value[field.name])
+                for field in dataclasses.fields(annotation)
+                if field.init and field.name in value
+            }
+        )
+    return value
+
+
+def read_inventory_records(path: str, inventory_format: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Yield the records of an inventory written by InventoryWriter one after another.
+    """
+    inventory_format = inventory_format or inventory_format_for_path(path)
+    check_inventory_format(inventory_format)
+    with open(path, "rb") as inventory_file:
+        if inventory_format == "msgpack":
+            import msgpack
+
+            yield from msgpack.Unpacker(inventory_file, raw=False)
+        else:
+            for line in inventory_file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class ModuleWriter(Protocol):
+    """
+    Where a capture hands over each gathered module: an InventoryWriter streaming them to a file, or an Inventory
+    collecting them in memory.
+    """
+
+    def write_module(self, name: str, config: BaseConfig):
+        """
+        Take a module once it has been gathered.
+        """
+
+
+@dataclasses.dataclass
+class Inventory:
+    """
+    The modules of a capture loaded back from its inventory, ready to generate cloud-configs from without gathering
+    them again.
+    """
+
+    host: str
+    user: str
+    # (module name, gathered config) in the order the modules' sections are written to the cloud-config
+    configs: List[Tuple[str, BaseConfig]] = dataclasses.field(default_factory=list)
+
+    def write_module(self, name: str, config: BaseConfig):
+        """
+        Add a gathered module, so a capture can be collected in memory in place of an InventoryWriter.
+        """
+        self.configs.append((name, config))
+
+
+def load_inventory(path: str, inventory_format: Optional[str] = None) -> Inventory:
+    """
+    Load an inventory written by InventoryWriter, rebuilding each module's config class. Raises ValueError for
+    files that are not inventories or use another schema version. Modules that are not installed, e.g. those of a
+    plugin missing here, are skipped with a warning.
+    """
+    records = read_inventory_records(path, inventory_format)
+    header = next(records, None)
+    if not isinstance(header, dict) or header.get("record") != "header":
+        raise ValueError(f"{path} is not a cc-builder inventory")
+    if header.get("schema") != INVENTORY_SCHEMA_VERSION:
+        raise ValueError(
+            f"Inventory {path} uses schema version {header.get('schema')}, expected {INVENTORY_SCHEMA_VERSION}"
+        )
+    inventory = Inventory(host=header.get("host", ""), user=header.get("user", ""))
+    for record in records:
+        if record.get("record") != "module":
+            continue
+        try:
+            config_class = load_module_class(record["module"])
+        except KeyError:
+            print_warning(f"Skipping module '{record['module']}' of inventory {path}, it is not installed")
+            continue
+        inventory.configs.append((record["module"], from_plain(config_class, record["data"])))
+    return inventory
+
+
+class InventoryWriter:
+    """
+    Write the gathered config of every module of a capture to a machine-readable inventory file, next to the
+    cloud-config generated from it.
+
+    The inventory is a stream of records, one JSON object per line (JSON Lines) or one msgpack map after another.
+    The first record is a header:
+
+        {"record": "header", "schema": INVENTORY_SCHEMA_VERSION, "host": ..., "user": ...}
+
+    followed by one record per module, in the order the modules' sections are written to the cloud-config:
+
+        {"record": "module", "module": "apt", "data": {<the fields of AptConfig after gather()>}}
+
+    Each module is serialized once, as soon as the capture hands it over. The file is written to a temporary file
+    renamed over `path` on close(), so readers never see a partial inventory. msgpack needs the optional msgpack
+    package (pip install cc-builder[inventory]).
+    """
+
+    def __init__(self, path: str, inventory_format: Optional[str] = None, host: str = "", user: str = ""):
+        self.path = path
+        self.format = inventory_format or inventory_format_for_path(path)
+        check_inventory_format(self.format)
+        if self.format == "msgpack":
+            import msgpack
+
+            self._packer = msgpack.Packer()
+        # the emitter (and ruamel.yaml with it) is only imported once an inventory is written, see cli.py
+        from cc_builder.emitter import default_file_mode
+
+        self._mode = default_file_mode(path)
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, self._temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+        self._file: BinaryIO = os.fdopen(fd, "wb")
+        self.modules = 0
+        self._write({"record": "header", "schema": INVENTORY_SCHEMA_VERSION, "host": host, "user": user})
+
+    def _write(self, record: dict):
+        if self.format == "msgpack":
+            self._file.write(self._packer.pack(record))
+        else:
+            self._file.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def write_module(self, name: str, config: BaseConfig):
+        self._write({"record": "module", "module": name, "data": to_plain(config)})
+        self.modules += 1
+
+    def close(self):
+        """
+        Move the complete inventory into place.
+        """
+        self._file.close()
+        os.chmod(self._temp_path, self._mode)
+        os.replace(self._temp_path, self.path)
+
+    def discard(self):
+        """
+        Drop the inventory written so far, e.g. because the capture failed.
+        """
+        self._file.close()
+        os.unlink(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
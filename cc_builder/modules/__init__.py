@@ -0,0 +1,82 @@
+import importlib
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple, Type
+
+from cc_builder.console_output import print_warning
+from cc_builder.custom_types import BaseConfig
+
+# The built-in modules as (name, "python module:config class"), in the order their sections are written. The config
+# classes are imported the first time they are needed, so a run only pays for importing the modules it gathers.
+MODULES: List[Tuple[str, str]] = [
+    ("user", "cc_builder.modules.user:UserConfig"),
+    ("ssh", "cc_builder.modules.ssh:SSHConfig"),
+    ("apt", "cc_builder.modules.apt:AptConfig"),
+    ("snap", "cc_builder.modules.snap:SnapConfig"),
+    ("hostname", "cc_builder.modules.hostname:HostnameConfig"),
+]
+
+# Third-party packages add modules by registering their BaseConfig subclass under this entry point group, e.g. in
+# pyproject.toml:
+#
+#     [project.entry-points."cc_builder.modules"]
+#     ntp = "cc_builder_ntp:NTPConfig"
+#
+# Their sections are written after those of the built-in modules, in name order.
+ENTRY_POINT_GROUP = "cc_builder.modules"
+
+_lock = threading.Lock()
+_module_paths: Optional[Dict[str, str]] = None
+_loaded_classes: Dict[str, Type[BaseConfig]] = {}
+
+
+def _entry_point_modules() -> List[Tuple[str, str]]:
+    import importlib.metadata
+
+    if sys.version_info >= (3, 10):
+        group = importlib.metadata.entry_points(group=ENTRY_POINT_GROUP)
+    else:
+        # Python < 3.10 returns a dict of groups
+        group = importlib.metadata.entry_points().get(ENTRY_POINT_GROUP, [])
+    modules = []
+    for entry_point in sorted(group, key=lambda entry_point: entry_point.name):
+        if entry_point.name in dict(MODULES):
+            print_warning(f"Ignoring module plugin '{entry_point.value}', '{entry_point.name}' is a built-in module")
+            continue
+        modules.append((entry_point.name, entry_point.value))
+    return modules
+
+
+def _get_module_paths() -> Dict[str, str]:
+    global _module_paths
+    with _lock:
+        if _module_paths is None:
+            _module_paths = dict(MODULES + _entry_point_modules())
+        return _module_paths
+
+
+def get_module_names() -> List[str]:
+    """
+    The names of all modules, built-in and registered through entry points, in the order their sections are written.
+    """
+    return list(_get_module_paths())
+
+
+def load_module_class(name: str) -> Type[BaseConfig]:
+    """
+    Import a module's config class, e.g. AptConfig for "apt". Raises KeyError for unknown modules and TypeError if a
+    plugin does not register a BaseConfig subclass.
+    """
+    module_paths = _get_module_paths()
+    with _lock:
+        if name not in _loaded_classes:
+            module_path, class_name = module_paths[name].split(":")
+            config_class = getattr(importlib.import_module(module_path.strip()), class_name.strip())
+            if not (isinstance(config_class, type) and issubclass(config_class, BaseConfig)):
+                raise TypeError(f"Module '{name}' ({module_paths[name]}) is not a BaseConfig subclass")
+            if config_class.module_name != name:
+                raise TypeError(
+                    f"Module '{name}' ({module_paths[name]}) declares module_name '{config_class.module_name}'"
+                )
+            _loaded_classes[name] = config_class
+        return _loaded_classes[name]
@@ -1,15 +1,37 @@
 import dataclasses
+import functools
+import itertools
 import os
 import re
-import subprocess
-from typing import Dict, List, Optional
+import sys
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
 
 from ruamel.yaml.scalarstring import PreservedScalarString as pss
 
 from cc_builder.console_output import print_debug, print_error, print_info, print_module_header, print_warning
-from cc_builder.custom_types import BaseConfig
+from cc_builder.custom_types import BaseConfig, slotted
+from cc_builder.file_scan import read_files_concurrently, scan_files
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, FileFingerprint, HostAccessor
 
+DPKG_STATUS_PATH = "/var/lib/dpkg/status"
+APT_EXTENDED_STATES_PATH = "/var/lib/apt/extended_states"
+# dpkg package states in which a package is not (even partially) installed
+DPKG_NOT_INSTALLED_STATES = ("not-installed", "config-files")
 
+SOURCES_LIST_D_PATH = "/etc/apt/sources.list.d/"
+# fields of a deb822 sources stanza that make up the repository line, all others are options
+DEB822_REPOSITORY_FIELDS = ("types", "uris", "suites", "components", "enabled")
+# deb822 option fields whose one-line option has another name, see sources.list(5)
+DEB822_OPTION_NAMES = {"architectures": "arch", "languages": "lang", "targets": "target"}
+
+# One-line sources.list entry, see sources.list(5): type, optional [options], URI, suite, components and an optional
+# trailing comment. Any run of spaces and tabs separates fields.
+SOURCES_LINE_PATTERN = re.compile(
+    r"[ \t]*(deb|deb-src)[ \t]+(?:\[([^\]]*)\][ \t]*)?([^\s#]+)[ \t]+([^\s#]+)((?:[ \t]+[^\s#]+)*)[ \t]*(?:#.*)?\s*"
+)
+
+
+@slotted
 @dataclasses.dataclass
 class AptRepository:
     original_repo_line: str
@@ -21,27 +43,155 @@ class AptRepository:
     suite: str
     components: Optional[List[str]]
 
+    @classmethod
+    def parse(cls, line: str, file_path: Optional[str] = None) -> "AptRepository":
+        """
+        Parse a one-line sources.list entry in a single regular expression match.
+        Raises ValueError if the line is not a deb or deb-src entry.
+        """
+        match = SOURCES_LINE_PATTERN.fullmatch(line)
+        if match is None:
+            raise ValueError(f"Not a one-line apt source: {line!r}")
+        archive_type, options_str, uri, suite, components_str = match.groups()
+        options = None
+        if options_str is not None:
+            # values may contain "=" themselves and list several values separated by commas
+            options = {}
+            for option in options_str.split():
+                key, _, value = option.partition("=")
+                options[key] = value.split(",")
+        components = components_str.split() or None
+        # normalized to single spaces, without the trailing comment
+        location = [uri, suite] + (components or [])
+        repo_line_without_options = " ".join([archive_type] + location)
+        if options_str is None:
+            original_repo_line = repo_line_without_options
+        else:
+            original_repo_line = " ".join([archive_type, f"[{' '.join(options_str.split())}]"] + location)
+        return cls(
+            original_repo_line=original_repo_line,
+            repo_line_without_options=repo_line_without_options,
+            name=sys.intern(file_path.split("/")[-1]) if file_path else "UNKNOWN",
+            archive_type=sys.intern(archive_type),
+            options=options,
+            uri=sys.intern(uri),
+            suite=sys.intern(suite),
+            components=[sys.intern(component) for component in components] if components else None,
+        )
+
+    @classmethod
+    def from_deb822_stanza(cls, stanza: Dict[str, str], file_path: Optional[str] = None) -> List["AptRepository"]:
+        """
+        Create the repositories described by a stanza of a deb822 .sources file, as read by iter_deb822_stanzas:
+        one for every combination of its Types, URIs and Suites (see deb822_to_one_lines), each carrying the
+        stanza's options. Returns an empty list for disabled or incomplete stanzas.
+        """
+        name = file_path.split("/")[-1].replace(".sources", ".list") if file_path else "UNKNOWN"
+        if stanza.get("enabled", "yes").lower() == "no":
+            print_debug(f"Skipping disabled repository in {name}")
+            return []
+        if not all(stanza.get(field, "").strip() for field in ("types", "uris", "suites")):
+            print_debug(f"Skipping incomplete deb822 stanza in {name}")
+            return []
+        # every other field is an option, named as it is in the one-line format where that differs
+        options = {
+            DEB822_OPTION_NAMES.get(key, key): value.split() if "\n" not in value else [value]
+            for key, value in stanza.items()
+            if key not in DEB822_REPOSITORY_FIELDS
+        }
+        single_line_options = " ".join(
+            f"{key}={','.join(values)}" for key, values in options.items() if "\n" not in values[0]
+        )
+        components = [sys.intern(component) for component in stanza.get("components", "").split()] or None
+        repositories = []
+        for repo_line_without_options in deb822_to_one_lines(stanza):
+            archive_type, uri, suite = repo_line_without_options.split(" ")[:3]
+            location = repo_line_without_options.split(" ", 1)[1]
+            repositories.append(
+                cls(
+                    original_repo_line=(
+                        f"{archive_type} [{single_line_options}] {location}"
+                        if single_line_options
+                        else repo_line_without_options
+                    ),
+                    repo_line_without_options=repo_line_without_options,
+                    name=sys.intern(name),
+                    archive_type=sys.intern(archive_type),
+                    # shared by the repositories of the stanza, like the components
+                    options=options or None,
+                    uri=sys.intern(uri),
+                    suite=sys.intern(suite),
+                    components=components,
+                )
+            )
+        return repositories
+
+    @classmethod
+    def parse_many(cls, lines: Iterable[str], file_path: Optional[str] = None) -> List["AptRepository"]:
+        """
+        Parse every deb and deb-src entry of a one-line sources file, skipping blank lines and comments.
+        """
+        repositories = []
+        for line in lines:
+            stripped = line.strip()
+            if not stripped.startswith("deb"):
+                continue
+            try:
+                repositories.append(cls.parse(stripped, file_path=file_path))
+            except ValueError:
+                print_debug(f"Skipping malformed apt source line in {file_path or 'input'}: {stripped}")
+        return repositories
+
 
+# parsed sources.list.d files by (host cache identity, path), with the fingerprint of the file they were parsed from
+_sources_file_cache: Dict[Tuple[str, str], Tuple[FileFingerprint, List[AptRepository]]] = {}
+
+
+@slotted
 @dataclasses.dataclass
-class AptPackage:
-    name: str
+class PackageInventory:
+    """
+    The names of the manually installed packages of a host, in the order they are written to `packages:`.
+
+    Hosts carry thousands of packages, so they are kept as one list of interned names rather than an object per
+    package. Names shared between hosts of a fleet, or with the previous capture, are only stored once.
+    """
+
+    names: List[str] = dataclasses.field(default_factory=list)
+    # dpkg's native architecture: names are bare for it and Architecture: all, qualified (name:arch) otherwise
+    architecture: Optional[str] = None
+
+    @classmethod
+    def from_names(cls, names: Iterable[str], architecture: Optional[str] = None) -> "PackageInventory":
+        return cls(names=[sys.intern(name) for name in names], architecture=architecture)
+
+    def __len__(self) -> int:
+        return len(self.names)
 
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
 
-def deb822_to_one_line(deb822_repo):
-    repo_line = ""
-    repo_line += "deb "
-    repo_line += deb822_repo["uris"] + " "
-    repo_line += deb822_repo["suites"] + " "
-    repo_line += deb822_repo["components"]
 
-    return repo_line
+def deb822_to_one_lines(deb822_repo: Dict[str, str]) -> List[str]:
+    """
+    The one-line entries, without options, equivalent to a deb822 sources stanza. A stanza listing several Types,
+    URIs or Suites stands for every combination of them, e.g. "Types: deb deb-src" with "Suites: noble
+    noble-updates" for four entries, listed in the order apt reads them.
+    """
+    components = deb822_repo.get("components", "").split()
+    return [
+        " ".join([archive_type, uri, suite] + components)
+        for archive_type, uri, suite in itertools.product(
+            deb822_repo.get("types", "deb").split(), deb822_repo["uris"].split(), deb822_repo["suites"].split()
+        )
+    ]
 
 
-def get_sources_list_lines() -> List[str]:
+def get_sources_list_lines(accessor: HostAccessor = LOCAL_HOST_ACCESSOR) -> List[str]:
     sources_list = []
     sources_list_path = "/etc/apt/sources.list"
     # Read main sources.list
-    with open(sources_list_path, "r") as sources_list_file:
+    with accessor.open_file(sources_list_path) as sources_list_file:
         for line in sources_list_file:
             if line.startswith("deb"):
                 sources_list.append(line.strip())
@@ -50,109 +200,503 @@ def get_sources_list_lines() -> List[str]:
 
 
 def parse_repository_line(line: str, file_path=None) -> AptRepository:
-    # Repo line format source: https://manpages.ubuntu.com/manpages/trusty/man5/sources.list.5.html
-    repo_info = {}
-    repo_info["original_repo_line"] = line.replace("  ", " ")  # replace double spaces with single space
-    repo_info["archive_type"] = line.split()[0]
-    # if options exist
-    if re.findall(r"\[.*?\]", line):
-        repo_info["options"] = {}
-        options_str = re.findall(r"\[(.*?)\]", line)[0]
-        # parse each option and add to dict
-        for option in options_str.strip().split():
-            key, value = option.split("=")
-            # if value is comma separated, split into list
-            repo_info["options"][key] = value.split(",")
-        # replace options string with empty string to make parsing rest of line easier
-        line = line.replace(f"[{options_str}] ", "")
-    else:
-        repo_info["options"] = None
-    line = line.replace("  ", " ")  # replace double spaces with single space
-    repo_info["repo_line_without_options"] = line
-    repo_info["name"] = file_path.split("/")[-1] if file_path else "UNKNOWN"
-    repo_info["uri"] = line.split()[1]
-    repo_info["suite"] = " ".join(line.split()[2 : min(4, len(line.split()))])
-    if len(line.split()) > 4:
-        repo_info["components"] = line.split()[4:]
-    else:
-        repo_info["components"] = None
-    return AptRepository(**repo_info)
-
-
-def get_apt_repositories() -> List[str]:
-    sources_list_d_path = "/etc/apt/sources.list.d/"
+    return AptRepository.parse(line, file_path=file_path)
+
+
+def iter_deb822_stanzas(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """
+    Stream the stanzas of a deb822 file (e.g. a .sources file), yielding a dict per stanza with every field.
+    Field names are lowercased since they are case-insensitive. Continuation lines are joined to their field's
+    value with newlines, "." lines standing for empty lines. Comment lines are skipped.
+    """
+    stanza: Dict[str, str] = {}
+    field = None
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        if not line.strip():
+            if stanza:
+                yield stanza
+                stanza = {}
+            field = None
+        elif line[0] in " \t":
+            if field is not None:
+                continuation = line.strip()
+                # multi-line values such as inline keys often start on the line after the field name
+                prefix = stanza[field] + "\n" if stanza[field] else ""
+                stanza[field] = prefix + ("" if continuation == "." else continuation)
+        else:
+            key, _, value = line.partition(":")
+            field = key.strip().lower()
+            stanza[field] = value.strip()
+    if stanza:
+        yield stanza
+
+
+def parse_sources_file(name: str, path: str, content: str) -> List[AptRepository]:
+    """
+    Parse the content of a one-line .list or deb822 .sources file from sources.list.d.
+    """
+    lines = content.splitlines(keepends=True)
+    if name.endswith(".list"):
+        return AptRepository.parse_many(lines, file_path=path)
+    repositories = []
+    for stanza in iter_deb822_stanzas(lines):
+        repositories.extend(AptRepository.from_deb822_stanza(stanza, file_path=path))
+    return repositories
+
+
+def get_apt_repositories(accessor: HostAccessor = LOCAL_HOST_ACCESSOR) -> List[AptRepository]:
+    # one scan of sources.list.d, which also yields the fingerprints the per-file cache is checked against
+    entries = [
+        entry for entry in scan_files(SOURCES_LIST_D_PATH, accessor) if entry.name.endswith((".list", ".sources"))
+    ]
+
+    # parsed files are kept for the rest of the process and reused while the file's fingerprint is unchanged
+    identity = accessor.cache_identity()
+    parsed: Dict[str, List[AptRepository]] = {}
+    for entry in entries:
+        cached = _sources_file_cache.get((identity, entry.path)) if identity and entry.fingerprint else None
+        if cached is not None and cached[0] == entry.fingerprint:
+            parsed[entry.path] = cached[1]
+    changed = [entry for entry in entries if entry.path not in parsed]
+    contents = read_files_concurrently([entry.path for entry in changed], accessor)
+    for entry in changed:
+        content = contents[entry.path]
+        if content is None:
+            print_warning(f"Could not read {entry.path}, skipping it")
+            continue
+        parsed[entry.path] = parse_sources_file(entry.name, entry.path, content)
+        if identity and entry.fingerprint:
+            _sources_file_cache[(identity, entry.path)] = (entry.fingerprint, parsed[entry.path])
+
     deb822_sources_repos = []
     apt_list_repos = []
-    # # Read files in sources.list.d directory
-    for filename in os.listdir(sources_list_d_path):
-        file_path = os.path.join(sources_list_d_path, filename)
+    for entry in entries:
         # old one-line format for sources.list.d
-        if filename.endswith(".list"):
-            with open(file_path, "r") as apt_list_file:
-                for line in apt_list_file:
-                    if line.startswith("deb"):
-                        # sources_list_d.append(parse_repository_line(line.strip(), file_path=file_path))
-                        apt_list_repos.append(parse_repository_line(line.strip(), file_path=file_path))
+        if entry.name.endswith(".list"):
+            apt_list_repos.extend(parsed.get(entry.path, []))
         # new deb-822 format for sources.list.d
-        elif filename.endswith(".sources"):
-            with open(file_path, "r") as deb822_sources_file:
-                relevant_lines = [
-                    l
-                    for l in deb822_sources_file.readlines()
-                    if l.split(":")[0] in ("Types", "URIs", "Suites", "Components")
-                ]
-                parsed_repo = {l.split(":")[0].lower(): l.split(":", maxsplit=1)[1].strip() for l in relevant_lines}
-                deb822_sources_repos.append(
-                    AptRepository(
-                        original_repo_line=None,
-                        repo_line_without_options=deb822_to_one_line(parsed_repo),
-                        name=filename.replace(".sources", ".list"),
-                        archive_type=None,
-                        options=None,
-                        uri=parsed_repo["uris"],
-                        suite=parsed_repo["suites"],
-                        components=parsed_repo["components"].split(),
-                    )
-                )
+        else:
+            deb822_sources_repos.extend(parsed.get(entry.path, []))
     print_debug(f"Found {len(apt_list_repos)} old-style one-line repositories in sources.list.d")
     print_debug(f"Found {len(deb822_sources_repos)} new-style deb822 repositories in sources.list.d")
     return apt_list_repos + deb822_sources_repos
 
 
 def get_simplified_apt_source_line(line: str) -> str:
-    if re.findall(r"\[.*?\]", line):
-        options_str = re.findall(r"\[(.*?)\]", line)[0]
-        line = line.replace(f"[{options_str}] ", "")
-    line = line.replace("  ", " ")  # replace double spaces with single space
-    return line
+    try:
+        return AptRepository.parse(line.strip()).repo_line_without_options
+    except ValueError:
+        return " ".join(line.split())
+
+
+def iter_control_stanzas(lines: Iterable[str], fields: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """
+    Stream the stanzas of a dpkg/apt control file (e.g. /var/lib/dpkg/status), yielding a dict per stanza
+    holding only the requested fields. Continuation lines and all other fields are skipped without parsing.
+    """
+    prefixes = tuple(f"{field}:" for field in fields)
+    stanza: Dict[str, str] = {}
+    for line in lines:
+        if line == "\n":
+            if stanza:
+                yield stanza
+                stanza = {}
+        elif line.startswith(prefixes):
+            key, _, value = line.partition(":")
+            stanza[key] = value.strip()
+    if stanza:
+        yield stanza
+
+
+def read_auto_installed_packages(
+    accessor: HostAccessor = LOCAL_HOST_ACCESSOR, extended_states_path: str = APT_EXTENDED_STATES_PATH
+) -> Set[Tuple[str, str]]:
+    """
+    Return the (name, architecture) pairs apt has marked as automatically installed.
+    A missing extended_states file simply means nothing has been marked automatic yet.
+    """
+    try:
+        with accessor.open_file(extended_states_path) as extended_states_file:
+            return {
+                (stanza["Package"], stanza.get("Architecture", ""))
+                for stanza in iter_control_stanzas(extended_states_file, ("Package", "Architecture", "Auto-Installed"))
+                if stanza.get("Auto-Installed") == "1" and "Package" in stanza
+            }
+    except FileNotFoundError:
+        return set()
+
+
+def read_manually_installed_packages(
+    accessor: HostAccessor = LOCAL_HOST_ACCESSOR,
+    status_path: str = DPKG_STATUS_PATH,
+    extended_states_path: str = APT_EXTENDED_STATES_PATH,
+) -> List[str]:
+    """
+    Compute the same package list as `apt-mark showmanual` by reading the dpkg status database and apt's
+    extended_states file directly.
 
+    Installed packages not marked as automatically installed are manual. Like apt, packages of the native
+    architecture (and Architecture: all) are listed by name, foreign architecture packages as name:arch.
 
-def get_apt_packages():
-    result = subprocess.run("apt-mark showmanual", shell=True, stdout=subprocess.PIPE, text=True)
-    lines = result.stdout.strip().split("\n")
-    result = [AptPackage(name=line.strip()) for line in lines]
+    Raises FileNotFoundError if the dpkg status file does not exist.
+    """
+    return read_manually_installed_packages_and_architecture(accessor, status_path, extended_states_path)[0]
+
+
+def read_manually_installed_packages_and_architecture(
+    accessor: HostAccessor = LOCAL_HOST_ACCESSOR,
+    status_path: str = DPKG_STATUS_PATH,
+    extended_states_path: str = APT_EXTENDED_STATES_PATH,
+) -> Tuple[List[str], Optional[str]]:
+    """
+    The packages of read_manually_installed_packages and the native architecture they are named against, or None
+    if dpkg itself is not installed. The native architecture is taken from the dpkg package, so the status file is
+    read in one pass.
+    """
+    auto_installed = read_auto_installed_packages(accessor, extended_states_path)
+    native_arch = None
+    installed = []
+    with accessor.open_file(status_path) as status_file:
+        for stanza in iter_control_stanzas(status_file, ("Package", "Architecture", "Status")):
+            name = stanza.get("Package")
+            status = stanza.get("Status", "").split()
+            if not name or len(status) != 3 or status[2] in DPKG_NOT_INSTALLED_STATES:
+                continue
+            arch = stanza.get("Architecture", "")
+            if name == "dpkg":
+                native_arch = arch
+            installed.append((name, arch))
+
+    manual_packages = []
+    for name, arch in installed:
+        # apt records Architecture: all packages under the native architecture
+        state_arch = native_arch if arch == "all" and native_arch else arch
+        if (name, state_arch) in auto_installed:
+            continue
+        if native_arch and arch not in (native_arch, "all"):
+            name = f"{name}:{arch}"
+        manual_packages.append(name)
+    return sorted(manual_packages), native_arch
+
+
+def get_apt_packages_from_apt_mark(accessor: HostAccessor = LOCAL_HOST_ACCESSOR) -> List[str]:
+    result = accessor.run("apt-mark showmanual")
+    return [line.strip() for line in result.stdout.strip().split("\n") if line.strip()]
+
+
+def get_dpkg_architecture(accessor: HostAccessor = LOCAL_HOST_ACCESSOR) -> Optional[str]:
+    result = accessor.run("dpkg --print-architecture")
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+
+def get_apt_packages(accessor: HostAccessor = LOCAL_HOST_ACCESSOR) -> PackageInventory:
+    try:
+        package_names, architecture = read_manually_installed_packages_and_architecture(accessor)
+    except FileNotFoundError:
+        if not accessor.can_run_commands:
+            print_warning(f"{DPKG_STATUS_PATH} not found, no apt packages will be gathered")
+            return PackageInventory()
+        print_debug(f"{DPKG_STATUS_PATH} not found, falling back to apt-mark")
+        package_names = get_apt_packages_from_apt_mark(accessor)
+        architecture = get_dpkg_architecture(accessor)
+    result = PackageInventory.from_names(package_names, architecture)
     print_debug(f"Found {len(result)} installed apt packages")
     return result
 
 
+@functools.lru_cache(maxsize=None)
+def read_base_manifest(manifest_path: str, native_arch: Optional[str] = None) -> FrozenSet[str]:
+    """
+    Read the packages of an Ubuntu cloud image .manifest file, which lists one "package<TAB>version" per line, as
+    they are named in `packages:`. Packages qualified with an architecture (libc6:amd64) are kept as they are and
+    also matched by their bare name if the architecture is `native_arch` or all, like apt names them, so that
+    libc6:i386 does not stand for the native libc6. Without `native_arch`, the architecture most packages of the
+    manifest are qualified with is taken. snap: lines are skipped. Manifests are read once per process, so
+    rendering many cloud-configs against one only reads it once.
+    """
+    packages = set()
+    qualified: Dict[str, List[str]] = {}
+    with open(manifest_path, "r") as manifest_file:
+        for line in manifest_file:
+            fields = line.split()
+            if not fields or fields[0].startswith(("#", "snap:")):
+                continue
+            packages.add(fields[0])
+            name, _, arch = fields[0].partition(":")
+            if arch:
+                qualified.setdefault(arch, []).append(name)
+    if native_arch is None:
+        architectures = [arch for arch in qualified if arch != "all"]
+        if architectures:
+            native_arch = max(architectures, key=lambda arch: len(qualified[arch]))
+    if native_arch is not None:
+        packages.update(qualified.get(native_arch, ()))
+    packages.update(qualified.get("all", ()))
+    return frozenset(packages)
+
+
+def parse_dependency_field(value: str) -> List[List[Tuple[str, Optional[str]]]]:
+    """
+    Split a Depends, Pre-Depends or Provides field into its groups of alternatives, dropping version constraints,
+    as (name, architecture qualifier) pairs, e.g. "libc6 (>= 2.34), python3:any | python3-minimal" into
+    [[("libc6", None)], [("python3", "any"), ("python3-minimal", None)]].
+    """
+    groups = []
+    for group in value.split(","):
+        alternatives = [alternative.split("(")[0].split("[")[0].strip() for alternative in group.split("|")]
+        pairs = []
+        for alternative in alternatives:
+            if alternative:
+                name, _, qualifier = alternative.partition(":")
+                pairs.append((name, qualifier or None))
+        if pairs:
+            groups.append(pairs)
+    return groups
+
+
+def read_dependency_graph(
+    accessor: HostAccessor = LOCAL_HOST_ACCESSOR, status_path: str = DPKG_STATUS_PATH
+) -> Dict[str, List[str]]:
+    """
+    Map every installed package to the installed packages its Pre-Depends and Depends pull in, read from the dpkg
+    status database. Only dependencies that are certain to install the same package again are kept: of a group of
+    alternatives only the first one, as apt picks it, and virtual packages only when a single installed package
+    provides them.
+
+    Packages are named like in read_manually_installed_packages: by name for the native architecture and
+    Architecture: all, as name:arch for foreign architectures. A dependency is taken to be the installed package of
+    the depending package's architecture (the native one for Architecture: all), of Architecture: all, or of the
+    architecture it is qualified with, falling back to the only installed architecture of the package, e.g. a
+    Multi-Arch: foreign one.
+
+    Raises FileNotFoundError if the dpkg status file does not exist.
+    """
+    depends: Dict[Tuple[str, str], List[List[Tuple[str, Optional[str]]]]] = {}
+    architectures: Dict[str, List[str]] = {}
+    providers: Dict[str, Set[Tuple[str, str]]] = {}
+    native_arch = None
+    with accessor.open_file(status_path) as status_file:
+        fields = ("Package", "Architecture", "Status", "Pre-Depends", "Depends", "Provides")
+        for stanza in iter_control_stanzas(status_file, fields):
+            name = stanza.get("Package")
+            status = stanza.get("Status", "").split()
+            if not name or len(status) != 3 or status[2] in DPKG_NOT_INSTALLED_STATES:
+                continue
+            arch = stanza.get("Architecture", "")
+            if name == "dpkg":
+                native_arch = arch
+            if (name, arch) not in depends:
+                architectures.setdefault(name, []).append(arch)
+            groups = parse_dependency_field(stanza.get("Pre-Depends", ""))
+            groups += parse_dependency_field(stanza.get("Depends", ""))
+            depends.setdefault((name, arch), []).extend(groups)
+            for provided in parse_dependency_field(stanza.get("Provides", "")):
+                providers.setdefault(provided[0][0], set()).add((name, arch))
+
+    def apt_name(package: Tuple[str, str]) -> str:
+        name, arch = package
+        if native_arch and arch not in (native_arch, "all"):
+            return f"{name}:{arch}"
+        return name
+
+    def resolve(dependency: str, qualifier: Optional[str], arch: str) -> Optional[Tuple[str, str]]:
+        if qualifier not in (None, "any"):
+            candidates = [qualifier]
+        else:
+            candidates = [native_arch if arch == "all" else arch, "all"]
+        for candidate in candidates:
+            if candidate is not None and (dependency, candidate) in depends:
+                return (dependency, candidate)
+        if qualifier in (None, "any") and len(architectures.get(dependency, ())) == 1:
+            return (dependency, architectures[dependency][0])
+        if dependency not in architectures and len(providers.get(dependency, ())) == 1:
+            return next(iter(providers[dependency]))
+        return None
+
+    graph: Dict[str, List[str]] = {}
+    for (name, arch), groups in depends.items():
+        pulled_in = []
+        for alternatives in groups:
+            dependency = resolve(*alternatives[0], arch)
+            if dependency is not None:
+                pulled_in.append(apt_name(dependency))
+        graph.setdefault(apt_name((name, arch)), []).extend(pulled_in)
+    return graph
+
+
+def strongly_connected_components(graph: Dict[str, List[str]], roots: Iterable[str]) -> List[List[str]]:
+    """
+    The strongly connected components of the part of `graph` reachable from `roots` (Tarjan's algorithm, without
+    recursion as dependency chains get long), each component after all components it has edges to.
+    """
+    index: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    stack: List[str] = []
+    on_stack: Set[str] = set()
+    components: List[List[str]] = []
+    for root in roots:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph.get(root, ())))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(graph.get(successor, ()))))
+                    break
+                if successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def find_pulled_in_packages(graph: Dict[str, List[str]], packages: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Map each of `packages` that pulls in others of them through the dependency `graph` (see read_dependency_graph),
+    directly or through packages that are not listed, to those packages.
+
+    Packages depending on each other are collapsed into one component first, so the packages reachable from each
+    component are only collected once however many of the listed packages reach it.
+    """
+    listed = set(packages)
+    components = strongly_connected_components(graph, sorted(listed))
+    component_of = {member: number for number, component in enumerate(components) for member in component}
+    listed_members = [frozenset(member for member in component if member in listed) for component in components]
+    # the listed packages reachable from each component, over at least one dependency
+    reachable: List[FrozenSet[str]] = []
+    for number, component in enumerate(components):
+        reached: Set[str] = set()
+        cyclic = len(component) > 1 or component[0] in graph.get(component[0], ())
+        if cyclic:
+            reached |= listed_members[number]
+        for member in component:
+            for dependency in graph.get(member, ()):
+                other = component_of[dependency]
+                if other != number:
+                    reached |= reachable[other]
+                    reached |= listed_members[other]
+        reachable.append(frozenset(reached))
+
+    pulled_in = {}
+    for package in listed:
+        found = reachable[component_of[package]] - {package}
+        if found:
+            pulled_in[sys.intern(package)] = sorted(sys.intern(name) for name in found)
+    return pulled_in
+
+
+def drop_pulled_in_packages(packages: List[str], pulled_in: Dict[str, List[str]]) -> List[str]:
+    """
+    Leave out the packages that another one of `packages` pulls in anyway (see find_pulled_in_packages). Of
+    packages that pull each other in, the first one by name is kept, unless a package outside of them pulls them
+    all in.
+    """
+    listed = set(packages)
+    pulled_in_by: Dict[str, List[str]] = {}
+    for package in packages:
+        for dependency in pulled_in.get(package, ()):
+            if dependency in listed and dependency != package:
+                pulled_in_by.setdefault(dependency, []).append(package)
+    kept = []
+    for package in packages:
+        own = set(pulled_in.get(package, ()))
+        # pulled in by a package it does not pull in itself, or by one of the same dependency cycle that is kept
+        if any(other not in own or other < package for other in pulled_in_by.get(package, ())):
+            continue
+        kept.append(package)
+    return kept
+
+
 @dataclasses.dataclass
 class AptConfig(BaseConfig):
-    packages: List[AptPackage] = dataclasses.field(default_factory=list)
-    sources: List[str] = dataclasses.field(default_factory=list)
+    module_name = "apt"
+    host_files = (DPKG_STATUS_PATH, APT_EXTENDED_STATES_PATH, "/etc/apt/sources.list")
+    cache_inputs = host_files + ("/etc/apt/sources.list.d/",)
+    option_fields = {"base_manifest": "base_manifest", "drop_dependencies": "drop_dependencies"}
+    cloud_config_keys = ("apt", "packages")
+
+    packages: PackageInventory = dataclasses.field(default_factory=PackageInventory)
+    sources: List[AptRepository] = dataclasses.field(default_factory=list)
     sources_list: List[str] = dataclasses.field(default_factory=list)
+    # a cloud image .manifest whose packages are left out of `packages:`, see --base-manifest
+    base_manifest: Optional[str] = None
+    # leave out packages pulled in by the Depends of other packages, see --drop-dependencies
+    drop_dependencies: bool = False
+    # the packages each package pulls in (see find_pulled_in_packages), only gathered with drop_dependencies
+    pulled_in: Optional[Dict[str, List[str]]] = None
+
+    def gather(self, accessor: HostAccessor = LOCAL_HOST_ACCESSOR):
+        self.sources = get_apt_repositories(accessor)
+        self.sources_list = get_sources_list_lines(accessor)
+        self.packages = get_apt_packages(accessor)
+        if self.drop_dependencies:
+            try:
+                self.pulled_in = find_pulled_in_packages(read_dependency_graph(accessor), self.packages)
+            except FileNotFoundError:
+                print_warning(f"{DPKG_STATUS_PATH} not found, packages pulled in by others will not be left out")
 
-    def gather(self):
-        self.sources = get_apt_repositories()
-        self.sources_list = get_sources_list_lines()
-        self.packages = get_apt_packages()
+    def select_packages(self) -> List[str]:
+        """
+        The packages to write to `packages:`, without those of the base manifest and, with drop_dependencies,
+        those pulled in by others.
+        """
+        packages = list(self.packages.names)
+        if self.base_manifest:
+            base_packages = read_base_manifest(self.base_manifest, self.packages.architecture)
+            packages = [name for name in packages if name not in base_packages]
+            print_debug(f"Left out {len(self.packages) - len(packages)} packages of {self.base_manifest}")
+        if self.drop_dependencies:
+            if self.pulled_in is None:
+                print_warning("Dependencies of the apt packages were not gathered, no dependencies are left out")
+            else:
+                count = len(packages)
+                packages = drop_pulled_in_packages(packages, self.pulled_in)
+                print_debug(f"Left out {count - len(packages)} packages pulled in by others")
+        return packages
 
     def generate_cloud_config(self) -> Dict:
         known_sources = [repo for repo in self.sources if repo.name != "UNKNOWN"]
+        sources = {}
+        for repo in known_sources:
+            # files holding several repositories get one source each, the later ones numbered and written to the
+            # same file, which cloud-init appends to
+            name, number = repo.name, 1
+            source = {"source": repo.repo_line_without_options}
+            while name in sources:
+                number += 1
+                stem, extension = os.path.splitext(repo.name)
+                name = f"{stem}-{number}{extension}"
+                source["filename"] = repo.name
+            sources[name] = source
 
         return {
             "apt": {
-                "sources": {repo.name: {"source": repo.repo_line_without_options} for repo in known_sources},
+                "sources": sources,
                 "sources_list": pss("\n".join(self.sources_list)),
             },
-            "packages": [package.name for package in self.packages],
+            # a single copy of the name list, the emitter may hold on to it
+            "packages": self.select_packages(),
         }
@@ -1,22 +1,25 @@
 import dataclasses
-import socket
 
 from cc_builder.console_output import print_debug, print_error, print_info, print_module_header, print_warning
 from cc_builder.custom_types import BaseConfig
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, HostAccessor
 
 
-def get_hostname():
-    hostname = socket.gethostname()
+def get_hostname(accessor: HostAccessor = LOCAL_HOST_ACCESSOR):
+    hostname = accessor.get_hostname()
     print_debug(f"Found hostname: {hostname}")
     return hostname
 
 
 @dataclasses.dataclass
 class HostnameConfig(BaseConfig):
+    module_name = "hostname"
+    cloud_config_keys = ("hostname",)
+
     hostname: str = None
 
-    def gather(self):
-        self.hostname = get_hostname()
+    def gather(self, accessor: HostAccessor = LOCAL_HOST_ACCESSOR):
+        self.hostname = get_hostname(accessor)
 
     def generate_cloud_config(self):
         return {
@@ -1,12 +1,15 @@
 import dataclasses
+import json
 import re
-import subprocess
+import sys
 from typing import Dict, List, Optional
 
-import yaml
-
 from cc_builder.console_output import print_debug, print_error, print_info, print_module_header, print_warning
-from cc_builder.custom_types import BaseConfig
+from cc_builder.custom_types import BaseConfig, slotted
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, HostAccessor
+from cc_builder.snapd import SnapdClient, SnapdError
+
+SNAPD_STATE_PATH = "/var/lib/snapd/state.json"
 
 BLACKLISTED_SNAP_NAMES_REGEX_PATTERNS = [
     "^core[0-9]*",
@@ -15,40 +18,171 @@ BLACKLISTED_SNAP_NAMES_REGEX_PATTERNS = [
 ]
 
 
+@slotted
 @dataclasses.dataclass
 class Snap:
     name: str
     version: str
     rev: str
-    tracking: str
-    publisher: str
-    notes: str
+    # None where `snap list` shows "-"
+    tracking: Optional[str]
+    publisher: Optional[str]
+    notes: Optional[str]
+    confinement: Optional[str] = None  # strict, classic or devmode. Not known when gathered with `snap list`
+
+    def __post_init__(self):
+        # channels, publishers and notes repeat across the snaps of a host and across hosts
+        for field in ("tracking", "publisher", "notes", "confinement"):
+            value = getattr(self, field)
+            if value is not None:
+                setattr(self, field, sys.intern(value))
+
+    @property
+    def is_classic(self) -> bool:
+        if self.confinement is not None:
+            return self.confinement == "classic"
+        return "classic" in (self.notes or "").split(",")
+
+
+# snap types that `snap list` notes, snaps of type app are not noted
+NOTED_SNAP_TYPES = ("core", "base", "snapd", "gadget", "kernel", "os")
+
+
+def format_snap_notes(
+    snap_type: Optional[str] = None,
+    devmode: bool = False,
+    jailmode: bool = False,
+    classic: bool = False,
+    disabled: bool = False,
+) -> Optional[str]:
+    """
+    Format the notes `snap list` shows for a snap, None where it shows "-".
+    """
+    notes = [snap_type] if snap_type in NOTED_SNAP_TYPES else []
+    for note, is_set in (("devmode", devmode), ("jailmode", jailmode), ("classic", classic), ("disabled", disabled)):
+        if is_set:
+            notes.append(note)
+    return ",".join(notes) or None
+
 
+def get_snaps_from_snapd_api(accessor: HostAccessor = LOCAL_HOST_ACCESSOR) -> List[Snap]:
+    """
+    Read the installed snaps from snapd's REST API in a single request.
+    """
+    snaps = []
+    for snap in SnapdClient(accessor).list_snaps():
+        confinement = snap.get("confinement")
+        publisher = snap.get("publisher") or {}
+        snaps.append(
+            Snap(
+                name=snap["name"],
+                version=snap.get("version", ""),
+                rev=str(snap.get("revision", "")),
+                tracking=snap.get("tracking-channel") or None,
+                publisher=publisher.get("username") or None,
+                notes=format_snap_notes(
+                    snap_type=snap.get("type"),
+                    devmode=snap.get("devmode", False),
+                    jailmode=snap.get("jailmode", False),
+                    classic=confinement == "classic",
+                    disabled=snap.get("status") not in (None, "active"),
+                ),
+                confinement=confinement,
+            )
+        )
+    return sorted(snaps, key=lambda snap: snap.name)
 
-def get_installed_snaps():
+
+def get_snaps_from_snap_list(accessor: HostAccessor = LOCAL_HOST_ACCESSOR) -> List[Snap]:
     # Run snap list command to get a list of installed snaps
-    result = subprocess.run("snap list", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    result = accessor.run("snap list")
     # Parse the output to extract snap names
-    installed_snaps = []
-    blacklisted_snaps = []
+    snaps = []
     lines = result.stdout.strip().split("\n")
     for line in lines[1:]:  # Skip the header line
         snap_info = line.split()
         if len(snap_info) >= 2:
             snap_name, version, rev, tracking, publisher, notes = snap_info[:6]
-            if not any(re.match(pattern, snap_name) for pattern in BLACKLISTED_SNAP_NAMES_REGEX_PATTERNS):
-                installed_snaps.append(
-                    Snap(
-                        name=snap_name,
-                        version=version,
-                        rev=rev,
-                        tracking=tracking if tracking != "-" else None,  # replace "-" with None
-                        publisher=publisher if publisher != "-" else None,  # replace "-" with None
-                        notes=notes if notes != "-" else None,  # replace "-" with None
-                    )
+            snaps.append(
+                Snap(
+                    name=snap_name,
+                    version=version,
+                    rev=rev,
+                    tracking=tracking if tracking != "-" else None,  # replace "-" with None
+                    publisher=publisher if publisher != "-" else None,  # replace "-" with None
+                    notes=notes if notes != "-" else None,  # replace "-" with None
                 )
-            else:
-                blacklisted_snaps.append(snap_name)
+            )
+    return snaps
+
+
+def get_snap_version_from_snap_yaml(name: str, revision: str, accessor: HostAccessor) -> str:
+    """
+    Read the version of an installed snap revision from its snap.yaml, if the snap's squashfs is mounted.
+    """
+    try:
+        with accessor.open_file(f"/snap/{name}/{revision}/meta/snap.yaml") as snap_yaml:
+            for line in snap_yaml:
+                if line.startswith("version:"):
+                    return line.split(":", 1)[1].strip().strip("'\"")
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return ""
+
+
+def get_snaps_from_snapd_state(accessor: HostAccessor = LOCAL_HOST_ACCESSOR) -> List[Snap]:
+    """
+    Read the installed snaps from snapd's state file, for hosts where the snap command cannot be run
+    (e.g. a root filesystem that is not booted).
+    """
+    try:
+        with accessor.open_file(SNAPD_STATE_PATH) as state_file:
+            state = json.load(state_file)
+    except FileNotFoundError:
+        print_debug(f"{SNAPD_STATE_PATH} not found, assuming snapd is not installed")
+        return []
+    snaps = []
+    for name, snap_state in sorted(state.get("data", {}).get("snaps", {}).items()):
+        revision = str(snap_state.get("current", ""))
+        confinement = None
+        if snap_state.get("classic"):
+            confinement = "classic"
+        elif snap_state.get("devmode"):
+            confinement = "devmode"
+        snaps.append(
+            Snap(
+                name=name,
+                version=get_snap_version_from_snap_yaml(name, revision, accessor),
+                rev=revision,
+                tracking=snap_state.get("channel") or None,
+                publisher=None,  # snapd only keeps the publisher's id in its state
+                notes=format_snap_notes(
+                    snap_type=snap_state.get("type"),
+                    devmode=snap_state.get("devmode", False),
+                    jailmode=snap_state.get("jailmode", False),
+                    classic=snap_state.get("classic", False),
+                    disabled=not snap_state.get("active", False),
+                ),
+                confinement=confinement,
+            )
+        )
+    return snaps
+
+
+def get_installed_snaps(accessor: HostAccessor = LOCAL_HOST_ACCESSOR):
+    if accessor.can_run_commands:
+        try:
+            snaps = get_snaps_from_snapd_api(accessor)
+        except (NotImplementedError, OSError, SnapdError) as e:
+            print_debug(f"Could not query snapd's API ({e or 'not available on this host'}), falling back to snap list")
+            snaps = get_snaps_from_snap_list(accessor)
+    else:
+        snaps = get_snaps_from_snapd_state(accessor)
+    installed_snaps = [
+        snap
+        for snap in snaps
+        if not any(re.match(pattern, snap.name) for pattern in BLACKLISTED_SNAP_NAMES_REGEX_PATTERNS)
+    ]
     print_debug(f"Found {len(installed_snaps)} installed snaps")
     installable_snaps = [snap for snap in installed_snaps if "+git" not in snap.version]
     return installable_snaps
@@ -57,16 +191,27 @@ def get_installed_snaps():
 # Snap Config class
 @dataclasses.dataclass
 class SnapConfig(BaseConfig):
+    module_name = "snap"
+    option_fields = {"pin_snap_channels": "pin_channels"}
+    host_commands = ("snap list",)
+    # snapd records every install, refresh and removal in its state file
+    cache_inputs = (SNAPD_STATE_PATH,)
+    cloud_config_keys = ("snap",)
+
     snaps: List[Snap] = dataclasses.field(default_factory=list)
+    # install every snap from the channel it is tracking instead of the snap's default channel
+    pin_channels: bool = False
 
-    def gather(self):
-        self.snaps = get_installed_snaps()
+    def gather(self, accessor: HostAccessor = LOCAL_HOST_ACCESSOR):
+        self.snaps = get_installed_snaps(accessor)
 
     def generate_cloud_config(self) -> Dict:
         return {
             "snap": {
                 "commands": [
-                    f"snap install {snap.name}" + (" --classic" if snap.notes == "classic" else "")
+                    f"snap install {snap.name}"
+                    + (f" --channel={snap.tracking}" if self.pin_channels and snap.tracking else "")
+                    + (" --classic" if snap.is_classic else "")
                     for snap in self.snaps
                 ]
             },
@@ -1,55 +1,139 @@
 import dataclasses
-import os
-import subprocess
-from typing import Dict
+from typing import Any, Dict, List, Optional
 
 from cc_builder.console_output import print_debug, print_error, print_info, print_module_header, print_warning
-from cc_builder.custom_types import BaseConfig
+from cc_builder.custom_types import BaseConfig, ModuleOptions
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, USER_DATABASE_COMMANDS, HostAccessor
+from cc_builder.user_database import SUDO_GROUPS, UserDatabase, load_user_database
 
 
-def get_shell() -> str:
-    result = subprocess.run("echo $SHELL", shell=True, stdout=subprocess.PIPE, text=True)
-    shell = result.stdout.strip()
+def get_shell(user: str, database: UserDatabase) -> str:
+    entry = database.get_user(user)
+    shell = entry.shell if entry is not None else ""
     print_debug(f"Found shell: {shell.split('/')[-1]}")
     return shell
 
 
-def get_sudo(user: str) -> bool:
-    result = subprocess.run("getent group sudo", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    is_sudo = user in result.stdout.strip().split(":")[3].split(",")
-    if not is_sudo:
-        print_debug(f"User '{user}' is not in the sudo group")
-    else:
-        print_debug(f"User '{user}' is in the sudo group")
-    return is_sudo
+def get_sudo(user: str, database: UserDatabase) -> bool:
+    groups = [group for group in database.admin_groups(user) if group in SUDO_GROUPS]
+    if not groups:
+        print_debug(f"User '{user}' is not in any of the {', '.join(SUDO_GROUPS)} groups")
+        return False
+    print_debug(f"User '{user}' is in the {', '.join(groups)} group{'s' if len(groups) > 1 else ''}")
+    return True
+
+
+def get_groups(user: str, database: UserDatabase) -> List[str]:
+    groups = database.supplementary_groups(user)
+    admin_groups = database.admin_groups(user)
+    print_debug(f"Found {len(groups)} supplementary groups for user '{user}'")
+    if admin_groups:
+        print_debug(f"User '{user}' is in the admin groups {', '.join(admin_groups)}")
+    return groups
 
 
 @dataclasses.dataclass
-class UserConfig(BaseConfig):
+class UserAccount:
     name: str
     sudo: bool = True
     shell: str = "/bin/bash"
+    groups: List[str] = dataclasses.field(default_factory=list)
+
+
+def get_user_account(name: str, database: UserDatabase, account: Optional[str] = None) -> UserAccount:
+    """
+    Gather the settings of `account` (by default `name` itself) to recreate it as user `name`.
+    """
+    account = account or name
+    return UserAccount(
+        name=name,
+        sudo=get_sudo(account, database),
+        shell=get_shell(account, database),
+        groups=get_groups(account, database),
+    )
+
+
+@dataclasses.dataclass
+class UserConfig(BaseConfig):
+    module_name = "user"
+    option_fields = {
+        "current_user": "name",
+        "password": "plaintext_password",
+        "selected_users": "selected_users",
+        "account": "account",
+    }
+    host_commands = USER_DATABASE_COMMANDS
+    cloud_config_keys = ("users",)
+
+    name: str
     plaintext_password: str = None
+    # the accounts to capture (see --users), only `name` if None
+    selected_users: Optional[List[str]] = None
+    # the account captured as `name` when it is renamed, e.g. to the default "ubuntu" user
+    account: Optional[str] = None
+    accounts: List[UserAccount] = dataclasses.field(default_factory=list)
+
+    @classmethod
+    def prompt_options(cls, options: ModuleOptions):
+        import click
 
-    def gather(self):
-        self.sudo = get_sudo(user=self.name)
-        self.shell = get_shell()
+        original_user = options.account or options.current_user
+        options.rename_to_ubuntu_user = click.confirm(
+            "Would you like to rename the user to the default 'ubuntu' username?",
+            default=options.rename_to_ubuntu_user,
+        )
+        if options.rename_to_ubuntu_user:
+            options.current_user = "ubuntu"
+            options.account = original_user
+        else:
+            options.current_user = original_user
+            options.account = None
+        set_password = click.confirm(
+            "Would you like to set a password for the user? "
+            "WARNING: This is insecure and stored in plaintext in the cloud-init config.",
+            default=bool(options.password),
+        )
+        if set_password:
+            options.password = click.prompt("Please enter the password", hide_input=True, confirmation_prompt=True)
+        else:
+            options.password = None
+
+    def apply_options(self, options: Dict[str, Any]):
+        if "current_user" in options and options["current_user"] != self.name:
+            # rename the captured account, keeping track of the account it was gathered from
+            name = options["current_user"]
+            self.account = self.account or self.name
+            self.accounts = [
+                dataclasses.replace(account, name=name) if account.name == self.name else account
+                for account in self.accounts
+            ]
+        super().apply_options(options)
+
+    def gather(self, accessor: HostAccessor = LOCAL_HOST_ACCESSOR):
+        database = load_user_database(accessor)
+        if self.selected_users is not None:
+            self.accounts = [get_user_account(name, database) for name in self.selected_users]
+        else:
+            self.accounts = [get_user_account(self.name, database, account=self.account)]
 
     def generate_cloud_config(self) -> Dict:
-        users_optional_config = {}
-        if self.plaintext_password:
-            users_optional_config = {
-                "plain_text_passwd": self.plaintext_password,
-                "lock_passwd": False,
-            }
-            print_debug(f"Adding plain text password '{self.plaintext_password}' for user '{self.name}'")
-        return {
-            "users": [
+        users = []
+        for account in self.accounts:
+            users_optional_config = {}
+            if self.plaintext_password and account.name == self.name:
+                users_optional_config = {
+                    "plain_text_passwd": self.plaintext_password,
+                    "lock_passwd": False,
+                }
+                print_debug(f"Adding plain text password '{self.plaintext_password}' for user '{self.name}'")
+            if account.groups:
+                users_optional_config["groups"] = account.groups
+            users.append(
                 {
-                    "name": self.name,
-                    "sudo": "ALL=(ALL) NOPASSWD:ALL" if self.sudo else None,
-                    "shell": self.shell,
+                    "name": account.name,
+                    "sudo": "ALL=(ALL) NOPASSWD:ALL" if account.sudo else None,
+                    "shell": account.shell,
                     **users_optional_config,
                 }
-            ],
-        }
+            )
+        return {"users": users}
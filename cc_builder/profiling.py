@@ -0,0 +1,334 @@
+import contextlib
+import contextvars
+import dataclasses
+import json
+import threading
+import time
+from typing import ContextManager, Dict, List, Optional, TextIO, cast
+
+from cc_builder.console_output import print_info
+from cc_builder.defaults import PROFILE_FORMATS
+
+PROFILE_FORMAT_VERSION = 1
+
+
+@dataclasses.dataclass
+class PhaseTiming:
+    """
+    Where one phase of a capture spent its time: a module's gather() or generate_cloud_config(), or a phase of the
+    whole capture such as prefetching or emitting the cloud-config.
+    """
+
+    module: str  # "" for phases of the whole capture
+    phase: str  # "gather", "generate", "prefetch" or "emit"
+    thread: str
+    start: float = 0.0  # seconds since the capture's profile started
+    wall_time: float = 0.0
+    # CPU time of the thread running the phase, neither the commands it runs nor its helper threads are included
+    cpu_time: float = 0.0
+    # commands run on the host, each one a subprocess (or a single ssh process for a batch of them)
+    subprocesses: int = 0
+    subprocess_time: float = 0.0
+    # command output, file content and snapd responses received from the host
+    bytes_read: int = 0
+
+    @property
+    def name(self) -> str:
+        return f"{self.module}.{self.phase}" if self.module else self.phase
+
+
+# the phase whose host requests are being counted in this thread (see measure)
+_current_phase: "contextvars.ContextVar[Optional[PhaseTiming]]" = contextvars.ContextVar(
+    "cc_builder_profiling_phase", default=None
+)
+_counter_lock = threading.Lock()
+
+
+def _size(text) -> int:
+    return len(text.encode("utf-8", "surrogateescape")) if isinstance(text, str) else len(text)
+
+
+def record_subprocess(duration: float, *outputs):
+    """
+    Count a command run on the host, and the size of its outputs, against the phase being measured, if any.
+    """
+    timing = _current_phase.get()
+    if timing is None:
+        return
+    size = sum(_size(output) for output in outputs)
+    with _counter_lock:
+        timing.subprocesses += 1
+        timing.subprocess_time += duration
+        timing.bytes_read += size
+
+
+def record_read(data):
+    """
+    Count data received from the host other than command output against the phase being measured, if any.
+    """
+    timing = _current_phase.get()
+    if timing is None:
+        return
+    size = _size(data)
+    with _counter_lock:
+        timing.bytes_read += size
+
+
+class _CountingFile:
+    """
+    Pass reads through to a file opened on the host, counting what they return with record_read.
+    """
+
+    def __init__(self, file: TextIO):
+        self._file = file
+
+    def read(self, *args) -> str:
+        data = self._file.read(*args)
+        record_read(data)
+        return data
+
+    def readline(self, *args) -> str:
+        line = self._file.readline(*args)
+        record_read(line)
+        return line
+
+    def readlines(self, *args) -> List[str]:
+        lines = self._file.readlines(*args)
+        record_read("".join(lines))
+        return lines
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        line = next(self._file)
+        record_read(line)
+        return line
+
+    def __enter__(self):
+        self._file.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._file.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+def count_reads(file: TextIO) -> TextIO:
+    """
+    Wrap a file opened on the host so its reads are counted, while a phase is being measured.
+    """
+    if _current_phase.get() is None:
+        return file
+    # a stand-in for the file, it forwards everything else to it
+    return cast(TextIO, _CountingFile(file))
+
+
+class Profiler:
+    """
+    Collect the PhaseTimings of a single capture.
+
+    Host requests are attributed to the phase measured in the thread making them (see measure). Requests made
+    outside of a measured phase, e.g. while reading the user database to select --users, are not counted.
+    """
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.phases: List[PhaseTiming] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, module: str, phase: str):
+        timing = PhaseTiming(
+            module=module, phase=phase, thread=threading.current_thread().name, start=time.perf_counter() - self._origin
+        )
+        token = _current_phase.set(timing)
+        cpu_start = time.thread_time()
+        try:
+            yield timing
+        finally:
+            timing.cpu_time = time.thread_time() - cpu_start
+            timing.wall_time = time.perf_counter() - self._origin - timing.start
+            _current_phase.reset(token)
+            with self._lock:
+                self.phases.append(timing)
+
+    @property
+    def wall_time(self) -> float:
+        """
+        Seconds from the start of the profile to the end of its last phase.
+        """
+        return max((timing.start + timing.wall_time for timing in self.phases), default=0.0)
+
+    def report(self) -> Dict:
+        phases = sorted(self.phases, key=lambda timing: timing.start)
+        return {
+            "host": self.label,
+            "wall_time": self.wall_time,
+            "phases": [dict(name=timing.name, **dataclasses.asdict(timing)) for timing in phases],
+        }
+
+    def print_timings(self):
+        print_info(f"\nTimings of {self.label or 'the capture'} ({self.wall_time:.3f}s in total):", ignore_quiet=True)
+        print_info(f"  {'phase':<20} {'wall':>9} {'cpu':>9} {'commands':>9} {'in':>9} {'read':>10}", ignore_quiet=True)
+        for timing in sorted(self.phases, key=lambda timing: timing.start):
+            print_info(
+                f"  {timing.name:<20} {timing.wall_time:8.3f}s {timing.cpu_time:8.3f}s {timing.subprocesses:>9} "
+                f"{timing.subprocess_time:8.3f}s {format_size(timing.bytes_read):>10}",
+                ignore_quiet=True,
+            )
+
+
+def measure(profiler: Optional[Profiler], module: str, phase: str) -> ContextManager:
+    """
+    Measure a phase with `profiler`, or do nothing if there is none.
+    """
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.phase(module, phase)
+
+
+def format_size(size: float) -> str:
+    if size < 1024:
+        return f"{size:.0f} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KiB"
+    return f"{size / (1024 * 1024):.1f} MiB"
+
+
+def aggregate_phases(profilers: List[Profiler]) -> Dict[str, Dict]:
+    """
+    Sum up every phase across the captures of several hosts, e.g. to find the slowest host of a fleet per module.
+    """
+    aggregate: Dict[str, Dict] = {}
+    for profiler in profilers:
+        for timing in profiler.phases:
+            totals = aggregate.setdefault(
+                timing.name,
+                {
+                    "hosts": 0,
+                    "wall_time": 0.0,
+                    "cpu_time": 0.0,
+                    "subprocesses": 0,
+                    "subprocess_time": 0.0,
+                    "bytes_read": 0,
+                    "max_wall_time": 0.0,
+                    "slowest_host": None,
+                },
+            )
+            totals["hosts"] += 1
+            for field in ("wall_time", "cpu_time", "subprocesses", "subprocess_time", "bytes_read"):
+                totals[field] += getattr(timing, field)
+            if totals["slowest_host"] is None or timing.wall_time > totals["max_wall_time"]:
+                totals["max_wall_time"] = timing.wall_time
+                totals["slowest_host"] = profiler.label
+    return aggregate
+
+
+def print_aggregate_timings(profilers: List[Profiler]):
+    print_info(f"\nTimings across {len(profilers)} hosts:", ignore_quiet=True)
+    print_info(f"  {'phase':<20} {'total':>9} {'max':>9} {'commands':>9} {'read':>10}  slowest host", ignore_quiet=True)
+    for name, totals in aggregate_phases(profilers).items():
+        print_info(
+            f"  {name:<20} {totals['wall_time']:8.3f}s {totals['max_wall_time']:8.3f}s {totals['subprocesses']:>9} "
+            f"{format_size(totals['bytes_read']):>10}  {totals['slowest_host']}",
+            ignore_quiet=True,
+        )
+
+
+def _chrome_trace(profilers: List[Profiler]) -> Dict:
+    events = []
+    for pid, profiler in enumerate(profilers, start=1):
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": profiler.label}})
+        thread_ids: Dict[str, int] = {}
+        for timing in sorted(profiler.phases, key=lambda timing: timing.start):
+            if timing.thread not in thread_ids:
+                thread_ids[timing.thread] = len(thread_ids) + 1
+                events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": pid,
+                        "tid": thread_ids[timing.thread],
+                        "args": {"name": timing.thread},
+                    }
+                )
+            events.append(
+                {
+                    "name": timing.name,
+                    "cat": timing.phase,
+                    "ph": "X",
+                    "ts": timing.start * 1e6,
+                    "dur": timing.wall_time * 1e6,
+                    "pid": pid,
+                    "tid": thread_ids[timing.thread],
+                    "args": {
+                        "cpu_time": timing.cpu_time,
+                        "subprocesses": timing.subprocesses,
+                        "subprocess_time": timing.subprocess_time,
+                        "bytes_read": timing.bytes_read,
+                    },
+                }
+            )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _speedscope(profilers: List[Profiler]) -> Dict:
+    frames: List[Dict] = []
+    frame_ids: Dict[str, int] = {}
+    profiles = []
+    for profiler in profilers:
+        threads: Dict[str, List[PhaseTiming]] = {}
+        for timing in profiler.phases:
+            threads.setdefault(timing.thread, []).append(timing)
+        for thread, timings in threads.items():
+            events = []
+            for timing in timings:
+                if timing.name not in frame_ids:
+                    frame_ids[timing.name] = len(frames)
+                    frames.append({"name": timing.name})
+                events.append((timing.start, 1, frame_ids[timing.name]))
+                events.append((timing.start + timing.wall_time, 0, frame_ids[timing.name]))
+            # a phase closing at the same instant another one opens has to be closed first
+            events.sort()
+            profiles.append(
+                {
+                    "type": "evented",
+                    "name": f"{profiler.label} {thread}".strip(),
+                    "unit": "seconds",
+                    "startValue": 0.0,
+                    "endValue": profiler.wall_time,
+                    "events": [
+                        {"type": "O" if opening else "C", "frame": frame, "at": at} for at, opening, frame in events
+                    ],
+                }
+            )
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": "cc-builder capture",
+        "shared": {"frames": frames},
+        "profiles": profiles,
+    }
+
+
+def write_profile(profilers: List[Profiler], path: str, profile_format: str = "json"):
+    """
+    Write the timings of one or more captures to `path` in one of the PROFILE_FORMATS.
+    """
+    if profile_format == "chrome":
+        document = _chrome_trace(profilers)
+    elif profile_format == "speedscope":
+        document = _speedscope(profilers)
+    elif profile_format == "json":
+        document = {
+            "version": PROFILE_FORMAT_VERSION,
+            "hosts": [profiler.report() for profiler in profilers],
+            "phases": aggregate_phases(profilers),
+        }
+    else:
+        raise ValueError(f"Unknown profile format '{profile_format}', expected one of {', '.join(PROFILE_FORMATS)}")
+    with open(path, "w") as profile_file:
+        json.dump(document, profile_file, indent=1)
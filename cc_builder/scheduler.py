@@ -0,0 +1,153 @@
+import concurrent.futures
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from cc_builder.console_output import print_debug, print_error
+from cc_builder.custom_types import BaseConfig
+from cc_builder.defaults import DEFAULT_GATHER_TIMEOUT, DEFAULT_JOBS
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, HostAccessor
+from cc_builder.profiling import Profiler, measure
+
+
+class _GatherTask:
+    """
+    Wrap a single module's gather() call so the scheduler knows when it actually started running.
+    """
+
+    def __init__(self, name: str, config: BaseConfig, accessor: HostAccessor, profiler: Optional[Profiler] = None):
+        self.name = name
+        self.config = config
+        self.accessor = accessor
+        self.profiler = profiler
+        # time.monotonic() when start() was called
+        self.started_at = 0.0
+
+    def run(self) -> BaseConfig:
+        with measure(self.profiler, self.name, "gather"):
+            self.config.gather(self.accessor)
+        return self.config
+
+    def start(self) -> concurrent.futures.Future:
+        """
+        Run the task on a daemon thread of its own. A module that hangs, e.g. on a command that never returns, is
+        left behind once it timed out, and the interpreter does not wait for daemon threads when it exits.
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(self.run())
+            except BaseException as e:  # pylint: disable=broad-except
+                future.set_exception(e)
+
+        self.started_at = time.monotonic()
+        threading.Thread(target=run, name=f"cc-builder-gather-{self.name}", daemon=True).start()
+        return future
+
+
+def resolve_gather_order(configs: List[Tuple[str, BaseConfig]]) -> List[Tuple[str, BaseConfig]]:
+    """
+    Order the (name, config) pairs so every module comes after the modules in its depends_on, keeping the given
+    order otherwise. Dependencies that are not among the configs (disabled or cached) are ignored.
+    Raises ValueError if the dependencies form a cycle.
+    """
+    names = {name for name, _ in configs}
+    remaining = list(configs)
+    ordered: List[Tuple[str, BaseConfig]] = []
+    done: Set[str] = set()
+    while remaining:
+        for index, (name, config) in enumerate(remaining):
+            if all(dependency in done or dependency not in names for dependency in config.depends_on):
+                ordered.append(remaining.pop(index))
+                done.add(name)
+                break
+        else:
+            raise ValueError(f"The modules {', '.join(name for name, _ in remaining)} depend on each other")
+    return ordered
+
+
+def gather_configs(
+    configs: List[Tuple[str, BaseConfig]],
+    jobs: int = DEFAULT_JOBS,
+    timeout: Optional[float] = DEFAULT_GATHER_TIMEOUT,
+    accessor: HostAccessor = LOCAL_HOST_ACCESSOR,
+    available: Optional[Dict[str, BaseConfig]] = None,
+    profiler: Optional[Profiler] = None,
+) -> List[Tuple[str, BaseConfig]]:
+    """
+    Run gather() against the host behind `accessor` for each (name, config) pair and return the pairs that
+    finished, in the order given.
+
+    The modules' depends_on declarations form a DAG: a module starts once the modules it depends on have finished
+    and receives their configs (or those in `available`, e.g. taken from the gather cache) through
+    use_dependencies. With jobs <= 1 the modules are gathered one after another in the calling thread in dependency
+    order, and `timeout` does not apply. Otherwise every module whose dependencies are done runs on a thread of its
+    own, at most `jobs` at a time, and gets `timeout` seconds from the moment it starts running. Modules that time
+    out, and the modules depending on them, are reported and left out of the result. Their daemon threads are
+    abandoned rather than stopped: they keep running in the background, without holding up the exit of the process,
+    and a command they are waiting on is not killed. Exceptions raised by a module's gather() propagate. Each
+    gather() is measured with `profiler`, if given.
+    """
+    order = resolve_gather_order(configs)
+    names = {name for name, _ in configs}
+    gathered: Dict[str, BaseConfig] = dict(available or {})
+
+    def start(config: BaseConfig):
+        config.use_dependencies(
+            {dependency: gathered[dependency] for dependency in config.depends_on if dependency in gathered}
+        )
+
+    if jobs <= 1:
+        for name, config in order:
+            start(config)
+            with measure(profiler, name, "gather"):
+                config.gather(accessor)
+            gathered[name] = config
+        return list(configs)
+
+    tasks = {name: _GatherTask(name, config, accessor, profiler) for name, config in order}
+    waiting = [name for name, _ in order]
+    timed_out: List[str] = []
+    skipped: List[str] = []
+    futures: Dict[concurrent.futures.Future, _GatherTask] = {}
+    pending: Set[concurrent.futures.Future] = set()
+    while waiting or pending:
+        for name in list(waiting):
+            dependencies = [dependency for dependency in tasks[name].config.depends_on if dependency in names]
+            missing = [dependency for dependency in dependencies if dependency in timed_out + skipped]
+            if missing:
+                print_error(f"Skipping {name} config, the {', '.join(missing)} config it depends on was not gathered")
+                skipped.append(name)
+                waiting.remove(name)
+            elif all(dependency in gathered for dependency in dependencies) and len(pending) < jobs:
+                start(tasks[name].config)
+                future = tasks[name].start()
+                futures[future] = tasks[name]
+                pending.add(future)
+                waiting.remove(name)
+        if not pending:
+            continue
+        wait_for = None
+        if timeout is not None:
+            now = time.monotonic()
+            wait_for = max(0.0, min(futures[f].started_at + timeout - now for f in pending))
+        done, pending = concurrent.futures.wait(
+            pending, timeout=wait_for, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+            # re-raise any exception from the module's gather()
+            future.result()
+            gathered[futures[future].name] = futures[future].config
+            print_debug(f"Finished gathering {futures[future].name} config")
+        if timeout is None:
+            continue
+        now = time.monotonic()
+        for future in list(pending):
+            task = futures[future]
+            if now - task.started_at >= timeout:
+                print_error(f"Gathering {task.name} config timed out after {timeout:g} seconds, skipping it")
+                timed_out.append(task.name)
+                pending.discard(future)
+
+    return [(name, config) for name, config in configs if name not in timed_out + skipped]
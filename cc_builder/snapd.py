@@ -0,0 +1,80 @@
+import http.client
+import json
+import socket
+from typing import Any, Dict, List
+
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, HostAccessor
+from cc_builder.profiling import record_read
+
+SNAPD_SOCKET_PATH = "/run/snapd.socket"
+SNAPD_TIMEOUT = 10.0
+
+
+class SnapdError(Exception):
+    """
+    Raised when snapd answers a request with an error.
+    """
+
+
+class _UnixSocketHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, accessor: HostAccessor, socket_path: str, timeout: float):
+        # the host name is only used for the Host header, snapd ignores it
+        super().__init__("localhost", timeout=timeout)
+        self.accessor = accessor
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = self.accessor.connect_unix_socket(self.socket_path)
+        self.sock.settimeout(self.timeout)
+
+
+class SnapdClient:
+    """
+    Minimal client for the snapd REST API, reached through the host's snapd socket.
+    """
+
+    def __init__(
+        self,
+        accessor: HostAccessor = LOCAL_HOST_ACCESSOR,
+        socket_path: str = SNAPD_SOCKET_PATH,
+        timeout: float = SNAPD_TIMEOUT,
+    ):
+        self.accessor = accessor
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def get(self, path: str) -> Any:
+        """
+        Send a GET request and return the `result` of snapd's response.
+
+        Raises OSError if snapd cannot be reached, NotImplementedError if the host's sockets cannot be reached at
+        all and SnapdError if snapd answers with an error.
+        """
+        connection = _UnixSocketHTTPConnection(self.accessor, self.socket_path, self.timeout)
+        try:
+            connection.request("GET", path, headers={"Accept": "application/json"})
+            response = connection.getresponse()
+            body = response.read()
+            record_read(body)
+        except (http.client.HTTPException, socket.timeout) as e:
+            raise SnapdError(f"Request to snapd failed: {e}") from e
+        finally:
+            connection.close()
+        try:
+            document = json.loads(body)
+        except ValueError as e:
+            raise SnapdError(f"snapd sent an invalid response to GET {path}") from e
+        if not isinstance(document, dict):
+            raise SnapdError(f"snapd sent an invalid response to GET {path}")
+        if response.status != 200 or document.get("type") == "error":
+            # the result of an error is an object with a message, but do not count on it
+            result = document.get("result")
+            message = result.get("message", response.reason) if isinstance(result, dict) else result or response.reason
+            raise SnapdError(f"GET {path} failed with status {response.status}: {message}")
+        return document.get("result")
+
+    def list_snaps(self) -> List[Dict[str, Any]]:
+        """
+        The installed snaps as reported by GET /v2/snaps.
+        """
+        return self.get("/v2/snaps")
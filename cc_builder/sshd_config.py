@@ -0,0 +1,203 @@
+import dataclasses
+import fnmatch
+import posixpath
+import re
+import shlex
+from typing import Dict, List, Optional, Sequence
+
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, HostAccessor
+
+SSHD_CONFIG_PATH = "/etc/ssh/sshd_config"
+# relative Include paths are relative to this directory, like sshd does
+SSHD_CONFIG_BASE_DIR = "/etc/ssh"
+# sshd refuses to nest Includes deeper than this
+MAX_INCLUDE_DEPTH = 16
+
+# sshd's values for the keywords cc-builder evaluates when the configuration leaves them unset, see sshd_config(5)
+SSHD_DEFAULTS: Dict[str, str] = {
+    "passwordauthentication": "yes",
+    "permitrootlogin": "prohibit-password",
+}
+
+_KEYWORD_PATTERN = re.compile(r"\s*([^\s=]+)(?:\s*=\s*|\s+|$)(.*)")
+
+
+@dataclasses.dataclass
+class SSHDConfigEntry:
+    keyword: str  # lowercased, keywords are case-insensitive
+    args: List[str]
+    path: str
+    line_number: int
+    # criteria of the Match block the entry is in, None outside of Match blocks
+    match: Optional[List[str]] = None
+
+    @property
+    def location(self) -> str:
+        return f"{self.path}:{self.line_number}"
+
+
+def tokenize_sshd_config_line(line: str) -> List[str]:
+    """
+    Split an sshd_config line into its keyword and arguments, e.g. "PermitRootLogin=no" into
+    ["PermitRootLogin", "no"]. Arguments may be quoted. Blank lines and comments yield [].
+    """
+    match = _KEYWORD_PATTERN.match(line)
+    if match is None or match.group(1).startswith("#"):
+        return []
+    keyword, rest = match.groups()
+    try:
+        args = shlex.split(rest, comments=True)
+    except ValueError:
+        # unbalanced quotes, sshd rejects these but don't fail the whole capture on them
+        args = rest.split()
+    return [keyword] + args
+
+
+def match_pattern_list(name: str, patterns: str) -> bool:
+    """
+    Match a name against an sshd pattern list such as "alice,bob,!root,adm*": at least one pattern has to match
+    and no negated one may.
+    """
+    matched = False
+    for pattern in patterns.split(","):
+        if pattern.startswith("!"):
+            if fnmatch.fnmatchcase(name, pattern[1:]):
+                return False
+        elif fnmatch.fnmatchcase(name, pattern):
+            matched = True
+    return matched
+
+
+def match_criteria_apply(criteria: Sequence[str], user: Optional[str], groups: Sequence[str]) -> bool:
+    """
+    Whether a Match block applies to connections of `user`, a member of `groups`. Criteria about the
+    connection itself (Host, Address, LocalPort, ...) are unknown and taken as not matching.
+    """
+    if len(criteria) == 1 and criteria[0].lower() == "all":
+        return True
+    if len(criteria) % 2:
+        return False
+    for criterion, patterns in zip(criteria[::2], criteria[1::2]):
+        criterion = criterion.lower()
+        if criterion == "user":
+            if user is None or not match_pattern_list(user, patterns):
+                return False
+        elif criterion == "group":
+            if not any(match_pattern_list(group, patterns) for group in groups):
+                return False
+        else:
+            return False
+    return True
+
+
+class SSHDConfig:
+    """
+    The entries of an sshd configuration with its Includes resolved, in the order sshd reads them.
+    """
+
+    def __init__(self, entries: List[SSHDConfigEntry], inputs: Sequence[str] = ()):
+        self.entries = entries
+        # the files read and the Include targets looked for, with the directories globbed for them ending in "/"
+        self.inputs = list(inputs)
+
+    def get_entry(
+        self, keyword: str, user: Optional[str] = None, groups: Sequence[str] = ()
+    ) -> Optional[SSHDConfigEntry]:
+        """
+        The entry setting `keyword` for connections of `user`, or for every connection when user is None.
+
+        Like sshd, the first value obtained wins: the first matching Match block setting the keyword takes
+        precedence over the global sections, where again the first occurrence is used. Returns None if the
+        keyword is not set, i.e. sshd's default applies.
+        """
+        keyword = keyword.lower()
+        candidates = [entry for entry in self.entries if entry.keyword == keyword]
+        for entry in candidates:
+            if entry.match is not None and match_criteria_apply(entry.match, user, groups):
+                return entry
+        return next((entry for entry in candidates if entry.match is None), None)
+
+    def get(self, keyword: str, user: Optional[str] = None, groups: Sequence[str] = ()) -> Optional[str]:
+        """
+        The effective (first) value of `keyword`, lowercased, see get_entry. sshd's default (see SSHD_DEFAULTS)
+        if the keyword is not set, None if cc-builder does not know that default.
+        """
+        entry = self.get_entry(keyword, user, groups)
+        if entry is None or not entry.args:
+            return SSHD_DEFAULTS.get(keyword.lower())
+        return entry.args[0].lower()
+
+    def get_all(self, keyword: str) -> List[SSHDConfigEntry]:
+        """
+        Every global entry of a keyword that may be given several times, such as HostKey.
+        """
+        keyword = keyword.lower()
+        return [entry for entry in self.entries if entry.keyword == keyword and entry.match is None]
+
+
+def _expand_include(pattern: str, accessor: HostAccessor, inputs: List[str]) -> List[str]:
+    if not pattern.startswith("/"):
+        pattern = posixpath.join(SSHD_CONFIG_BASE_DIR, pattern)
+    if not any(char in pattern for char in "*?["):
+        return [pattern]
+    directory, name_pattern = posixpath.split(pattern)
+    inputs.append(directory + "/")
+    try:
+        names = accessor.list_dir(directory)
+    except FileNotFoundError:
+        return []
+    # sshd includes the files matching a glob in lexical order
+    return [posixpath.join(directory, name) for name in sorted(names) if fnmatch.fnmatchcase(name, name_pattern)]
+
+
+def _read_config_file(
+    path: str,
+    accessor: HostAccessor,
+    entries: List[SSHDConfigEntry],
+    inputs: List[str],
+    match: Optional[List[str]],
+    depth: int,
+):
+    inputs.append(path)
+    for line_number, line in enumerate(accessor.read_file(path).splitlines(), start=1):
+        tokens = tokenize_sshd_config_line(line)
+        if not tokens:
+            continue
+        keyword, args = tokens[0].lower(), tokens[1:]
+        if keyword == "match":
+            # a Match block lasts until the next Match line or the end of the file, "Match all" is a block that
+            # applies to every connection rather than a return to the global section
+            match = args
+        elif keyword == "include":
+            if depth >= MAX_INCLUDE_DEPTH:
+                raise OSError(f"Too many nested Includes in {path}")
+            for pattern in args:
+                for included_path in _expand_include(pattern, accessor, inputs):
+                    if accessor.is_file(included_path):
+                        _read_config_file(included_path, accessor, entries, inputs, match, depth + 1)
+                    else:
+                        # creating it later changes the configuration
+                        inputs.append(included_path)
+        else:
+            entries.append(SSHDConfigEntry(keyword=keyword, args=args, path=path, line_number=line_number, match=match))
+
+
+def read_sshd_config(accessor: HostAccessor = LOCAL_HOST_ACCESSOR, path: str = SSHD_CONFIG_PATH) -> SSHDConfig:
+    """
+    Read the sshd configuration of the host, following its Include directives.
+    Raises OSError (e.g. FileNotFoundError or PermissionError) if it cannot be read.
+    """
+    entries: List[SSHDConfigEntry] = []
+    inputs: List[str] = []
+    _read_config_file(path, accessor, entries, inputs, None, 0)
+    return SSHDConfig(entries, list(dict.fromkeys(inputs)))
+
+
+# values of PermitRootLogin and whether each lets root log in with a shell at all
+PERMIT_ROOT_LOGIN_DISABLES_ROOT: Dict[str, bool] = {
+    "no": True,
+    "forced-commands-only": True,
+    "yes": False,
+    "prohibit-password": False,
+    "without-password": False,
+}
@@ -0,0 +1,161 @@
+import dataclasses
+import re
+from typing import Dict, List, Optional
+
+from cc_builder.console_output import print_warning
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, HostAccessor
+
+# groups whose members may administer the host. Members of the first three get sudo rights from the default
+# sudoers files of Ubuntu (sudo, admin) and Fedora/RHEL (wheel), lxd and docker members are root-equivalent.
+SUDO_GROUPS = ("sudo", "admin", "wheel")
+ADMIN_GROUPS = SUDO_GROUPS + ("lxd", "docker")
+# login shells of accounts nobody can log in to
+NOLOGIN_SHELLS = ("/usr/sbin/nologin", "/sbin/nologin", "/bin/false", "/usr/bin/false", "/bin/sync")
+
+
+@dataclasses.dataclass
+class PasswdEntry:
+    name: str
+    uid: int
+    gid: int
+    gecos: str
+    home: str
+    shell: str
+
+    @property
+    def can_log_in(self) -> bool:
+        return self.shell not in NOLOGIN_SHELLS
+
+
+@dataclasses.dataclass
+class GroupEntry:
+    name: str
+    gid: int
+    members: List[str]
+
+
+def parse_passwd(content: str) -> Dict[str, PasswdEntry]:
+    """
+    Parse passwd database lines, keeping the first entry of every user like getpwnam does.
+    """
+    entries: Dict[str, PasswdEntry] = {}
+    for line in content.splitlines():
+        fields = line.split(":")
+        if len(fields) != 7 or not fields[2].isdigit() or not fields[3].isdigit() or fields[0] in entries:
+            continue
+        entries[fields[0]] = PasswdEntry(
+            name=fields[0], uid=int(fields[2]), gid=int(fields[3]), gecos=fields[4], home=fields[5], shell=fields[6]
+        )
+    return entries
+
+
+def parse_group(content: str) -> Dict[str, GroupEntry]:
+    """
+    Parse group database lines, keeping the first entry of every group like getgrnam does.
+    """
+    entries: Dict[str, GroupEntry] = {}
+    for line in content.splitlines():
+        fields = line.split(":")
+        if len(fields) != 4 or not fields[2].isdigit() or fields[0] in entries:
+            continue
+        entries[fields[0]] = GroupEntry(
+            name=fields[0], gid=int(fields[2]), members=[member for member in fields[3].split(",") if member]
+        )
+    return entries
+
+
+class UserDatabase:
+    """
+    The passwd and group databases of a host, read once and answering every question about its accounts.
+    """
+
+    def __init__(self, users: Dict[str, PasswdEntry], groups: Dict[str, GroupEntry]):
+        self.users = users
+        self.groups = groups
+
+    def get_user(self, name: str) -> Optional[PasswdEntry]:
+        return self.users.get(name)
+
+    def get_group(self, name: str) -> Optional[GroupEntry]:
+        return self.groups.get(name)
+
+    def primary_group(self, user: str) -> Optional[GroupEntry]:
+        entry = self.get_user(user)
+        if entry is None:
+            return None
+        return next((group for group in self.groups.values() if group.gid == entry.gid), None)
+
+    def supplementary_groups(self, user: str) -> List[str]:
+        """
+        The groups listing `user` as a member, in database order, without the user's primary group.
+        """
+        primary = self.primary_group(user)
+        return [
+            group.name
+            for group in self.groups.values()
+            if user in group.members and (primary is None or group.name != primary.name)
+        ]
+
+    def admin_groups(self, user: str) -> List[str]:
+        """
+        The ADMIN_GROUPS `user` is a member of, either as primary or as supplementary group.
+        """
+        primary = self.primary_group(user)
+        groups = self.supplementary_groups(user) + ([primary.name] if primary is not None else [])
+        return [group for group in ADMIN_GROUPS if group in groups]
+
+
+def load_user_database(accessor: HostAccessor = LOCAL_HOST_ACCESSOR) -> UserDatabase:
+    """
+    Load the passwd and group databases of the host. The accessor reads them once per capture
+    (see HostAccessor.read_user_database), so every module can load them without another request.
+    """
+    passwd, group = accessor.read_user_database()
+    return UserDatabase(users=parse_passwd(passwd), groups=parse_group(group))
+
+
+_UID_SELECTION_PATTERN = re.compile(r"uid\s*>=\s*(\d+)")
+
+
+@dataclasses.dataclass
+class UserSelection:
+    """
+    The accounts selected with --users: "all" accounts that can log in except root, those that can log in with a
+    uid of at least N ("uid>=N"), or a comma-separated list of account names.
+    """
+
+    names: Optional[List[str]] = None
+    # only used without names, 1 leaves out root
+    min_uid: int = 1
+
+    @classmethod
+    def parse(cls, spec: str) -> "UserSelection":
+        """
+        Parse a --users value. Raises ValueError if it is none of the accepted forms.
+        """
+        spec = spec.strip()
+        if spec == "all":
+            return cls(min_uid=1)
+        match = _UID_SELECTION_PATTERN.fullmatch(spec)
+        if match is not None:
+            return cls(min_uid=int(match.group(1)))
+        names = [name.strip() for name in spec.split(",") if name.strip()]
+        # none of these can be part of an account name, e.g. "uid>1000" is a mistyped uid>=N rather than a name
+        if not names or any(set(name) & set(": <>=") for name in names):
+            raise ValueError(f"Invalid user selection '{spec}', expected all, uid>=N or a list of names")
+        return cls(names=names)
+
+    def select(self, database: UserDatabase) -> List[str]:
+        """
+        The names of the selected accounts, in the order given or in database order. Names missing from the
+        database are left out.
+        """
+        if self.names is None:
+            return [entry.name for entry in database.users.values() if entry.uid >= self.min_uid and entry.can_log_in]
+        selected = []
+        for name in dict.fromkeys(self.names):
+            if database.get_user(name) is None:
+                print_warning(f"User '{name}' does not exist, skipping it")
+                continue
+            selected.append(name)
+        return selected
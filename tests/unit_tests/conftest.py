@@ -0,0 +1,138 @@
+import http.server
+import json
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+
+import pytest
+
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, CannedHostAccessor
+from cc_builder.snapd import SNAPD_SOCKET_PATH
+
+SNAPD_SNAPS = [
+    {
+        "name": "hello-world",
+        "version": "6.4",
+        "revision": 29,
+        "tracking-channel": "latest/stable",
+        "publisher": {"username": "canonical"},
+        "confinement": "strict",
+        "type": "app",
+        "status": "active",
+    },
+    {
+        "name": "code",
+        "version": "1.90.2",
+        "revision": 161,
+        "tracking-channel": "latest/stable",
+        "publisher": {"username": "vscode"},
+        "confinement": "classic",
+        "type": "app",
+        "status": "active",
+    },
+    {
+        "name": "lxd",
+        "version": "5.21.1-2d13beb",
+        "revision": 28460,
+        "tracking-channel": "5.21/stable",
+        "publisher": {"username": "canonical"},
+        "confinement": "strict",
+        "type": "app",
+        "status": "active",
+    },
+    {
+        "name": "my-tool",
+        "version": "0.3",
+        "revision": "x1",
+        "confinement": "devmode",
+        "devmode": True,
+        "type": "app",
+        "status": "active",
+    },
+    {
+        "name": "core22",
+        "version": "20240408",
+        "revision": 1380,
+        "tracking-channel": "latest/stable",
+        "publisher": {"username": "canonical"},
+        "confinement": "strict",
+        "type": "base",
+        "status": "active",
+    },
+]
+
+
+class _SnapdRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self) -> str:
+        return "snapd.socket"
+
+    def do_GET(self):
+        if self.path == "/v2/snaps":
+            status, document = self.server.snaps_response
+        else:
+            status, document = 404, {"type": "error", "status-code": 404, "result": {"message": "not found"}}
+        body = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _SnapdServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _serve_snapd(status: int, document: dict):
+    """
+    Serve `document` with `status` for GET /v2/snaps on a Unix socket, yield its path and stop serving afterwards.
+    """
+    # socket paths are limited to about 100 characters, too few for pytest's tmp_path
+    directory = tempfile.mkdtemp(prefix="cc-builder-snapd-")
+    path = os.path.join(directory, "snapd.socket")
+    server = _SnapdServer(path, _SnapdRequestHandler)
+    server.snaps_response = (status, document)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(directory)
+
+
+@pytest.fixture
+def snapd_socket():
+    """
+    The path of a Unix socket answering GET /v2/snaps like snapd does, with SNAPD_SNAPS installed.
+    """
+    yield from _serve_snapd(200, {"type": "sync", "status-code": 200, "status": "OK", "result": SNAPD_SNAPS})
+
+
+@pytest.fixture
+def failing_snapd_socket(request):
+    """
+    The path of a Unix socket answering GET /v2/snaps with an error whose result is `request.param`.
+    """
+    yield from _serve_snapd(500, {"type": "error", "status-code": 500, "result": request.param})
+
+
+class SnapdHost(CannedHostAccessor):
+    """
+    A canned host whose snapd socket is `socket_path` on this machine, or missing if it is None.
+    """
+
+    def __init__(self, socket_path=None, **kwargs):
+        super().__init__(**kwargs)
+        self.socket_path = socket_path
+
+    def connect_unix_socket(self, path: str):
+        if path != SNAPD_SOCKET_PATH or self.socket_path is None:
+            raise FileNotFoundError(2, "No such file or directory", path)
+        return LOCAL_HOST_ACCESSOR.connect_unix_socket(self.socket_path)
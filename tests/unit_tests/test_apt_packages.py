@@ -0,0 +1,284 @@
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from cc_builder.host_accessor import LOCAL_HOST_ACCESSOR, CannedHostAccessor
+from cc_builder.modules.apt import (
+    APT_EXTENDED_STATES_PATH,
+    DPKG_STATUS_PATH,
+    AptConfig,
+    find_pulled_in_packages,
+    get_apt_packages,
+    read_base_manifest,
+    read_dependency_graph,
+    read_manually_installed_packages,
+)
+
+NATIVE_ARCH = "amd64"
+STATUSES = [
+    ("install ok installed", 80),
+    ("deinstall ok installed", 4),
+    ("install reinstreq half-installed", 2),
+    ("install ok half-configured", 2),
+    ("install ok unpacked", 2),
+    ("deinstall ok config-files", 6),
+    ("purge ok not-installed", 4),
+]
+
+
+def status_stanza(
+    name: str, arch: str, status: str, version: str = "1.0-1", depends: str = "libc6 (>= 2.34)", provides: str = ""
+) -> str:
+    return (
+        f"Package: {name}\n"
+        f"Status: {status}\n"
+        "Priority: optional\n"
+        "Section: misc\n"
+        "Installed-Size: 1024\n"
+        f"Architecture: {arch}\n"
+        f"Version: {version}\n"
+        + (f"Provides: {provides}\n" if provides else "")
+        + (f"Depends: {depends}\n" if depends else "")
+        + f"Description: {name}\n"
+        " A multi-line description.\n"
+        " .\n"
+        " Package: not-a-package\n"
+        "\n"
+    )
+
+
+def auto_installed_stanza(name: str, arch: str) -> str:
+    return f"Package: {name}\nArchitecture: {arch}\nAuto-Installed: 1\n\n"
+
+
+@pytest.fixture(scope="module")
+def dpkg_state(tmp_path_factory):
+    """
+    A large synthetic dpkg status file and apt extended_states file, with Architecture: all and foreign
+    architecture packages, packages in every dpkg state and packages marked automatic under each architecture.
+    """
+    directory = tmp_path_factory.mktemp("dpkg")
+    rng = random.Random(0)
+    status = [status_stanza("dpkg", NATIVE_ARCH, "install ok installed")]
+    extended_states = []
+    for index in range(5000):
+        name = f"synthetic-package-{index:05d}"
+        arch = rng.choices([NATIVE_ARCH, "all", "i386"], weights=[80, 15, 5])[0]
+        states, weights = zip(*STATUSES)
+        status.append(status_stanza(name, arch, rng.choices(states, weights=weights)[0]))
+        if rng.random() < 0.7:
+            # apt records Architecture: all packages under the native architecture
+            extended_states.append(auto_installed_stanza(name, NATIVE_ARCH if arch == "all" else arch))
+        if arch == "i386" and rng.random() < 0.5:
+            # the same package installed for both architectures, only one of them marked automatic
+            status.append(status_stanza(name, NATIVE_ARCH, "install ok installed"))
+    status_path = directory / "status"
+    extended_states_path = directory / "extended_states"
+    status_path.write_text("".join(status))
+    extended_states_path.write_text("".join(extended_states))
+    return str(status_path), str(extended_states_path)
+
+
+def apt_mark_showmanual(status_path: str, extended_states_path: str):
+    result = subprocess.run(
+        [
+            "apt-mark",
+            "-o",
+            f"Dir::State::status={status_path}",
+            "-o",
+            f"Dir::State::extended_states={extended_states_path}",
+            "-o",
+            f"APT::Architecture={NATIVE_ARCH}",
+            "-o",
+            "APT::Architectures::=i386",
+            "showmanual",
+        ],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return result.stdout.split()
+
+
+@pytest.mark.skipif(shutil.which("apt-mark") is None, reason="apt-mark is not installed")
+def test_matches_apt_mark(dpkg_state):
+    status_path, extended_states_path = dpkg_state
+    packages = read_manually_installed_packages(
+        LOCAL_HOST_ACCESSOR, status_path=status_path, extended_states_path=extended_states_path
+    )
+    assert packages == apt_mark_showmanual(status_path, extended_states_path)
+    assert any(name.endswith(":i386") for name in packages)
+
+
+@pytest.mark.skipif(shutil.which("apt-mark") is None, reason="apt-mark is not installed")
+def test_missing_extended_states_matches_apt_mark(dpkg_state, tmp_path):
+    status_path, _ = dpkg_state
+    extended_states_path = str(tmp_path / "extended_states")
+    packages = read_manually_installed_packages(
+        LOCAL_HOST_ACCESSOR, status_path=status_path, extended_states_path=extended_states_path
+    )
+    assert packages == apt_mark_showmanual(status_path, extended_states_path)
+
+
+def canned_host(status, extended_states=None):
+    files = {DPKG_STATUS_PATH: "".join(status)}
+    if extended_states is not None:
+        files[APT_EXTENDED_STATES_PATH] = "".join(extended_states)
+    return CannedHostAccessor(files=files)
+
+
+def test_architectures():
+    accessor = canned_host(
+        [
+            status_stanza("dpkg", NATIVE_ARCH, "install ok installed"),
+            status_stanza("tzdata", "all", "install ok installed"),
+            status_stanza("python3-six", "all", "install ok installed"),
+            status_stanza("libc6", NATIVE_ARCH, "install ok installed"),
+            status_stanza("libc6", "i386", "install ok installed"),
+            status_stanza("libstdc++6", "i386", "install ok installed"),
+        ],
+        [
+            auto_installed_stanza("python3-six", NATIVE_ARCH),
+            auto_installed_stanza("libc6", NATIVE_ARCH),
+            auto_installed_stanza("libstdc++6", "i386"),
+        ],
+    )
+    assert read_manually_installed_packages(accessor) == ["dpkg", "libc6:i386", "tzdata"]
+
+
+def test_dpkg_states():
+    accessor = canned_host(
+        [
+            status_stanza("dpkg", NATIVE_ARCH, "install ok installed"),
+            status_stanza("removed-keeping-config", NATIVE_ARCH, "deinstall ok config-files"),
+            status_stanza("purged", NATIVE_ARCH, "purge ok not-installed"),
+            status_stanza("selected-for-removal", NATIVE_ARCH, "deinstall ok installed"),
+            status_stanza("half-installed", NATIVE_ARCH, "install reinstreq half-installed"),
+            status_stanza("unpacked", NATIVE_ARCH, "install ok unpacked"),
+        ],
+    )
+    assert read_manually_installed_packages(accessor) == [
+        "dpkg",
+        "half-installed",
+        "selected-for-removal",
+        "unpacked",
+    ]
+
+
+def test_missing_extended_states():
+    accessor = canned_host(
+        [
+            status_stanza("dpkg", NATIVE_ARCH, "install ok installed"),
+            status_stanza("vim", "amd64", "install ok installed"),
+        ]
+    )
+    assert read_manually_installed_packages(accessor) == ["dpkg", "vim"]
+
+
+def test_missing_status_falls_back_to_apt_mark():
+    accessor = CannedHostAccessor(commands={"apt-mark showmanual": "curl\nvim\n"})
+    with pytest.raises(FileNotFoundError):
+        read_manually_installed_packages(accessor)
+    assert list(get_apt_packages(accessor)) == ["curl", "vim"]
+    assert get_apt_packages(accessor).architecture is None
+    accessor.commands["dpkg --print-architecture"] = "arm64\n"
+    assert get_apt_packages(accessor).architecture == "arm64"
+
+
+def test_missing_status_without_commands():
+    accessor = CannedHostAccessor(commands={"apt-mark showmanual": "curl\nvim\n"})
+    accessor.can_run_commands = False
+    assert list(get_apt_packages(accessor)) == []
+
+
+# an Ubuntu cloud image .manifest, packages of a foreign architecture included
+BASE_MANIFEST = """\
+libc6:i386\t2.39-0ubuntu8
+libstdc++6:amd64\t14-20240412-0ubuntu1
+tzdata\t2024a-2ubuntu1
+vim:amd64\t2:9.1.0016-1ubuntu7
+snap:lxd\t5.21/stable
+"""
+
+
+def test_base_manifest_architectures(tmp_path):
+    manifest_path = tmp_path / "base.manifest"
+    manifest_path.write_text(BASE_MANIFEST)
+    accessor = canned_host(
+        [
+            status_stanza("dpkg", NATIVE_ARCH, "install ok installed"),
+            status_stanza("libc6", NATIVE_ARCH, "install ok installed"),
+            status_stanza("libc6", "i386", "install ok installed"),
+            status_stanza("libstdc++6", "i386", "install ok installed"),
+            status_stanza("tzdata", "all", "install ok installed"),
+            status_stanza("vim", NATIVE_ARCH, "install ok installed"),
+        ]
+    )
+    packages = get_apt_packages(accessor)
+    assert packages.architecture == NATIVE_ARCH
+
+    # libc6:i386 leaves the native libc6 in, libstdc++6:amd64 the i386 one
+    config = AptConfig(packages=packages, base_manifest=str(manifest_path))
+    assert config.select_packages() == ["dpkg", "libc6", "libstdc++6:i386"]
+
+
+def test_base_manifest_native_architecture(tmp_path):
+    manifest_path = tmp_path / "base.manifest"
+    manifest_path.write_text(BASE_MANIFEST)
+
+    qualified = {"libc6:i386", "libstdc++6:amd64", "tzdata", "vim:amd64"}
+    assert read_base_manifest(str(manifest_path), "amd64") == qualified | {"libstdc++6", "vim"}
+    assert read_base_manifest(str(manifest_path), "i386") == qualified | {"libc6"}
+    # without the host's architecture, the one most packages of the manifest have is taken
+    assert read_base_manifest(str(manifest_path)) == qualified | {"libstdc++6", "vim"}
+
+
+def installed(name: str, arch: str = NATIVE_ARCH, depends: str = "", provides: str = "") -> str:
+    return status_stanza(name, arch, "install ok installed", depends=depends, provides=provides)
+
+
+MULTIARCH_STATUS = [
+    installed("dpkg"),
+    installed("libc6"),
+    installed("libc6", "i386"),
+    installed("tool", depends="libc6 (>= 2.34)"),
+    installed("game", "i386", depends="libc6 (>= 2.34), fonts-game"),
+    installed("fonts-game", "all"),
+    installed("docs", "all", depends="libc6"),
+    installed("python3", depends="libc6"),
+    installed("script", "i386", depends="python3:any"),
+    installed("lib32-shim", depends="libc6:i386"),
+    installed("postfix", provides="mail-transport-agent", depends="libc6"),
+    installed("cron", depends="mail-transport-agent | exim4"),
+]
+
+
+def test_dependency_graph_architectures():
+    graph = read_dependency_graph(canned_host(MULTIARCH_STATUS))
+    # dependencies are the package of the same architecture, the native one for Architecture: all packages
+    assert graph["tool"] == ["libc6"]
+    assert graph["game:i386"] == ["libc6:i386", "fonts-game"]
+    assert graph["docs"] == ["libc6"]
+    # the only installed python3, and the architecture a dependency is qualified with
+    assert graph["script:i386"] == ["python3"]
+    assert graph["lib32-shim"] == ["libc6:i386"]
+    # a virtual package with a single provider
+    assert graph["cron"] == ["postfix"]
+    assert graph["libc6"] == graph["libc6:i386"] == []
+
+
+def test_drop_dependencies_of_foreign_packages():
+    auto_installed = ["dpkg", "docs", "python3", "script", "lib32-shim", "postfix", "cron"]
+    accessor = canned_host(
+        MULTIARCH_STATUS,
+        [auto_installed_stanza(name, NATIVE_ARCH) for name in auto_installed]
+        + [auto_installed_stanza("script", "i386")],
+    )
+    packages = get_apt_packages(accessor)
+    pulled_in = find_pulled_in_packages(read_dependency_graph(accessor), packages)
+    config = AptConfig(packages=packages, drop_dependencies=True, pulled_in=pulled_in)
+    assert config.packages.names == ["fonts-game", "game:i386", "libc6", "libc6:i386", "tool"]
+    # libc6:i386 and fonts-game come with game:i386, libc6 with tool
+    assert config.select_packages() == ["game:i386", "tool"]
@@ -0,0 +1,176 @@
+from cc_builder.host_accessor import CannedHostAccessor
+from cc_builder.modules.apt import AptConfig, deb822_to_one_lines, iter_deb822_stanzas, parse_sources_file
+
+# /etc/apt/sources.list.d/ubuntu.sources as shipped by Ubuntu 24.04
+UBUNTU_NOBLE_SOURCES = """\
+## Note, this file is written by cloud-init on first boot of an instance
+## modifications made here will not survive a re-bundle.
+## if you wish to make changes you can:
+## a.) add 'apt_preserve_sources_list: true' to /etc/cloud/cloud.cfg
+##     or do the same in user-data
+## b.) add supplemental sources in /etc/apt/sources.list.d
+## c.) make changes to template file
+##     /etc/cloud/templates/sources.list.ubuntu.deb822.tmpl
+
+# See http://help.ubuntu.com/community/UpgradeNotes for how to upgrade to
+# newer versions of the distribution.
+
+## Ubuntu distribution repository
+##
+## The following settings can be adjusted to configure which packages to use from Ubuntu.
+## Mirror your choices (except for URIs and Suites) in the security section below to
+## ensure timely security updates.
+##
+## Types: Append deb-src to enable the fetching of source package.
+## URIs: A URL to the repository (you may add multiple URLs)
+## Suites: Two suites: The first is the distribution name, the second is the distribution's
+##         updates, the third is the backports.
+## Components: Main, Restricted, Universe, Multiverse
+## Signed-By: The keyring used to verify the archive signature.
+Types: deb
+URIs: http://archive.ubuntu.com/ubuntu/
+Suites: noble noble-updates noble-backports
+Components: main restricted universe multiverse
+Signed-By: /usr/share/keyrings/ubuntu-archive-keyring.gpg
+
+## Ubuntu security updates. Aside from URIs and Suites,
+## this should mirror your choices in the previous section.
+Types: deb
+URIs: http://security.ubuntu.com/ubuntu/
+Suites: noble-security
+Components: main restricted universe multiverse
+Signed-By: /usr/share/keyrings/ubuntu-archive-keyring.gpg
+"""
+
+COMPONENTS = "main restricted universe multiverse"
+
+
+def test_stock_ubuntu_sources():
+    repositories = parse_sources_file("ubuntu.sources", "/etc/apt/sources.list.d/ubuntu.sources", UBUNTU_NOBLE_SOURCES)
+
+    assert [repository.repo_line_without_options for repository in repositories] == [
+        f"deb http://archive.ubuntu.com/ubuntu/ noble {COMPONENTS}",
+        f"deb http://archive.ubuntu.com/ubuntu/ noble-updates {COMPONENTS}",
+        f"deb http://archive.ubuntu.com/ubuntu/ noble-backports {COMPONENTS}",
+        f"deb http://security.ubuntu.com/ubuntu/ noble-security {COMPONENTS}",
+    ]
+    assert [repository.suite for repository in repositories] == [
+        "noble",
+        "noble-updates",
+        "noble-backports",
+        "noble-security",
+    ]
+    for repository in repositories:
+        assert repository.name == "ubuntu.list"
+        assert repository.archive_type == "deb"
+        assert repository.components == COMPONENTS.split()
+        assert repository.options == {"signed-by": ["/usr/share/keyrings/ubuntu-archive-keyring.gpg"]}
+        assert repository.original_repo_line == (
+            "deb [signed-by=/usr/share/keyrings/ubuntu-archive-keyring.gpg] "
+            + repository.repo_line_without_options[len("deb ") :]
+        )
+
+
+def test_stock_ubuntu_sources_cloud_config():
+    accessor = CannedHostAccessor(
+        files={
+            "/etc/apt/sources.list": "",
+            "/etc/apt/sources.list.d/ubuntu.sources": UBUNTU_NOBLE_SOURCES,
+            "/var/lib/dpkg/status": "",
+        }
+    )
+    config = AptConfig()
+    config.gather(accessor)
+
+    assert config.generate_cloud_config()["apt"]["sources"] == {
+        "ubuntu.list": {"source": f"deb http://archive.ubuntu.com/ubuntu/ noble {COMPONENTS}"},
+        "ubuntu-2.list": {
+            "source": f"deb http://archive.ubuntu.com/ubuntu/ noble-updates {COMPONENTS}",
+            "filename": "ubuntu.list",
+        },
+        "ubuntu-3.list": {
+            "source": f"deb http://archive.ubuntu.com/ubuntu/ noble-backports {COMPONENTS}",
+            "filename": "ubuntu.list",
+        },
+        "ubuntu-4.list": {
+            "source": f"deb http://security.ubuntu.com/ubuntu/ noble-security {COMPONENTS}",
+            "filename": "ubuntu.list",
+        },
+    }
+
+
+def test_colliding_source_names():
+    accessor = CannedHostAccessor(
+        files={
+            "/etc/apt/sources.list": "",
+            "/etc/apt/sources.list.d/docker.list": (
+                "deb https://download.docker.com/linux/ubuntu noble stable\n"
+                "deb https://download.docker.com/linux/ubuntu noble test\n"
+            ),
+            # a file whose name is already taken by the numbering of another one
+            "/etc/apt/sources.list.d/docker-2.list": "deb https://mirror.example.com/docker noble stable\n",
+            "/etc/apt/sources.list.d/kubernetes.list": "deb https://pkgs.k8s.io/core:/stable:/v1.30/deb/ /\n",
+            "/var/lib/dpkg/status": "",
+        }
+    )
+    config = AptConfig()
+    config.gather(accessor)
+
+    sources = config.generate_cloud_config()["apt"]["sources"]
+    # files with a single repository keep their name as key, as before, the later repositories of a file are
+    # numbered past the names already taken and written to the file they came from
+    assert sources == {
+        "docker.list": {"source": "deb https://download.docker.com/linux/ubuntu noble stable"},
+        "docker-2.list": {"source": "deb https://mirror.example.com/docker noble stable"},
+        "docker-3.list": {
+            "filename": "docker.list",
+            "source": "deb https://download.docker.com/linux/ubuntu noble test",
+        },
+        "kubernetes.list": {"source": "deb https://pkgs.k8s.io/core:/stable:/v1.30/deb/ /"},
+    }
+
+
+def test_types_uris_and_suites_are_expanded():
+    stanza = next(
+        iter_deb822_stanzas(
+            [
+                "Types: deb deb-src\n",
+                "URIs: http://archive.ubuntu.com/ubuntu/ http://mirror.example.com/ubuntu/\n",
+                "Suites: noble noble-updates\n",
+                "Components: main\n",
+                "Architectures: amd64 i386\n",
+                "Signed-By: /usr/share/keyrings/ubuntu-archive-keyring.gpg\n",
+            ]
+        )
+    )
+    lines = deb822_to_one_lines(stanza)
+    assert lines == [
+        f"{archive_type} {uri} {suite} main"
+        for archive_type in ("deb", "deb-src")
+        for uri in ("http://archive.ubuntu.com/ubuntu/", "http://mirror.example.com/ubuntu/")
+        for suite in ("noble", "noble-updates")
+    ]
+
+    repositories = parse_sources_file(
+        "mirror.sources",
+        "/etc/apt/sources.list.d/mirror.sources",
+        "".join(f"{key}: {value}\n" for key, value in stanza.items()),
+    )
+    assert [repository.repo_line_without_options for repository in repositories] == lines
+    assert [repository.archive_type for repository in repositories].count("deb-src") == 4
+    for repository in repositories:
+        assert repository.options == {
+            "arch": ["amd64", "i386"],
+            "signed-by": ["/usr/share/keyrings/ubuntu-archive-keyring.gpg"],
+        }
+        assert repository.original_repo_line.startswith(
+            f"{repository.archive_type} [arch=amd64,i386 signed-by=/usr/share/keyrings/ubuntu-archive-keyring.gpg] "
+        )
+
+
+def test_disabled_and_incomplete_stanzas():
+    content = (
+        "Types: deb\nURIs: http://archive.ubuntu.com/ubuntu/\nSuites: noble\nComponents: main\nEnabled: no\n\n"
+        "Types: deb\nURIs: http://archive.ubuntu.com/ubuntu/\nComponents: main\n"
+    )
+    assert parse_sources_file("ubuntu.sources", "/etc/apt/sources.list.d/ubuntu.sources", content) == []
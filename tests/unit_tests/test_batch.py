@@ -0,0 +1,23 @@
+from cc_builder.batch import render_capture
+from cc_builder.fleet import FleetHost
+
+from .test_fleet import FleetTestHost, capture
+
+
+def test_canonical_rerender_needs_no_force(tmp_path):
+    result = capture([FleetHost("web1")], tmp_path / "captures", {"web1": FleetTestHost("web1")}, write_inventory=True)[
+        0
+    ]
+    output_path = str(tmp_path / "web1.yaml")
+
+    assert not render_capture(result.inventory_path, output_path, canonical=True).unchanged
+    rerendered = render_capture(result.inventory_path, output_path, canonical=True)
+    assert rerendered.succeeded and rerendered.unchanged
+
+    # another user name changes the content
+    renamed = render_capture(result.inventory_path, output_path, options={"current_user": "admin"}, canonical=True)
+    assert "FileExistsError" in renamed.error
+    assert render_capture(
+        result.inventory_path, output_path, options={"current_user": "admin"}, canonical=True, force=True
+    ).succeeded
+    assert "FileExistsError" in render_capture(result.inventory_path, output_path).error
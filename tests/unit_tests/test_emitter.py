@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from cc_builder.emitter import write_cloud_config
+
+CLOUD_CONFIG = {"packages": ["vim", "curl"], "hostname": "web1"}
+
+
+def test_canonical_output_is_only_written_when_changed(tmp_path):
+    path = str(tmp_path / "cloud-config.yaml")
+    assert write_cloud_config(CLOUD_CONFIG, path, canonical=True, overwrite=False)
+    os.utime(path, (0, 0))
+
+    # the same content in another order is the same canonical file
+    reordered = {"hostname": "web1", "packages": ["curl", "vim"]}
+    assert not write_cloud_config(reordered, path, canonical=True, overwrite=False)
+    assert os.stat(path).st_mtime == 0
+
+
+def test_other_content_needs_overwrite(tmp_path):
+    path = str(tmp_path / "cloud-config.yaml")
+    write_cloud_config(CLOUD_CONFIG, path, canonical=True)
+    with open(path) as f:
+        content = f.read()
+
+    with pytest.raises(FileExistsError, match="already exists with other content"):
+        write_cloud_config(dict(CLOUD_CONFIG, hostname="web2"), path, canonical=True, overwrite=False)
+    with pytest.raises(FileExistsError):
+        write_cloud_config(CLOUD_CONFIG, path, overwrite=False)
+    with open(path) as f:
+        assert f.read() == content
+
+    assert write_cloud_config(dict(CLOUD_CONFIG, hostname="web2"), path, canonical=True)
+    with open(path) as f:
+        assert "hostname: web2\n" in f.read()
@@ -0,0 +1,174 @@
+import contextlib
+import os
+import re
+import threading
+import time
+
+import pytest
+
+from cc_builder.fleet import FleetHost, capture_fleet, check_unique_labels, print_fleet_summary
+from cc_builder.host_accessor import CannedHostAccessor, CommandResult, HostConnectionError
+
+
+class FleetTestHost(CannedHostAccessor):
+    """
+    A canned Ubuntu host that can be made slow, or unreachable like an SSH host whose connection fails.
+    """
+
+    def __init__(self, hostname: str, delay: float = 0.0, reachable: bool = True, tracker=None):
+        super().__init__(
+            commands={
+                "whoami": "ubuntu\n",
+                "getent passwd": "ubuntu:x:1000:1000::/home/ubuntu:/bin/bash\n",
+                "getent group": "ubuntu:x:1000:\nsudo:x:27:ubuntu\n",
+                "apt-mark showmanual": "curl\nvim\n",
+                "snap list": CommandResult(returncode=1, stdout="", stderr="No snaps are installed yet."),
+            },
+            files={"/etc/hostname": f"{hostname}\n", "/etc/apt/sources.list": ""},
+            hostname=hostname,
+        )
+        self.delay = delay
+        self.reachable = reachable
+        self.tracker = tracker
+
+    def check_connection(self):
+        if not self.reachable:
+            raise HostConnectionError(f"ssh: connect to host {self.hostname} port 22: Connection refused")
+
+    def run(self, command: str) -> CommandResult:
+        if self.tracker is not None:
+            with self.tracker.active(self.hostname):
+                time.sleep(self.delay)
+                return super().run(command)
+        time.sleep(self.delay)
+        return super().run(command)
+
+
+class ConcurrencyTracker:
+    """
+    Count the hosts that are being captured at the same time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = set()
+        self.max_hosts = 0
+
+    @contextlib.contextmanager
+    def active(self, hostname: str):
+        with self.lock:
+            self.hosts.add(hostname)
+            self.max_hosts = max(self.max_hosts, len(self.hosts))
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.hosts.discard(hostname)
+
+
+def capture(hosts, output_dir, accessors, **kwargs):
+    return capture_fleet(hosts, str(output_dir), lambda host: accessors[host.target], **kwargs)
+
+
+def test_one_cloud_config_per_host(tmp_path):
+    hosts = [FleetHost("ubuntu@web1"), FleetHost("web2", port=2222), FleetHost("db1")]
+    accessors = {host.target: FleetTestHost(host.target.split("@")[-1]) for host in hosts}
+    results = capture(hosts, tmp_path, accessors)
+
+    assert [result.host for result in results] == hosts
+    assert all(result.succeeded for result in results)
+    assert sorted(os.listdir(tmp_path)) == ["db1.yaml", "ubuntu@web1.yaml", "web2_2222.yaml"]
+    for result in results:
+        with open(result.output_path) as output_file:
+            content = output_file.read()
+        assert content.startswith("#cloud-config")
+        assert f"hostname: {accessors[result.host.target].hostname}\n" in content
+        assert "- curl\n- vim\n" in content
+
+
+def test_same_host_as_different_users(tmp_path):
+    hosts = [FleetHost("alice@h"), FleetHost("bob@h")]
+    assert hosts[0].label != hosts[1].label
+    results = capture(hosts, tmp_path, {host.target: FleetTestHost("h") for host in hosts})
+    assert [os.path.basename(result.output_path) for result in results] == ["alice@h.yaml", "bob@h.yaml"]
+
+
+def test_duplicate_labels_are_rejected(tmp_path):
+    hosts = [FleetHost("web1"), FleetHost("ubuntu@web1"), FleetHost("web1")]
+    with pytest.raises(ValueError, match="web1"):
+        check_unique_labels(hosts)
+    with pytest.raises(ValueError):
+        capture(hosts, tmp_path, {host.target: FleetTestHost("web1") for host in hosts})
+    assert os.listdir(tmp_path) == []
+
+
+def test_failure_summary(tmp_path, capsys):
+    hosts = [FleetHost("web1"), FleetHost("dead"), FleetHost("web2")]
+    accessors = {
+        "web1": FleetTestHost("web1"),
+        "dead": FleetTestHost("dead", reachable=False),
+        "web2": FleetTestHost("web2"),
+    }
+    results = capture(hosts, tmp_path, accessors)
+
+    assert [result.succeeded for result in results] == [True, False, True]
+    assert results[1].error == "HostConnectionError: ssh: connect to host dead port 22: Connection refused"
+    assert results[1].output_path is None
+    assert sorted(os.listdir(tmp_path)) == ["web1.yaml", "web2.yaml"]
+
+    capsys.readouterr()
+    print_fleet_summary(results)
+    captured = capsys.readouterr()
+    output = captured.out + captured.err
+    assert "Captured 2/3 hosts" in output
+    assert "1 host(s) failed" in output
+    assert "dead: HostConnectionError" in output
+
+
+def test_per_host_timings(tmp_path, capsys):
+    hosts = [FleetHost("fast"), FleetHost("slow")]
+    accessors = {"fast": FleetTestHost("fast"), "slow": FleetTestHost("slow", delay=0.01)}
+    results = capture(hosts, tmp_path, accessors)
+
+    fast, slow = results
+    assert 0 < fast.duration < slow.duration
+    # the slow host spends at least its delay on every command it runs
+    assert slow.duration >= 0.01
+
+    capsys.readouterr()
+    print_fleet_summary(results)
+    captured = capsys.readouterr()
+    timings = re.findall(r"\b(fast|slow) +(\d+\.\d\d)s +ok$", captured.out + captured.err, re.MULTILINE)
+    # slowest host first
+    assert timings == [("slow", f"{slow.duration:.2f}"), ("fast", f"{fast.duration:.2f}")]
+
+
+def test_parallelism_limit(tmp_path):
+    tracker = ConcurrencyTracker()
+    hosts = [FleetHost(f"host{index}") for index in range(6)]
+    accessors = {host.target: FleetTestHost(host.target, delay=0.005, tracker=tracker) for host in hosts}
+    # with jobs=1 each host runs one command at a time, so concurrent commands are concurrent hosts
+    results = capture(hosts, tmp_path, accessors, parallelism=2, jobs=1)
+
+    assert all(result.succeeded for result in results)
+    assert tracker.max_hosts == 2
+
+
+def test_canonical_rerun_needs_no_force(tmp_path):
+    hosts = [FleetHost("web1"), FleetHost("web2")]
+    accessors = {host.target: FleetTestHost(host.target) for host in hosts}
+    first = capture(hosts, tmp_path, accessors, canonical=True)
+    assert [result.unchanged for result in first] == [False, False]
+
+    # identical cloud-configs are kept, one whose content changed needs --force
+    accessors["web2"].files["/etc/hostname"] = "web2.example.com\n"
+    accessors["web2"].hostname = "web2.example.com"
+    second = capture(hosts, tmp_path, accessors, canonical=True)
+    assert second[0].succeeded and second[0].unchanged
+    assert "FileExistsError" in second[1].error
+    with open(first[1].output_path) as output_file:
+        assert "hostname: web2\n" in output_file.read()
+
+    assert capture(hosts[1:], tmp_path, accessors, canonical=True, force=True)[0].succeeded
+    # cloud-configs with the time they were written in them are never identical
+    assert "FileExistsError" in capture(hosts[:1], tmp_path, accessors)[0].error
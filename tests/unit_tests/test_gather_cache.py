@@ -0,0 +1,212 @@
+import os
+import time
+
+import pytest
+
+from cc_builder.gather_cache import CACHE_ENTRY_SUFFIX, GatherCache
+from cc_builder.host_accessor import CannedHostAccessor, RootfsHostAccessor
+from cc_builder.modules.apt import AptConfig
+from cc_builder.modules.snap import SnapConfig
+from cc_builder.modules.ssh import SSHConfig
+
+DPKG_STATUS = """\
+Package: curl
+Status: install ok installed
+Architecture: amd64
+Version: 8.5.0-2ubuntu10
+
+Package: vim
+Status: install ok installed
+Architecture: amd64
+Version: 2:9.1.0016-1ubuntu7
+"""
+
+SNAPD_STATE = """\
+{"data": {"snaps": {"lxd": {"type": "app", "sequence": [{"name": "lxd", "revision": "29351"}], "active": true,
+"current": "29351", "channel": "5.21/stable"}}}}
+"""
+
+ROOT_FILES = {
+    "etc/passwd": "root:x:0:0:root:/root:/bin/bash\nubuntu:x:1000:1000::/home/ubuntu:/bin/bash\n",
+    "var/lib/dpkg/status": DPKG_STATUS,
+    "var/lib/apt/extended_states": "",
+    "etc/apt/sources.list": "deb http://archive.ubuntu.com/ubuntu noble main\n",
+    "etc/apt/sources.list.d/ppa.list": "deb http://ppa.launchpadcontent.net/a/b/ubuntu noble main\n",
+    "var/lib/snapd/state.json": SNAPD_STATE,
+    "etc/ssh/sshd_config": "Include /etc/ssh/sshd_config.d/*.conf\nInclude /etc/ssh/local.conf /etc/ssh/extra.conf\n",
+    "etc/ssh/sshd_config.d/50-cloud-init.conf": "PasswordAuthentication no\n",
+    "etc/ssh/local.conf": "PermitRootLogin no\n",
+    "home/ubuntu/.ssh/authorized_keys": "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIHl3 ubuntu@laptop\n",
+}
+
+MODULES = {
+    "apt": AptConfig,
+    "snap": SnapConfig,
+    "ssh": lambda: SSHConfig(current_user="ubuntu"),
+}
+
+
+def make_root(tmp_path) -> RootfsHostAccessor:
+    root = tmp_path / "root"
+    for path, content in ROOT_FILES.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text(content)
+    return RootfsHostAccessor(str(root))
+
+
+def gather_through(cache: GatherCache, name: str, accessor):
+    """
+    Look `name` up in the cache and gather it on a miss, like gather_cloud_config does. Returns the lookup.
+    """
+    config = MODULES[name]()
+    lookup = cache.lookup(name, config, accessor)
+    if not lookup.hit:
+        config.gather(accessor)
+        cache.store(lookup, config)
+    return lookup
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return GatherCache(str(tmp_path / "cache"))
+
+
+@pytest.mark.parametrize("name", sorted(MODULES))
+def test_hit_returns_the_gathered_config(tmp_path, cache, name):
+    accessor = make_root(tmp_path)
+    assert not gather_through(cache, name, accessor).hit
+
+    gathered = MODULES[name]()
+    gathered.gather(accessor)
+    lookup = gather_through(cache, name, accessor)
+    assert lookup.hit
+    assert lookup.config == gathered
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.stores) == (1, 1, 1)
+
+
+def test_entries_are_keyed_by_options(tmp_path, cache):
+    accessor = make_root(tmp_path)
+    gather_through(cache, "snap", accessor)
+    assert not cache.lookup("snap", SnapConfig(pin_channels=True), accessor).hit
+    assert cache.lookup("snap", SnapConfig(), accessor).hit
+
+
+def test_uncacheable_hosts_and_modules(cache):
+    # canned hosts cannot fingerprint their files
+    assert cache.lookup("snap", SnapConfig(), CannedHostAccessor()) is None
+    # other users' keys are not fingerprinted
+    config = SSHConfig(current_user="ubuntu", selected_users=["ubuntu", "alice"])
+    assert cache.lookup("ssh", config, RootfsHostAccessor("/nonexistent")) is None
+
+
+def modify(path):
+    # a blank line keeps every format valid, e.g. snapd's JSON state
+    with open(path, "a") as f:
+        f.write("\n")
+
+
+def create(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("ssh-rsa AAAAB3NzaC1yc2E ubuntu@laptop\n")
+
+
+@pytest.mark.parametrize(
+    "name, path, change",
+    [
+        ("apt", "var/lib/dpkg/status", modify),
+        ("apt", "var/lib/apt/extended_states", modify),
+        ("apt", "etc/apt/sources.list", modify),
+        ("apt", "etc/apt/sources.list.d/ppa.list", modify),
+        ("apt", "etc/apt/sources.list.d/new.list", create),
+        ("apt", "etc/apt/sources.list.d/ppa.list", os.unlink),
+        ("snap", "var/lib/snapd/state.json", modify),
+        ("ssh", "etc/ssh/sshd_config", modify),
+        ("ssh", "etc/ssh/sshd_config.d/50-cloud-init.conf", modify),
+        ("ssh", "etc/ssh/sshd_config.d/60-new.conf", create),
+        # included from outside sshd_config.d
+        ("ssh", "etc/ssh/local.conf", modify),
+        # included, but did not exist yet
+        ("ssh", "etc/ssh/extra.conf", create),
+        ("ssh", "home/ubuntu/.ssh/authorized_keys", modify),
+        ("ssh", "home/ubuntu/.ssh/id_rsa.pub", create),
+    ],
+)
+def test_changed_inputs_invalidate_entries(tmp_path, cache, name, path, change):
+    accessor = make_root(tmp_path)
+    for module in MODULES:
+        gather_through(cache, module, accessor)
+
+    change(os.path.join(accessor.root, path))
+    for module in MODULES:
+        lookup = gather_through(cache, module, accessor)
+        # only the module reading the file is gathered again
+        assert lookup.hit == (module != name)
+    assert cache.stats.stale == 1
+    # and stored anew
+    assert gather_through(cache, name, accessor).hit
+
+
+def entry_paths(cache: GatherCache):
+    return sorted(os.path.join(cache.directory, name) for name in os.listdir(cache.directory))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, cache):
+    accessor = make_root(tmp_path)
+    paths = {}
+    for index, name in enumerate(("first", "second", "third")):
+        config = SnapConfig()
+        lookup = cache.lookup(name, config, accessor)
+        config.gather(accessor)
+        cache.store(lookup, config)
+        paths[name] = cache._entry_path(lookup.key)
+        # stored an hour apart, oldest first
+        stored_at = time.time() - 3600 * (3 - index)
+        os.utime(paths[name], (stored_at, stored_at))
+
+    # using the oldest entry makes it the most recently used one
+    assert cache.lookup("first", SnapConfig(), accessor).hit
+    cache.size_limit = sum(os.path.getsize(path) for path in paths.values()) - 1
+    cache.evict()
+    assert entry_paths(cache) == sorted([paths["first"], paths["third"]])
+    assert cache.stats.evictions == 1
+
+    # entries of older versions are dropped as well
+    open(os.path.join(cache.directory, "0123abcd.pickle"), "wb").close()
+    cache.size_limit = 0
+    cache.evict()
+    assert entry_paths(cache) == []
+    assert cache.stats.evictions == 3
+
+
+def test_unreadable_entries_are_discarded(tmp_path, cache):
+    accessor = make_root(tmp_path)
+    gather_through(cache, "snap", accessor)
+    (path,) = entry_paths(cache)
+    with open(path, "w") as f:
+        f.write('{"fingerprints": ')
+
+    assert not gather_through(cache, "snap", accessor).hit
+    assert cache.stats.stale == 0
+    assert gather_through(cache, "snap", accessor).hit
+
+
+@pytest.mark.skipif(os.getuid() != 0, reason="needs root to hand the entry to another user")
+def test_entries_of_other_users_are_ignored(tmp_path, cache):
+    accessor = make_root(tmp_path)
+    gather_through(cache, "snap", accessor)
+    (path,) = entry_paths(cache)
+    os.chown(path, 12345, -1)
+
+    assert not cache.lookup("snap", SnapConfig(), accessor).hit
+    # left where it is, its owner may still use it
+    assert entry_paths(cache) == [path]
+
+
+def test_entries_are_json(tmp_path, cache):
+    gather_through(cache, "snap", make_root(tmp_path))
+    (path,) = entry_paths(cache)
+    assert path.endswith(CACHE_ENTRY_SUFFIX)
+    with open(path) as f:
+        assert f.read(1) == "{"
+    assert os.stat(cache.directory).st_mode & 0o777 == 0o700
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+from cc_builder.host_accessor import (
+    RECORDING_FORMAT_VERSION,
+    CannedHostAccessor,
+    RecordingHostAccessor,
+    ReplayHostAccessor,
+)
+from cc_builder.modules.snap import SNAPD_STATE_PATH, SnapConfig
+from cc_builder.sshd_config import read_sshd_config
+
+from .conftest import SnapdHost
+
+SNAPD_STATE = {
+    "data": {
+        "snaps": {
+            "hello-world": {"current": "29", "channel": "latest/stable", "type": "app", "active": True},
+            "code": {"current": "161", "channel": "latest/stable", "type": "app", "active": True, "classic": True},
+        }
+    }
+}
+
+
+def record(host, recording_path, gather):
+    recorder = RecordingHostAccessor(host)
+    recorded = gather(recorder)
+    recorder.save(str(recording_path))
+    return recorded, ReplayHostAccessor.load(str(recording_path))
+
+
+def gather_snaps(accessor):
+    config = SnapConfig(pin_channels=True)
+    config.gather(accessor)
+    return config
+
+
+def test_root_filesystem_recording(tmp_path):
+    # a --root capture: the snap command cannot be run, snaps are read from snapd's state instead
+    host = CannedHostAccessor(files={SNAPD_STATE_PATH: json.dumps(SNAPD_STATE)}, can_run_commands=False)
+    recorded, replay = record(host, tmp_path / "recording.json", gather_snaps)
+
+    assert replay.can_run_commands is False
+    replayed = gather_snaps(replay)
+    assert [snap.name for snap in replayed.snaps] == ["code", "hello-world"]
+    assert replayed.generate_cloud_config() == recorded.generate_cloud_config()
+
+
+def test_root_filesystem_user_database_recording(tmp_path):
+    # accounts are read from /etc/passwd and /etc/group rather than getent
+    host = CannedHostAccessor(
+        files={
+            "/etc/passwd": "root:x:0:0:root:/root:/bin/bash\nubuntu:x:1000:1000::/home/ubuntu:/bin/sh\n",
+            "/etc/group": "root:x:0:\nubuntu:x:1000:\n",
+        },
+        can_run_commands=False,
+    )
+    recorded, replay = record(host, tmp_path / "recording.json", lambda accessor: accessor.read_user_database())
+
+    assert replay.read_user_database() == recorded
+
+
+def test_snapd_socket_recording(tmp_path, snapd_socket):
+    recorded, replay = record(SnapdHost(snapd_socket), tmp_path / "recording.json", gather_snaps)
+
+    replayed = gather_snaps(replay)
+    assert "snap list" not in replay.commands
+    assert replayed.snaps == recorded.snaps
+    assert "snap install lxd --channel=5.21/stable" in replayed.generate_cloud_config()["snap"]["commands"]
+
+
+def test_missing_snapd_socket_recording(tmp_path):
+    host = SnapdHost(None, commands={"snap list": "Name  Version  Rev  Tracking  Publisher  Notes\n"})
+    _, replay = record(host, tmp_path / "recording.json", gather_snaps)
+
+    with pytest.raises(FileNotFoundError):
+        replay.connect_unix_socket("/run/snapd.socket")
+    assert gather_snaps(replay).snaps == []
+
+
+def test_file_checks_recording(tmp_path):
+    host = CannedHostAccessor(
+        files={
+            "/etc/ssh/sshd_config": "Include /etc/ssh/sshd_config.d/*.conf\nPasswordAuthentication no\n",
+            "/etc/ssh/sshd_config.d/50-cloud-init.conf": "PasswordAuthentication yes\n",
+        },
+        directories={"/etc/ssh/sshd_config.d": ["50-cloud-init.conf", "subdir.conf"]},
+    )
+    recorded, replay = record(host, tmp_path / "recording.json", read_sshd_config)
+
+    assert replay.file_checks == {
+        "/etc/ssh/sshd_config.d/50-cloud-init.conf": True,
+        "/etc/ssh/sshd_config.d/subdir.conf": False,
+    }
+    assert read_sshd_config(replay).entries == recorded.entries
+
+
+def test_older_recordings_are_rejected(tmp_path):
+    recording_path = tmp_path / "recording.json"
+    recording_path.write_text(json.dumps({"version": RECORDING_FORMAT_VERSION - 1}))
+    with pytest.raises(ValueError, match="Unsupported host recording version"):
+        ReplayHostAccessor.load(str(recording_path))
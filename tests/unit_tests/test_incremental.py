@@ -0,0 +1,161 @@
+import os
+import time
+
+from cc_builder.emitter import write_cloud_config
+from cc_builder.generator import create_cloud_init_config
+from cc_builder.host_accessor import RootfsHostAccessor
+from cc_builder.incremental import (
+    GATHERED_AT_PREFIX,
+    Provenance,
+    diff_cloud_configs,
+    load_previous_cloud_config,
+    select_reusable_sections,
+)
+from cc_builder.modules.apt import AptConfig
+from cc_builder.modules.snap import SnapConfig
+
+APT_INPUTS = ("var/lib/dpkg/status", "var/lib/apt/extended_states", "etc/apt/sources.list")
+CLOUD_CONFIG = {"packages": ["curl", "vim"], "snap": {"commands": ["snap install lxd"]}}
+
+
+def make_root(tmp_path):
+    root = tmp_path / "root"
+    (root / "etc/apt/sources.list.d").mkdir(parents=True)
+    # the inputs were last modified ten minutes ago
+    modified_at = time.time() - 600
+    for path in APT_INPUTS + ("var/lib/snapd/state.json",):
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text("")
+        os.utime(root / path, (modified_at, modified_at))
+    os.utime(root / "etc/apt/sources.list.d", (modified_at, modified_at))
+    return RootfsHostAccessor(str(root))
+
+
+def write_previous(tmp_path, configs, gathered_at_ns=None, canonical=False):
+    provenance = Provenance() if gathered_at_ns is None else Provenance(gathered_at_ns=gathered_at_ns)
+    for name, config in configs:
+        provenance.add_module(name, config)
+    path = str(tmp_path / "previous.yaml")
+    footer_lines = () if canonical else provenance.footer_lines()
+    write_cloud_config(CLOUD_CONFIG, path, canonical=canonical, footer_lines=footer_lines)
+    return path
+
+
+def test_footer_round_trip(tmp_path):
+    configs = [("apt", AptConfig(drop_dependencies=True)), ("snap", SnapConfig())]
+    path = write_previous(tmp_path, configs, gathered_at_ns=1234567890123456789)
+
+    previous = load_previous_cloud_config(path)
+    assert previous.cloud_config == CLOUD_CONFIG
+    assert previous.provenance == Provenance(
+        gathered_at_ns=1234567890123456789,
+        modules={
+            "apt": {"base_manifest": None, "drop_dependencies": True},
+            "snap": {"pin_snap_channels": False},
+        },
+    )
+
+
+def test_reuses_unchanged_sections(tmp_path):
+    accessor = make_root(tmp_path)
+    configs = [("apt", AptConfig()), ("snap", SnapConfig())]
+    previous = load_previous_cloud_config(write_previous(tmp_path, configs))
+
+    assert select_reusable_sections(configs, accessor, previous) == {
+        "apt": {"packages": ["curl", "vim"]},
+        "snap": {"snap": {"commands": ["snap install lxd"]}},
+    }
+
+
+def test_time_comes_from_the_footer(tmp_path):
+    accessor = make_root(tmp_path)
+    configs = [("apt", AptConfig()), ("snap", SnapConfig())]
+    # gathered before the inputs were last modified, but the file itself was copied around since
+    path = write_previous(tmp_path, configs, gathered_at_ns=time.time_ns() - 3600 * 10**9)
+    os.utime(path)
+    assert select_reusable_sections(configs, accessor, load_previous_cloud_config(path)) == {}
+
+    # gathered after the inputs were last modified, but the file's mtime is older
+    path = write_previous(tmp_path, configs)
+    os.utime(path, (0, 0))
+    assert set(select_reusable_sections(configs, accessor, load_previous_cloud_config(path))) == {"apt", "snap"}
+
+
+def test_modified_inputs_are_regathered(tmp_path):
+    accessor = make_root(tmp_path)
+    configs = [("apt", AptConfig()), ("snap", SnapConfig())]
+    previous = load_previous_cloud_config(write_previous(tmp_path, configs))
+    later = time.time() + 10
+    os.utime(os.path.join(accessor.root, "var/lib/snapd/state.json"), (later, later))
+
+    assert set(select_reusable_sections(configs, accessor, previous)) == {"apt"}
+
+
+def test_other_options_are_regathered(tmp_path):
+    accessor = make_root(tmp_path)
+    previous = load_previous_cloud_config(
+        write_previous(tmp_path, [("apt", AptConfig(base_manifest="/tmp/base.manifest")), ("snap", SnapConfig())])
+    )
+
+    assert set(select_reusable_sections([("apt", AptConfig()), ("snap", SnapConfig())], accessor, previous)) == {"snap"}
+    configs = [("apt", AptConfig(base_manifest="/tmp/base.manifest")), ("snap", SnapConfig(pin_channels=True))]
+    assert set(select_reusable_sections(configs, accessor, previous)) == {"apt"}
+    configs = [("apt", AptConfig(base_manifest="/tmp/base.manifest", drop_dependencies=True)), ("snap", SnapConfig())]
+    assert set(select_reusable_sections(configs, accessor, previous)) == {"snap"}
+
+
+def test_modules_missing_from_the_previous_run_are_regathered(tmp_path):
+    accessor = make_root(tmp_path)
+    # the snap module was disabled for the previous cloud-config, its section came from elsewhere
+    previous = load_previous_cloud_config(write_previous(tmp_path, [("apt", AptConfig())]))
+
+    configs = [("apt", AptConfig()), ("snap", SnapConfig())]
+    assert set(select_reusable_sections(configs, accessor, previous)) == {"apt"}
+
+
+def test_without_provenance_everything_is_regathered(tmp_path):
+    accessor = make_root(tmp_path)
+    configs = [("apt", AptConfig()), ("snap", SnapConfig())]
+    previous = load_previous_cloud_config(write_previous(tmp_path, configs, canonical=True))
+
+    assert previous.provenance is None
+    assert select_reusable_sections(configs, accessor, previous) == {}
+
+
+def test_footer_only_written_when_asked_for(tmp_path):
+    accessor = make_root(tmp_path)
+    (tmp_path / "root/etc/passwd").write_text("ubuntu:x:1000:1000::/home/ubuntu:/bin/bash\n")
+    (tmp_path / "root/var/lib/snapd/state.json").write_text('{"data": {"snaps": {}}}')
+    # the default footer stays as it was, without the time and options of the gathering
+    path = str(tmp_path / "default.yaml")
+    create_cloud_init_config(path, disabled_configs=["user", "ssh", "hostname"], accessor=accessor)
+    assert load_previous_cloud_config(path).provenance is None
+    assert GATHERED_AT_PREFIX not in open(path).read()
+
+    path = str(tmp_path / "provenance.yaml")
+    create_cloud_init_config(path, disabled_configs=["user", "ssh", "hostname"], accessor=accessor, provenance=True)
+    previous = load_previous_cloud_config(path)
+    assert set(previous.provenance.modules) == {"apt", "snap"}
+
+    # the output of a --since run can be the --since of the next one
+    path = str(tmp_path / "since.yaml")
+    create_cloud_init_config(path, disabled_configs=["user", "ssh", "hostname"], accessor=accessor, previous=previous)
+    assert load_previous_cloud_config(path).provenance is not None
+
+
+def test_diff_lists():
+    old = {"packages": ["curl", "vim", "git"], "users": [{"name": "ubuntu"}], "snap": {"commands": ["a"]}}
+    new = {"packages": ["git", "curl", "jq"], "users": [{"name": "ubuntu"}, {"name": "bob"}], "runcmd": ["true"]}
+    assert diff_cloud_configs(old, new) == [
+        {"path": "packages", "added": ["jq"], "removed": ["vim"]},
+        {"path": "users", "added": [{"name": "bob"}]},
+        {"path": "runcmd", "added": ["true"]},
+        {"path": "snap", "removed": {"commands": ["a"]}},
+    ]
+    assert diff_cloud_configs({"packages": ["a", "b"]}, {"packages": ["b", "a"]}) == [
+        {"path": "packages", "old": ["a", "b"], "new": ["b", "a"]}
+    ]
+    # lists mixing hashable and unhashable items
+    assert diff_cloud_configs({"write_files": ["a", {"path": "/b"}]}, {"write_files": [{"path": "/b"}]}) == [
+        {"path": "write_files", "removed": ["a"]}
+    ]
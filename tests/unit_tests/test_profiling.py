@@ -0,0 +1,141 @@
+import json
+import threading
+
+import pytest
+
+from cc_builder.defaults import PROFILE_FORMATS
+from cc_builder.host_accessor import CannedHostAccessor
+from cc_builder.profiling import (
+    PROFILE_FORMAT_VERSION,
+    Profiler,
+    measure,
+    record_read,
+    record_subprocess,
+    write_profile,
+)
+
+
+def test_nested_phases():
+    profiler = Profiler("alice@box1")
+    accessor = CannedHostAccessor(files={"/etc/hostname": "box1\n"})
+    with measure(profiler, "", "prefetch") as outer:
+        record_subprocess(0.5, "No snaps\n", "")
+        with measure(profiler, "hostname", "gather") as inner:
+            # files opened on the host count their reads
+            with accessor.open_file("/etc/hostname") as f:
+                f.read()
+        # counted against the outer phase again once the inner one is over
+        record_read(b"12345")
+    # nothing is measured outside of a phase, or without a profiler
+    record_subprocess(1.0, "output")
+    with measure(None, "snap", "gather"):
+        record_subprocess(1.0, "output")
+
+    assert (outer.subprocesses, outer.subprocess_time, outer.bytes_read) == (1, 0.5, len("No snaps\n") + 5)
+    assert (inner.subprocesses, inner.bytes_read) == (0, len("box1\n"))
+    # phases are recorded as they end, the inner one first
+    assert [timing.name for timing in profiler.phases] == ["hostname.gather", "prefetch"]
+    assert outer.start <= inner.start
+    assert inner.start + inner.wall_time <= outer.start + outer.wall_time
+    assert profiler.wall_time == outer.start + outer.wall_time
+    assert [phase["name"] for phase in profiler.report()["phases"]] == ["prefetch", "hostname.gather"]
+
+
+def test_phases_of_other_threads():
+    profiler = Profiler()
+    with measure(profiler, "", "prefetch") as outer:
+        # a thread started while a phase is measured does not count against it
+        thread = threading.Thread(target=record_subprocess, args=(1.0, "output"), name="worker")
+        thread.start()
+        thread.join()
+
+        def gather():
+            with measure(profiler, "apt", "gather"):
+                record_subprocess(1.0, "output")
+
+        thread = threading.Thread(target=gather, name="worker")
+        thread.start()
+        thread.join()
+
+    assert outer.subprocesses == 0
+    apt = next(timing for timing in profiler.phases if timing.module == "apt")
+    assert (apt.thread, apt.subprocesses, apt.subprocess_time) == ("worker", 1, 1.0)
+
+
+def make_profilers():
+    profilers = []
+    for label in ("alice@box1", "bob@box2"):
+        profiler = Profiler(label)
+        with measure(profiler, "", "prefetch"):
+            with measure(profiler, "apt", "gather"):
+                record_subprocess(0.5, "output")
+            with measure(profiler, "apt", "generate"):
+                pass
+        profilers.append(profiler)
+    return profilers
+
+
+def check_json(document):
+    assert document["version"] == PROFILE_FORMAT_VERSION
+    assert [host["host"] for host in document["hosts"]] == ["alice@box1", "bob@box2"]
+    assert [phase["name"] for phase in document["hosts"][0]["phases"]] == ["prefetch", "apt.gather", "apt.generate"]
+    assert document["phases"]["apt.gather"]["hosts"] == 2
+    assert document["phases"]["apt.gather"]["subprocesses"] == 2
+    assert document["phases"]["apt.gather"]["bytes_read"] == 2 * len("output")
+
+
+def check_chrome(document):
+    events = document["traceEvents"]
+    assert [(event["pid"], event["args"]["name"]) for event in events if event["name"] == "process_name"] == [
+        (1, "alice@box1"),
+        (2, "bob@box2"),
+    ]
+    phases = [event for event in events if event["ph"] == "X" and event["pid"] == 1]
+    assert [event["name"] for event in phases] == ["prefetch", "apt.gather", "apt.generate"]
+    # nested phases lie within the phase around them
+    prefetch = phases[0]
+    for event in phases[1:]:
+        assert prefetch["ts"] <= event["ts"]
+        assert event["ts"] + event["dur"] <= prefetch["ts"] + prefetch["dur"]
+    assert phases[1]["args"]["subprocesses"] == 1
+
+
+def check_speedscope(document):
+    frames = [frame["name"] for frame in document["shared"]["frames"]]
+    assert sorted(frames) == ["apt.gather", "apt.generate", "prefetch"]
+    assert [profile["name"] for profile in document["profiles"]] == ["alice@box1 MainThread", "bob@box2 MainThread"]
+    for profile in document["profiles"]:
+        # every phase opens and closes in stack order, as speedscope requires of evented profiles
+        stack = []
+        for event in profile["events"]:
+            assert profile["startValue"] <= event["at"] <= profile["endValue"]
+            if event["type"] == "O":
+                stack.append(event["frame"])
+            else:
+                assert stack.pop() == event["frame"]
+        assert stack == []
+        assert [frames[event["frame"]] for event in profile["events"] if event["type"] == "O"] == [
+            "prefetch",
+            "apt.gather",
+            "apt.generate",
+        ]
+
+
+FORMAT_CHECKS = {"json": check_json, "chrome": check_chrome, "speedscope": check_speedscope}
+
+
+def test_every_format_is_checked():
+    assert sorted(FORMAT_CHECKS) == sorted(PROFILE_FORMATS)
+
+
+@pytest.mark.parametrize("profile_format", PROFILE_FORMATS)
+def test_profile_formats(tmp_path, profile_format):
+    path = tmp_path / "profile.json"
+    write_profile(make_profilers(), str(path), profile_format)
+    with open(path) as f:
+        FORMAT_CHECKS[profile_format](json.load(f))
+
+
+def test_unknown_profile_format(tmp_path):
+    with pytest.raises(ValueError, match="Unknown profile format 'pstats'"):
+        write_profile(make_profilers(), str(tmp_path / "profile.json"), "pstats")
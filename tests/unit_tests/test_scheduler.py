@@ -0,0 +1,137 @@
+import dataclasses
+import threading
+import time
+from typing import ClassVar, Dict, List, Optional, Tuple
+
+import pytest
+
+from cc_builder.custom_types import BaseConfig
+from cc_builder.scheduler import gather_configs, resolve_gather_order
+
+
+class Recorder:
+    """
+    Record the order modules start in and how many of them gather at the same time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started: List[str] = []
+        self.running = 0
+        self.max_running = 0
+
+
+@dataclasses.dataclass
+class FakeConfig(BaseConfig):
+    module_name: ClassVar[str] = "fake"
+
+    recorder: Optional[Recorder] = None
+    delay: float = 0.0
+    error: Optional[Exception] = None
+    dependencies: Dict[str, BaseConfig] = dataclasses.field(default_factory=dict)
+    gathered: bool = False
+
+    def use_dependencies(self, dependencies: Dict[str, BaseConfig]):
+        self.dependencies = dependencies
+
+    def gather(self, accessor=None):
+        with self.recorder.lock:
+            self.recorder.started.append(self.module_name)
+            self.recorder.running += 1
+            self.recorder.max_running = max(self.recorder.max_running, self.recorder.running)
+        try:
+            time.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            self.gathered = True
+        finally:
+            with self.recorder.lock:
+                self.recorder.running -= 1
+
+
+def fake_module(name: str, depends_on: Tuple[str, ...] = ()) -> type:
+    return type(f"{name.capitalize()}Config", (FakeConfig,), {"module_name": name, "depends_on": depends_on})
+
+
+def make_configs(recorder: Recorder, modules, **kwargs) -> List[Tuple[str, BaseConfig]]:
+    """
+    Create the (name, config) pairs of `modules`, given as (name, depends_on) or (name, depends_on, delay).
+    """
+    configs = []
+    for name, depends_on, *delay in modules:
+        config = fake_module(name, depends_on)(recorder=recorder, delay=delay[0] if delay else 0.0, **kwargs)
+        configs.append((name, config))
+    return configs
+
+
+def test_resolve_gather_order():
+    configs = make_configs(Recorder(), [("user", ("ssh",)), ("apt", ()), ("ssh", ("hostname",)), ("snap", ())])
+    assert [name for name, _ in resolve_gather_order(configs)] == ["apt", "ssh", "user", "snap"]
+
+    # dependencies that are disabled, or taken from the cache, do not hold anything up
+    assert [name for name, _ in resolve_gather_order(configs[:2])] == ["user", "apt"]
+
+    with pytest.raises(ValueError, match="depend on each other"):
+        resolve_gather_order(make_configs(Recorder(), [("a", ("b",)), ("b", ("a",)), ("c", ())]))
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_dependencies_are_gathered_first(jobs):
+    recorder = Recorder()
+    configs = make_configs(recorder, [("user", ("ssh",)), ("ssh", ("apt",), 0.05), ("apt", (), 0.05), ("snap", ())])
+    available = {"hostname": fake_module("hostname")(recorder=recorder)}
+    result = gather_configs(configs, jobs=jobs, available=available)
+
+    # the result keeps the given order, whatever order the modules ran in
+    assert result == configs
+    started = recorder.started
+    assert started.index("apt") < started.index("ssh") < started.index("user")
+    config = dict(configs)
+    assert config["user"].dependencies == {"ssh": config["ssh"]}
+    assert config["ssh"].dependencies == {"apt": config["apt"]}
+
+
+def test_jobs_cap_concurrent_modules():
+    recorder = Recorder()
+    configs = make_configs(recorder, [(f"module{index}", (), 0.05) for index in range(6)])
+    gather_configs(configs, jobs=2)
+    assert recorder.max_running == 2
+    assert all(config.gathered for _, config in configs)
+
+    recorder = Recorder()
+    gather_configs(make_configs(recorder, [(f"module{index}", (), 0.02) for index in range(3)]), jobs=1)
+    assert recorder.max_running == 1
+
+
+def test_timed_out_modules_and_their_dependents_are_skipped(capsys):
+    recorder = Recorder()
+    configs = make_configs(recorder, [("apt", (), 5.0), ("user", ("apt",)), ("snap", (), 0.01)])
+    start = time.monotonic()
+    result = gather_configs(configs, jobs=2, timeout=0.2)
+
+    # the hanging module is abandoned on its daemon thread instead of being waited for
+    assert time.monotonic() - start < 2.0
+    assert [name for name, _ in result] == ["snap"]
+    assert "user" not in recorder.started
+    output = capsys.readouterr()
+    assert "Gathering apt config timed out after 0.2 seconds" in output.out + output.err
+    assert "Skipping user config, the apt config it depends on was not gathered" in output.out + output.err
+
+
+def test_timeout_counts_from_the_start_of_each_module():
+    recorder = Recorder()
+    # with one job, the third module only starts after 0.3 s, longer than the timeout, and still finishes
+    configs = make_configs(recorder, [("a", (), 0.15), ("b", (), 0.15), ("c", (), 0.15)])
+    assert gather_configs(configs, jobs=2, timeout=0.25) == configs
+
+
+def test_single_module_times_out_with_jobs():
+    configs = make_configs(Recorder(), [("apt", (), 5.0)])
+    assert gather_configs(configs, jobs=2, timeout=0.1) == []
+
+
+def test_gather_errors_propagate():
+    configs = make_configs(Recorder(), [("apt", ())], error=RuntimeError("dpkg is broken"))
+    for jobs in (1, 2):
+        with pytest.raises(RuntimeError, match="dpkg is broken"):
+            gather_configs(configs, jobs=jobs)
@@ -0,0 +1,98 @@
+import pytest
+
+from cc_builder.modules.snap import Snap, SnapConfig, get_installed_snaps
+from cc_builder.snapd import SnapdClient, SnapdError
+
+from .conftest import SnapdHost
+
+# the column-aligned output of `snap list` for the snaps in conftest.SNAPD_SNAPS
+SNAP_LIST = """\
+Name         Version         Rev    Tracking       Publisher   Notes
+code         1.90.2          161    latest/stable  vscode**    classic
+core22       20240408        1380   latest/stable  canonical** base
+hello-world  6.4             29     latest/stable  canonical** -
+lxd          5.21.1-2d13beb  28460  5.21/stable    canonical** -
+my-tool      0.3             x1     -              -           devmode
+"""
+
+
+def test_snaps_from_the_api(snapd_socket):
+    snaps = get_installed_snaps(SnapdHost(snapd_socket))
+
+    # core22 is left out like every core snap, my-tool is installed from a local file
+    assert snaps == [
+        Snap("code", "1.90.2", "161", "latest/stable", "vscode", "classic", confinement="classic"),
+        Snap("hello-world", "6.4", "29", "latest/stable", "canonical", None, confinement="strict"),
+        Snap("lxd", "5.21.1-2d13beb", "28460", "5.21/stable", "canonical", None, confinement="strict"),
+        Snap("my-tool", "0.3", "x1", None, None, "devmode", confinement="devmode"),
+    ]
+
+
+def test_channel_pinning(snapd_socket):
+    config = SnapConfig(pin_channels=True)
+    config.gather(SnapdHost(snapd_socket))
+
+    assert config.generate_cloud_config() == {
+        "snap": {
+            "commands": [
+                "snap install code --channel=latest/stable --classic",
+                "snap install hello-world --channel=latest/stable",
+                "snap install lxd --channel=5.21/stable",
+                "snap install my-tool",
+            ]
+        }
+    }
+    config.pin_channels = False
+    assert config.generate_cloud_config()["snap"]["commands"][:3] == [
+        "snap install code --classic",
+        "snap install hello-world",
+        "snap install lxd",
+    ]
+
+
+def test_fallback_to_snap_list_without_socket():
+    snaps = get_installed_snaps(SnapdHost(None, commands={"snap list": SNAP_LIST}))
+
+    # the notes column sits behind publisher names of varying width, it is read by position
+    assert [(snap.name, snap.tracking, snap.notes) for snap in snaps] == [
+        ("code", "latest/stable", "classic"),
+        ("hello-world", "latest/stable", None),
+        ("lxd", "5.21/stable", None),
+        ("my-tool", None, "devmode"),
+    ]
+    assert [snap.confinement for snap in snaps] == [None] * 4
+    assert snaps[0].is_classic
+
+
+def test_api_and_snap_list_agree(snapd_socket):
+    from_api = get_installed_snaps(SnapdHost(snapd_socket))
+    from_snap_list = get_installed_snaps(SnapdHost(None, commands={"snap list": SNAP_LIST}))
+
+    assert [(snap.name, snap.version, snap.rev, snap.tracking, snap.is_classic) for snap in from_api] == [
+        (snap.name, snap.version, snap.rev, snap.tracking, snap.is_classic) for snap in from_snap_list
+    ]
+
+
+def test_snapd_errors(snapd_socket):
+    client = SnapdClient(SnapdHost(snapd_socket))
+    with pytest.raises(SnapdError, match="status 404: not found"):
+        client.get("/v2/unknown")
+
+
+@pytest.mark.parametrize(
+    "failing_snapd_socket, message",
+    [
+        ({"message": "cannot list snaps"}, "status 500: cannot list snaps"),
+        ("snapd is shutting down", "status 500: snapd is shutting down"),
+        (None, "status 500: Internal Server Error"),
+    ],
+    indirect=["failing_snapd_socket"],
+)
+def test_error_results(failing_snapd_socket, message):
+    with pytest.raises(SnapdError, match=message):
+        SnapdClient(SnapdHost(failing_snapd_socket)).list_snaps()
+
+    # whatever the shape of the error, the snaps are listed with `snap list` instead
+    snaps = get_installed_snaps(SnapdHost(failing_snapd_socket, commands={"snap list": SNAP_LIST}))
+    assert [snap.name for snap in snaps] == ["code", "hello-world", "lxd", "my-tool"]
+    assert [snap.confinement for snap in snaps] == [None] * 4
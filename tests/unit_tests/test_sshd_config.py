@@ -0,0 +1,169 @@
+import pytest
+
+from cc_builder.host_accessor import CannedHostAccessor
+from cc_builder.modules.ssh import get_host_key_types, is_password_authentication_disabled, is_root_login_disabled
+from cc_builder.sshd_config import SSHD_CONFIG_PATH, read_sshd_config, tokenize_sshd_config_line
+
+# the start of Ubuntu 24.04's /etc/ssh/sshd_config
+UBUNTU_SSHD_CONFIG = """\
+# This is the sshd server system-wide configuration file.  See
+# sshd_config(5) for more information.
+
+Include /etc/ssh/sshd_config.d/*.conf
+
+#PermitRootLogin prohibit-password
+KbdInteractiveAuthentication no
+UsePAM yes
+"""
+
+
+def sshd_config(main=UBUNTU_SSHD_CONFIG, **files):
+    """
+    Read an sshd configuration made of `main` and the files of sshd_config.d given as name=content.
+    """
+    contents = {SSHD_CONFIG_PATH: main}
+    contents.update(
+        {f"/etc/ssh/sshd_config.d/{name.replace('_', '-')}.conf": content for name, content in files.items()}
+    )
+    return read_sshd_config(CannedHostAccessor(files=contents))
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "PasswordAuthentication no",
+        "passwordauthentication no",
+        "PASSWORDAUTHENTICATION=no",
+        "  PasswordAuthentication\tno",
+    ],
+)
+def test_keyword_case_and_separators(line):
+    config = sshd_config(line + "\n")
+    assert config.get("PasswordAuthentication") == "no"
+    assert config.get("passwordauthentication") == "no"
+    assert is_password_authentication_disabled(config) is True
+
+
+def test_tokenize():
+    assert tokenize_sshd_config_line('Banner "/etc/issue net"  # comment') == ["Banner", "/etc/issue net"]
+    assert tokenize_sshd_config_line("   # PasswordAuthentication no") == []
+    assert tokenize_sshd_config_line("") == []
+
+
+def test_defaults_apply_when_unset():
+    config = sshd_config()
+    assert config.get_entry("PasswordAuthentication") is None
+    assert config.get("PasswordAuthentication") == "yes"
+    assert config.get("PermitRootLogin") == "prohibit-password"
+    assert is_password_authentication_disabled(config) is False
+    assert is_root_login_disabled(config) is False
+    assert config.get("Banner") is None
+
+
+def test_unreadable_config_is_unknown():
+    assert is_password_authentication_disabled(None) is None
+    assert is_root_login_disabled(None) is None
+
+
+def test_includes_come_first_in_lexical_order():
+    # Ubuntu's sshd_config includes sshd_config.d before its own settings, so the included files win
+    config = sshd_config(
+        UBUNTU_SSHD_CONFIG + "PasswordAuthentication no\n",
+        **{"60_cloudimg_settings": "PasswordAuthentication yes\n", "50_cloud_init": "PasswordAuthentication maybe\n"},
+    )
+    entry = config.get_entry("PasswordAuthentication")
+    assert (entry.path, entry.line_number, entry.args) == (
+        "/etc/ssh/sshd_config.d/50-cloud-init.conf",
+        1,
+        ["maybe"],
+    )
+    assert [entry.path for entry in config.entries if entry.keyword == "passwordauthentication"] == [
+        "/etc/ssh/sshd_config.d/50-cloud-init.conf",
+        "/etc/ssh/sshd_config.d/60-cloudimg-settings.conf",
+        SSHD_CONFIG_PATH,
+    ]
+
+
+def test_relative_and_nested_includes():
+    accessor = CannedHostAccessor(
+        files={
+            SSHD_CONFIG_PATH: "Include extra.conf missing.conf\nPermitRootLogin yes\n",
+            "/etc/ssh/extra.conf": "Include /etc/ssh/nested/*.conf\n",
+            "/etc/ssh/nested/root.conf": "PermitRootLogin no\n",
+            "/etc/ssh/nested/notes.txt": "PermitRootLogin without-password\n",
+        }
+    )
+    config = read_sshd_config(accessor)
+    assert config.get_entry("PermitRootLogin").path == "/etc/ssh/nested/root.conf"
+    assert is_root_login_disabled(config) is True
+
+
+def test_include_loops_are_refused():
+    accessor = CannedHostAccessor(files={SSHD_CONFIG_PATH: "Include /etc/ssh/sshd_config\n"})
+    with pytest.raises(OSError, match="Too many nested Includes"):
+        read_sshd_config(accessor)
+
+
+def test_first_global_value_wins():
+    config = sshd_config("PasswordAuthentication no\nPasswordAuthentication yes\n")
+    assert config.get("PasswordAuthentication") == "no"
+    assert config.get_entry("PasswordAuthentication").line_number == 1
+
+
+def test_match_blocks():
+    config = sshd_config(
+        "PermitRootLogin no\n"
+        "PasswordAuthentication no\n"
+        "Match User root,!nobody Address 10.0.0.0/8\n"
+        "    PermitRootLogin yes\n"
+        "Match Group admins\n"
+        "    PasswordAuthentication yes\n"
+        "Match User ro*\n"
+        "    PermitRootLogin prohibit-password\n"
+        "Match User alice\n"
+        "    PermitRootLogin forced-commands-only\n"
+    )
+    # Match blocks only apply to the users they match, criteria about the connection are never taken as matching
+    assert config.get("PermitRootLogin") == "no"
+    assert config.get("PermitRootLogin", user="root", groups=["root"]) == "prohibit-password"
+    assert is_root_login_disabled(config) is False
+    assert config.get("PasswordAuthentication", user="bob", groups=["bob", "admins"]) == "yes"
+    assert config.get("PasswordAuthentication", user="bob", groups=["bob"]) == "no"
+    assert config.get("PermitRootLogin", user="alice") == "forced-commands-only"
+    # the settings for every connection only come from the global section
+    assert is_password_authentication_disabled(config) is True
+
+
+def test_match_blocks_end_with_the_next_match():
+    config = sshd_config(
+        "Match User alice\n"
+        "    PasswordAuthentication yes\n"
+        "Match all\n"
+        "    PasswordAuthentication no\n"
+        "    PermitRootLogin no\n"
+    )
+    assert config.get("PasswordAuthentication", user="alice") == "yes"
+    assert config.get("PasswordAuthentication", user="bob") == "no"
+    assert config.get("PermitRootLogin", user="root", groups=["root"]) == "no"
+    assert is_root_login_disabled(config) is True
+
+
+def test_match_blocks_in_included_files():
+    config = sshd_config(
+        UBUNTU_SSHD_CONFIG + "PasswordAuthentication no\n",
+        **{"50_users": "Match User alice\n    PasswordAuthentication yes\n"},
+    )
+    # the Match block of the included file does not swallow the lines after the Include
+    assert config.get("PasswordAuthentication") == "no"
+    assert config.get("PasswordAuthentication", user="alice") == "yes"
+
+
+def test_host_key_types():
+    config = sshd_config(
+        "HostKey /etc/ssh/ssh_host_ed25519_key\n"
+        "HostKey /etc/ssh/ssh_host_rsa_key\n"
+        "HostKey /etc/ssh/ssh_host_ed25519_key\n"
+    )
+    assert get_host_key_types(config) == ["ed25519", "rsa"]
+    assert get_host_key_types(sshd_config()) is None
+    assert get_host_key_types(sshd_config("HostKey /srv/keys/host_key\n")) is None
@@ -0,0 +1,59 @@
+import subprocess
+import sys
+
+import pytest
+
+# the fastest of a few runs, a little above what --version (~70 ms) and --help (~95 ms) take, see also
+# benchmarks/bench_startup.py
+IMPORT_BUDGETS_MS = {"--version": 100.0, "--help": 120.0}
+# modules the non-interactive paths must not import (see generator.get_console)
+INTERACTIVE_ONLY_MODULES = ("rich.console", "rich.syntax", "pygments", "yaml")
+# all of cc_builder that --help and --version may import, the commands import the rest when they run
+STARTUP_MODULES = {
+    "cc_builder",
+    "cc_builder.cli",
+    "cc_builder.console_output",
+    "cc_builder.defaults",
+    "cc_builder.logger",
+}
+
+
+def cli_imports(*args: str) -> dict:
+    """
+    Map every module imported by a fresh `cc_builder.cli` run to its own import time in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "cc_builder.cli"] + list(args),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    imports = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "self [us]" not in line:
+            self_us, _, name = line[len("import time:") :].split("|")
+            imports[name.strip()] = int(self_us)
+    return imports
+
+
+@pytest.mark.parametrize("option", sorted(IMPORT_BUDGETS_MS))
+def test_startup_import_budget(option):
+    total_ms = min(sum(cli_imports(option).values()) for _ in range(5)) / 1000
+    assert total_ms < IMPORT_BUDGETS_MS[option]
+
+
+@pytest.mark.parametrize("option", sorted(IMPORT_BUDGETS_MS))
+def test_startup_imports_no_commands(option):
+    imports = cli_imports(option)
+    assert {name for name in imports if name.startswith("cc_builder")} <= STARTUP_MODULES
+
+
+def test_version_skips_interactive_modules():
+    imports = cli_imports("--version")
+    assert "cc_builder.defaults" in imports
+    assert not [
+        name
+        for name in imports
+        if any(name == module or name.startswith(module + ".") for module in INTERACTIVE_ONLY_MODULES)
+    ]
@@ -0,0 +1,144 @@
+import pytest
+
+from cc_builder.host_accessor import USER_DATABASE_FILES, CannedHostAccessor
+from cc_builder.modules.user import UserConfig
+from cc_builder.user_database import (
+    UserDatabase,
+    UserSelection,
+    load_user_database,
+    parse_group,
+    parse_passwd,
+)
+
+PASSWD = """\
+root:x:0:0:root:/root:/bin/bash
+daemon:x:1:1:daemon:/usr/sbin:/usr/sbin/nologin
+ubuntu:x:1000:1000:Ubuntu:/home/ubuntu:/bin/bash
+alice:x:1001:1001:Alice,,,:/home/alice:/bin/zsh
+svc:x:1002:1002::/srv/svc:/bin/false
+bob:x:2000:1003::/home/bob:/bin/bash
+# a malformed line, and a duplicate entry that getpwnam never returns
+broken:x:abc:1004::/home/broken:/bin/bash
+ubuntu:x:3000:3000::/home/other:/bin/sh
+"""
+
+GROUP = """\
+root:x:0:
+sudo:x:27:ubuntu,alice
+adm:x:4:ubuntu
+lxd:x:110:alice
+ubuntu:x:1000:
+alice:x:1001:
+docker:x:1001:
+wheel:x:10:bob
+bob:x:1003:
+broken:x:abc:ubuntu
+sudo:x:28:bob
+"""
+
+
+def make_database() -> UserDatabase:
+    return UserDatabase(users=parse_passwd(PASSWD), groups=parse_group(GROUP))
+
+
+def test_parse_passwd():
+    users = parse_passwd(PASSWD)
+    assert list(users) == ["root", "daemon", "ubuntu", "alice", "svc", "bob"]
+    alice = users["alice"]
+    assert (alice.uid, alice.gid, alice.gecos, alice.home, alice.shell) == (
+        1001,
+        1001,
+        "Alice,,,",
+        "/home/alice",
+        "/bin/zsh",
+    )
+    # the first entry of a user wins
+    assert users["ubuntu"].uid == 1000
+    assert users["ubuntu"].can_log_in
+    assert not users["daemon"].can_log_in
+    assert not users["svc"].can_log_in
+
+
+def test_parse_group():
+    groups = parse_group(GROUP)
+    assert "broken" not in groups
+    assert groups["sudo"].gid == 27
+    assert groups["sudo"].members == ["ubuntu", "alice"]
+    assert groups["ubuntu"].members == []
+
+
+def test_groups():
+    database = make_database()
+    assert database.supplementary_groups("ubuntu") == ["sudo", "adm"]
+    # alice's primary group (gid 1001) is the first group with that gid, not docker
+    assert database.primary_group("alice").name == "alice"
+    assert database.supplementary_groups("alice") == ["sudo", "lxd"]
+    assert database.primary_group("nobody") is None
+
+
+def test_admin_groups():
+    database = make_database()
+    assert database.admin_groups("ubuntu") == ["sudo"]
+    assert database.admin_groups("alice") == ["sudo", "lxd"]
+    # the second sudo entry is never looked up
+    assert database.admin_groups("bob") == ["wheel"]
+    assert database.admin_groups("svc") == []
+    assert database.admin_groups("nobody") == []
+
+
+@pytest.mark.parametrize(
+    "spec, selected",
+    [
+        ("all", ["ubuntu", "alice", "bob"]),
+        ("uid>=1001", ["alice", "bob"]),
+        (" uid >= 2000 ", ["bob"]),
+        ("alice,ubuntu", ["alice", "ubuntu"]),
+        ("bob, bob,root", ["bob", "root"]),
+    ],
+)
+def test_user_selection(spec, selected):
+    assert UserSelection.parse(spec).select(make_database()) == selected
+
+
+def test_user_selection_skips_missing_users():
+    assert UserSelection.parse("alice,carol").select(make_database()) == ["alice"]
+
+
+@pytest.mark.parametrize("spec", ["", " , ", "uid>1000", "alice:bob", "alice bob"])
+def test_invalid_user_selection(spec):
+    with pytest.raises(ValueError, match="Invalid user selection"):
+        UserSelection.parse(spec)
+
+
+def accessor() -> CannedHostAccessor:
+    passwd_path, group_path = USER_DATABASE_FILES
+    return CannedHostAccessor(files={passwd_path: PASSWD, group_path: GROUP}, can_run_commands=False)
+
+
+def test_load_user_database():
+    database = load_user_database(accessor())
+    assert database.get_user("bob").home == "/home/bob"
+    assert database.get_group("lxd").members == ["alice"]
+
+
+def test_user_config_groups():
+    config = UserConfig(name="ubuntu", selected_users=["ubuntu", "alice", "bob"])
+    config.gather(accessor())
+    users = config.generate_cloud_config()["users"]
+    assert [user["name"] for user in users] == ["ubuntu", "alice", "bob"]
+    assert users[0]["groups"] == ["sudo", "adm"]
+    assert users[0]["sudo"] == "ALL=(ALL) NOPASSWD:ALL"
+    assert users[1]["groups"] == ["sudo", "lxd"]
+    assert users[1]["shell"] == "/bin/zsh"
+    assert users[2]["groups"] == ["wheel"]
+    # only sudo, admin and wheel grant sudo rights, bob's wheel membership does
+    assert users[2]["sudo"] == "ALL=(ALL) NOPASSWD:ALL"
+
+
+def test_user_config_without_groups():
+    config = UserConfig(name="svc")
+    config.gather(accessor())
+    (user,) = config.generate_cloud_config()["users"]
+    assert "groups" not in user
+    assert user["sudo"] is None
+    assert user["shell"] == "/bin/false"